@@ -6,15 +6,27 @@ import flask
 import google.oauth2.credentials
 import google_auth_oauthlib.flow
 import requests
-from flask import Blueprint, g, jsonify, redirect, render_template, session, url_for
+from flask import (
+    Blueprint,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    url_for,
+)
 
 from integrations.email.fetcher import email_fetcher
-from tasks.processor import start_processing, tasks_storage
+from tasks import worker
+from tasks.events import task_feed
+from tasks.processor import tasks_storage
 
 CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
 GOOGLE_LOGIN_URI = os.getenv("GOOGLE_LOGIN_URI")
+# Longest a /tasks?since= request waits for a task change
+TASKS_LONG_POLL_SECONDS = float(os.getenv("TASKS_LONG_POLL_SECONDS", 25))
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
     "openid",
@@ -24,6 +36,17 @@ SCOPES = [
 
 main = Blueprint("main", __name__)
 
+# Started once per process, not per request
+email_fetcher_thread = None
+email_fetcher_lock = threading.Lock()
+
+
+@main.before_app_request
+def start_processing():
+    # Runs in the process serving requests, so the debug reloader's watcher
+    # process doesn't start a second set of workers
+    worker.start()
+
 
 @main.route("/")
 def index():
@@ -32,25 +55,24 @@ def index():
 
 @main.route("/dashboard", methods=["GET", "POST"])
 def dashboard():
-    tasks = tasks_storage.get_tasks(condition="actionStatus = 'Active'")
+    tasks = tasks_storage.find_tasks(actionStatus="Active")
     agent_tasks = [task for task in tasks.values() if task["agent"] == "AI"]
     human_tasks = [task for task in tasks.values() if task["agent"] != "AI"]
 
     if "credentials" not in session:
         return redirect(url_for("main.index"))
 
-    # Start the background processes for email fetching and task processing
-    if not hasattr(g, "email_fetcher_thread"):
-        start_processing()
-        email_fetcher_thread = threading.Thread(
-            target=email_fetcher,
-            args=(session["credentials"],),
-            daemon=True,
-            name="email_fetcher",
-        )
-
-        email_fetcher_thread.start()
-        g.email_fetcher_thread = email_fetcher_thread
+    # Start fetching email with the first signed-in user's credentials
+    global email_fetcher_thread
+    with email_fetcher_lock:
+        if email_fetcher_thread is None:
+            email_fetcher_thread = threading.Thread(
+                target=email_fetcher,
+                args=(session["credentials"],),
+                daemon=True,
+                name="email_fetcher",
+            )
+            email_fetcher_thread.start()
 
     return render_template(
         "dashboard.html", agent_tasks=agent_tasks, human_tasks=human_tasks
@@ -59,10 +81,16 @@ def dashboard():
 
 @main.route("/tasks")
 def get_tasks():
-    tasks = tasks_storage.get_tasks(condition="actionStatus = 'Active'")
+    # With ?since=<version>, waits until a task has changed after that version
+    since = request.args.get("since", type=int)
+    if since is not None:
+        version = task_feed.wait(since, TASKS_LONG_POLL_SECONDS)
+    else:
+        version = task_feed.version
+    tasks = tasks_storage.find_tasks(actionStatus="Active")
     agent_tasks = [task for task in tasks.values() if task["agent"] == "AI"]
     human_tasks = [task for task in tasks.values() if task["agent"] != "AI"]
-    return jsonify(agent_tasks=agent_tasks, human_tasks=human_tasks)
+    return jsonify(agent_tasks=agent_tasks, human_tasks=human_tasks, version=version)
 
 
 @main.route("/authorize", methods=["GET", "POST"])
@@ -1,17 +1,27 @@
 document.addEventListener("DOMContentLoaded", function () {
+  // Version of the task list last shown; the server holds each request
+  // until the tasks have changed since then
+  let version = null;
+
   function fetchTasks() {
     console.log("Fetching tasks...");
-    fetch("/tasks")
+    const url = version === null ? "/tasks" : `/tasks?since=${version}`;
+    fetch(url)
       .then((response) => {
         console.log("Response received:", response);
         return response.json();
       })
       .then((data) => {
         console.log("Data received:", data);
+        version = data.version;
         updateTasks(data.agent_tasks, "agent-tasks");
         updateTasks(data.human_tasks, "human-tasks");
+        fetchTasks();
       })
-      .catch((error) => console.error("Error fetching tasks:", error));
+      .catch((error) => {
+        console.error("Error fetching tasks:", error);
+        setTimeout(fetchTasks, 5000);
+      });
   }
 
   function updateTasks(tasks, elementId) {
@@ -36,7 +46,5 @@ document.addEventListener("DOMContentLoaded", function () {
     });
   }
 
-  // Fetch tasks every 10 seconds
-  setInterval(fetchTasks, 5000);
   fetchTasks();
 });
@@ -1,12 +1,13 @@
 import logging
 import time
-from queue import Queue
+
+from utils.work_queue import WorkQueue
 
 from .gmail import fetch_latest_email, gmail_service
 
 logger = logging.getLogger(__name__)
 
-email_queue = Queue()
+email_queue = WorkQueue()
 processed_email_ids = set()
 
 
@@ -37,6 +37,7 @@ def fetch_latest_email(service):
         "Body": "",
         "Timestamp": "",
         "Message-ID": msg["id"],
+        "Thread-ID": msg.get("threadId", ""),
     }
 
     # Parse headers for email details
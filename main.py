@@ -1,6 +1,11 @@
 import os
 
-from app import create_app
+from dotenv import load_dotenv
+
+# Load .env before importing the app, since modules read settings at import time
+load_dotenv()
+
+from app import create_app  # noqa: E402
 
 # Allow testing on localhost
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
@@ -1,33 +1,60 @@
+import asyncio
 import json
 import logging
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
 from ollama import Message
 from typeid import TypeID
 
-from utils.ollama import ollama_chat, ollama_generate
+from utils.json_stream import strip_code_fence, tolerant_loads
+from utils.ollama import (
+    JsonItemSink,
+    get_ollama_embeddings,
+    ollama_chat,
+    ollama_chat_async,
+    ollama_generate,
+    ollama_generate_async,
+    register_agent,
+)
 
-from .storage import SingleTaskListStorage
+from .entity_index import entity_index
+from .storage import get_storage
 
 logger = logging.getLogger(__name__)
 
-storage = SingleTaskListStorage()
 
+NO_TASKS_FOUND = "No tasks found."
+NO_MATCHES = "No Matches"
 
-def objective_agent(to, from_email, subject, timestamp, body, attachments):
-    prompt = f"""
-You are an AI assistant that processes emails. You have received an email with the following details:
+# Classification answers end the stream as soon as they appear, and their
+# length is capped. Override the caps with LLM_NUM_PREDICT.
+register_agent("objective", sentinels=[NO_TASKS_FOUND], num_predict=256)
+register_agent("entity_dedup", sentinels=[NO_MATCHES], num_predict=512)
+# Structured answers use Ollama's JSON mode and are parsed as they stream
+register_agent("task_creation", format="json")
+register_agent("entity_extraction", format="json")
+
+# The instructions for each agent are sent as the system prompt, ahead of the
+# per-request details, so Ollama can reuse their evaluation across requests
+OBJECTIVE_SYSTEM = """You are an AI assistant that processes emails. You will receive an email with its details.
+Your task is to determine if the email contains any actionable tasks for the recipient. An actionable task should be a specific request or instruction that requires the recipient to take some action. If there are actionable tasks, list each one as a separate item. If there are no actionable tasks, respond with "No tasks found."
+RETURN ONLY THIS STRING AND DO NOT INCLUDE ANY OTHER OUTPUT."""
+
+
+def objective_prompt(to, from_email, subject, timestamp, body, attachments):
+    return f"""You have received an email with the following details:
 To: {to}
 From: {from_email}
 Subject: {subject}
 Timestamp: {timestamp}
 Body: {body}
 Attachments: {attachments}
-Your task is to determine if the email contains any actionable tasks for the recipient. An actionable task should be a specific request or instruction that requires the recipient to take some action. If there are actionable tasks, list each one as a separate item. If there are no actionable tasks, respond with "No tasks found."
-RETURN ONLY THIS STRING AND DO NOT INCLUDE ANY OTHER OUTPUT.
 """
-    response_text = ollama_generate(model="llama3", prompt=prompt, stream=True)
-    if response_text == "No tasks found." or not response_text:
+
+
+def parse_objective(response_text):
+    if response_text == NO_TASKS_FOUND or not response_text:
         return {"tasks_found": False, "tasks": []}
     else:
         tasks = response_text.split("\n")
@@ -38,28 +65,103 @@ RETURN ONLY THIS STRING AND DO NOT INCLUDE ANY OTHER OUTPUT.
         }
 
 
-def task_creation_agent(task_name, previous_results):
-    prompt = f"""You are a task creation AI tasked with creating a list of tasks as a JSON array, considering the ultimate objective of your team: {task_name}.
-The result of the previous task(s) are as follows: {previous_results}
+def objective_agent(to, from_email, subject, timestamp, body, attachments):
+    prompt = objective_prompt(to, from_email, subject, timestamp, body, attachments)
+    response_text = ollama_generate(
+        model="llama3",
+        prompt=prompt,
+        system=OBJECTIVE_SYSTEM,
+        stream=True,
+        agent="objective",
+    )
+    return parse_objective(response_text)
+
+
+async def objective_agent_async(to, from_email, subject, timestamp, body, attachments):
+    prompt = objective_prompt(to, from_email, subject, timestamp, body, attachments)
+    response_text = await ollama_generate_async(
+        model="llama3",
+        prompt=prompt,
+        system=OBJECTIVE_SYSTEM,
+        stream=True,
+        agent="objective",
+    )
+    return parse_objective(response_text)
+
+
+TASK_CREATION_SYSTEM = """You are a task creation AI tasked with creating a list of tasks as a JSON array, considering the ultimate objective of your team, which you will be given along with the result of the previous task(s).
 If the sub-tasks are dependent, dependencies should be lower on the list (i.e., execution should be bottom-up).
 Be sure to specify if the sub-task can be completed by an AI assistant or requires human intervention by specifying agent = 'AI' or 'Human'.
-Return the sub-tasks as a structured list of dictionaries with the following format:
-[{{"task": str, "agent": str}}, {{"task": str, "agent": str}}, ...]
-SHARE ONLY THIS LIST - DO NOT INCLUDE ANYTHING ELSE IN THE RESPONSE.
+Return the sub-tasks as a JSON object with the following format:
+{"tasks": [{"task": str, "agent": str}, {"task": str, "agent": str}, ...]}
+SHARE ONLY THIS OBJECT - DO NOT INCLUDE ANYTHING ELSE IN THE RESPONSE."""
+
+
+def task_creation_prompt(task_name, previous_results):
+    return f"""The ultimate objective of your team: {task_name}.
+The result of the previous task(s) are as follows: {previous_results}
 """
-    response_text = ollama_generate(model="llama3", prompt=prompt, stream=True)
+
+
+def parse_task_creation(response_text, items):
+    # `items` are the elements of the first array in the response. Malformed
+    # ones are dropped, keeping the rest of the list.
     logger.debug(f"Task creation agent response: {response_text}")
-    try:
-        new_tasks_list = eval(response_text.strip())
-    except (SyntaxError, ValueError):
+    new_tasks_list = [
+        item for item in items if isinstance(item, dict) and item.get("task")
+    ]
+    if len(new_tasks_list) < len(items) or (not items and "[" not in response_text):
         logger.error(f"Failed to parse task creation agent response: {response_text}")
-        new_tasks_list = None
-
     return new_tasks_list
 
 
-def entity_extraction_agent(text_input):
-    prompt = [
+def json_list(response_text, key):
+    # The `key` list of a complete JSON object answer, or None
+    data = json.loads(strip_code_fence(response_text))
+    items = data.get(key) if isinstance(data, dict) else None
+    return items if isinstance(items, list) else None
+
+
+def complete_task_list(response_text):
+    tasks = json_list(response_text, "tasks")
+    return tasks is not None and all(
+        isinstance(task, dict) and task.get("task") for task in tasks
+    )
+
+
+def task_creation_agent(task_name, previous_results, on_task=None):
+    # on_task is called with each subtask as soon as it has been generated
+    prompt = task_creation_prompt(task_name, previous_results)
+    sink = JsonItemSink(on_item=on_task)
+    response_text = ollama_generate(
+        model="llama3",
+        prompt=prompt,
+        system=TASK_CREATION_SYSTEM,
+        stream=True,
+        agent="task_creation",
+        sink=sink,
+        validate=complete_task_list,
+    )
+    return parse_task_creation(response_text, sink.items())
+
+
+async def task_creation_agent_async(task_name, previous_results, on_task=None):
+    prompt = task_creation_prompt(task_name, previous_results)
+    sink = JsonItemSink(on_item=on_task)
+    response_text = await ollama_generate_async(
+        model="llama3",
+        prompt=prompt,
+        system=TASK_CREATION_SYSTEM,
+        stream=True,
+        agent="task_creation",
+        sink=sink,
+        validate=complete_task_list,
+    )
+    return parse_task_creation(response_text, sink.items())
+
+
+def entity_extraction_messages(text_input) -> List[Message]:
+    return [
         Message(
             role="system",
             content="""You are an AI expert specializing in entity identification and list creation, with the goal of capturing relationships based on a given input or request.
@@ -85,91 +187,201 @@ Return the entities list as a valid JSON object. NEVER INCLUDE COMMENTS THEY ARE
             "name": "Modernization of the IT infrastructure",
             "type": "Project",
             "description": "A project to modernize the IT infrastructure of the company.",
-            "department": "IT",
+            "department": "IT"
         },
         {
             "name": "John Smith",
             "type": "Person",
-            "description": "Employee in the IT department."
-            "memberOf": "IT",
+            "description": "Employee in the IT department.",
+            "memberOf": "IT"
         },
         {
             "name": "IT",
             "type": "Organization",
             "description": "The IT department of the company.",
-            "member": "John Smith",
-        },
+            "member": "John Smith"
+        }
     ]
 }
 """,
         ),
         Message(role="user", content=text_input),
     ]
-    response_text = ollama_chat(model="llama3", messages=prompt, stream=True)
-    return response_text
 
 
-def conditional_entity_addition(data):
-    entities = data.get("entities", [])
-    updated_entities = []
+def complete_entity_list(response_text):
+    entities = json_list(response_text, "entities")
+    return entities is not None and all(
+        isinstance(entity, dict) and entity.get("type") and entity.get("name")
+        for entity in entities
+    )
 
-    for entity in entities:
-        entity_type = entity.get("type")
-        entity_name = entity.get("name")
 
-        if not entity_type or not entity_name:
+def entity_extraction_agent(text_input, on_entity=None):
+    # Returns the extracted entities; on_entity is called with each one as
+    # soon as it has been generated
+    sink = JsonItemSink(on_item=on_entity)
+    response_text = ollama_chat(
+        model="llama3",
+        messages=entity_extraction_messages(text_input),
+        stream=True,
+        agent="entity_extraction",
+        sink=sink,
+        validate=complete_entity_list,
+    )
+    logger.debug(f"Entity extraction response: {response_text}")
+    return sink.items()
+
+
+async def entity_extraction_agent_async(text_input, on_entity=None):
+    sink = JsonItemSink(on_item=on_entity)
+    response_text = await ollama_chat_async(
+        model="llama3",
+        messages=entity_extraction_messages(text_input),
+        stream=True,
+        agent="entity_extraction",
+        sink=sink,
+        validate=complete_entity_list,
+    )
+    logger.debug(f"Entity extraction response: {response_text}")
+    return sink.items()
+
+
+def entity_dedup_messages(combined_results_str, data) -> List[Message]:
+    return [
+        Message(
+            role="system",
+            content="You are a helpful assistant who's specialty is to decide if new input data matches data already in our database. Review the search results provided, compare against the input data, and if there's a match respond with the ID number of the match, and only the ID number. If there are no matches, respond with 'No Matches'. Your response is ALWAYS an ID number alone, or 'No Matches'. When reviewing whether a match existings in our search results to our new input, take into account that the name may not match perfectly (for example, one might have just a first name, or a nick name, while the other has a full name), in which case look at the additional information about the user to determine if there's a strong likelihood they are the same person. For companies, you should consider different names of the same company as the same, such as EA and Electronic Arts (make your best guess). If the likelihood is strong, respond with and only with the ID number. If likelihood is low, respond with 'No Matches'.",
+        ),
+        Message(
+            role="user",
+            content=f"Here are the search results: {combined_results_str}. Does any entry match the input data: {data}?",
+        ),
+    ]
+
+
+ENTITY_RESOLUTION_SYSTEM = """You are a helpful assistant who's specialty is to decide if new input entities match entities already in our database.
+You will be given a numbered list of new entities, each with the existing entities that might be the same one. For each new entity, decide whether one of its candidates is a match.
+Take into account that the name may not match perfectly (for example, one might have just a first name, or a nick name, while the other has a full name), in which case look at the additional information to determine if there's a strong likelihood they are the same person. For companies, you should consider different names of the same company as the same, such as EA and Electronic Arts (make your best guess).
+Respond with a JSON object mapping the number of every new entity to the uuid of its match if the likelihood is strong, or to "new" if it is low. For example: {"1": "person_01h455vb4pex5vsknk084sn02q", "2": "new"}
+DO NOT INCLUDE ANYTHING ELSE IN THE RESPONSE."""
+
+CANDIDATE_FIELDS = ["uuid", "name", "description"]
+# Most existing entities offered to the model for each new one
+MAX_CANDIDATES = 10
+
+# Runs the entity lookups EntityPrefetch starts during extraction
+prefetch_executor = ThreadPoolExecutor(thread_name_prefix="EntityPrefetch")
+
+
+def has_type_and_name(entity):
+    return all(
+        isinstance(entity.get(field), str) and entity[field]
+        for field in ("type", "name")
+    )
+
+
+def valid_entities(data):
+    entities = []
+    for entity in data.get("entities", []):
+        if not isinstance(entity, dict):
+            logger.warning(f"Entity is not an object: {entity}")
+            continue
+        if not has_type_and_name(entity):
             logger.warning(f"Entity is missing type or name: {entity}")
             continue
+        entities.append(entity)
+    return entities
 
-        # Look up existing entities by name
-        condition_str = f"str_includes('name', '{entity_name}')"
-        search_results = storage.lookup(
-            entity_type,
-            ["uuid", "name", "description"],
-            condition=condition_str,
-        )
+
+def candidate_rows(search_results) -> List[Dict]:
+    try:
         search_results = json.loads(search_results)
+    except (TypeError, json.JSONDecodeError):
+        search_results = {}
+    # A relation that doesn't exist yet comes back as an error with no rows
+    return [dict(zip(CANDIDATE_FIELDS, row)) for row in search_results.get("rows", [])]
+
+
+def format_candidates(rows: List[Dict]) -> str:
+    combined_results = {row["uuid"]: row for row in rows}
+    return ", ".join(json.dumps(result) for result in combined_results.values())
+
+
+def entity_resolution_messages(entities, candidates) -> List[Message]:
+    lines = []
+    for index, rows in candidates.items():
+        entity = entities[index]
+        lines.append(
+            f"{index + 1}. {json.dumps(entity)}\n"
+            f"   Candidates: {format_candidates(rows)}"
+        )
+    return [
+        Message(role="system", content=ENTITY_RESOLUTION_SYSTEM),
+        Message(role="user", content="\n".join(lines)),
+    ]
 
-        # Check if the entity exists
-        if search_results["rows"]:
-            combined_results = {
-                result[0]: {
-                    "uuid": result[0],
-                    "name": result[1],
-                    "description": result[2],
-                }
-                for result in search_results["rows"]
-            }
-            combined_results_str = ", ".join(
-                json.dumps(result) for result in combined_results.values()
-            )
 
-            prompt: List[Message] = [
-                Message(
-                    role="system",
-                    content="You are a helpful assistant who's specialty is to decide if new input data matches data already in our database. Review the search results provided, compare against the input data, and if there's a match respond with the ID number of the match, and only the ID number. If there are no matches, respond with 'No Matches'. Your response is ALWAYS an ID number alone, or 'No Matches'. When reviewing whether a match existings in our search results to our new input, take into account that the name may not match perfectly (for example, one might have just a first name, or a nick name, while the other has a full name), in which case look at the additional information about the user to determine if there's a strong likelihood they are the same person. For companies, you should consider different names of the same company as the same, such as EA and Electronic Arts (make your best guess). If the likelihood is strong, respond with and only with the ID number. If likelihood is low, respond with 'No Matches'.",
-                ),
-                Message(
-                    role="user",
-                    content=f"Here are the search results: {combined_results_str}. Does any entry match the input data: {data}?",
-                ),
-            ]
-
-            response_text = ollama_chat(model="llama3", messages=prompt, stream=True)
-            if response_text.lower() == "no matches":
-                entity_id = str(TypeID(prefix=entity_type.lower()))
-                logger.info(f"Creating new entity: {entity_name}, ID: {entity_id}")
-            else:
-                entity_id = response_text.strip()
-                logger.info(f"Found existing entity: {entity_name}, ID: {entity_id}")
+def parse_entity_resolution(response_text, candidates) -> Dict[int, str | None] | None:
+    """
+    Maps each entity index in `candidates` to the uuid of its match, or None
+    for a new entity. Returns None if the response isn't a JSON object.
+    Entities the response leaves out are omitted from the result.
+    """
+    start = response_text.find("{")
+    if start == -1:
+        return None
+    try:
+        mapping = tolerant_loads(response_text[start:])
+    except ValueError:
+        return None
+    if not isinstance(mapping, dict):
+        return None
 
+    resolved = {}
+    for index, rows in candidates.items():
+        match = mapping.get(str(index + 1))
+        if not isinstance(match, str):
+            # No usable answer; the entity is asked about on its own
+            continue
+        if match in {row["uuid"] for row in rows}:
+            resolved[index] = match
         else:
-            entity_id = str(TypeID(prefix=entity_type.lower()))
-            logger.info(f"Creating new entity: {entity_name}, ID: {entity_id}")
+            if match.lower() != "new":
+                logger.warning(f"Ignoring unknown entity id from resolver: {match}")
+            resolved[index] = None
+    return resolved
+
+
+def new_entity_id(entity_type, entity_name):
+    entity_id = str(TypeID(prefix=entity_type.lower()))
+    logger.info(f"Creating new entity: {entity_name}, ID: {entity_id}")
+    return entity_id
+
+
+def matched_entity_id(response_text, rows):
+    # Answer to entity_dedup_messages: one of the candidates' ids, or 'No
+    # Matches'. Anything else is taken as no match.
+    answer = response_text.strip().strip("\"'`.")
+    if answer in {row["uuid"] for row in rows}:
+        return answer
+    if answer.lower() != NO_MATCHES.lower():
+        logger.warning(f"Ignoring unknown entity id from resolver: {answer}")
+    return None
+
 
+def assign_entity_ids(entities, resolved):
+    for index, entity in enumerate(entities):
+        entity_id = resolved.get(index)
+        if entity_id is None:
+            entity_id = new_entity_id(entity["type"], entity["name"])
+        else:
+            logger.info(f"Found existing entity: {entity['name']}, ID: {entity_id}")
         entity["uuid"] = entity_id
-        updated_entities.append(entity)
+    return entities
+
 
+def link_entities(updated_entities):
     # Replace references in entities with the appropriate UUIDs
     uuid_map = {entity["name"]: entity["uuid"] for entity in updated_entities}
 
@@ -179,3 +391,150 @@ def conditional_entity_addition(data):
                 entity[key] = uuid_map[value]
 
     return {"entities": updated_entities}, 200
+
+
+def stale_lookups(entities) -> List[tuple]:
+    # (type, term) pairs for the entities not looked up within ENTITY_INDEX_TTL
+    lookups = set()
+    for entity in entities:
+        for term in entity_index.lookup_terms(entity["type"], entity["name"]):
+            if entity_index.stale(entity["type"], term):
+                lookups.add((entity["type"], term))
+    return list(lookups)
+
+
+def lookup_condition(term):
+    escaped = term.replace("'", "\\'")
+    return f"str_includes('name', '{escaped}')"
+
+
+def refresh_entities(storage, entities):
+    # Existing entities are looked up by the new names, and the ones found are
+    # matched locally. Conditions can't OR several str_includes clauses, so
+    # each lookup term is its own lookup.
+    for entity_type, term in stale_lookups(entities):
+        rows = candidate_rows(
+            storage.lookup(
+                entity_type, CANDIDATE_FIELDS, condition=lookup_condition(term)
+            )
+        )
+        entity_index.add(entity_type, term, rows)
+
+
+async def refresh_entities_async(storage, entities):
+    # storage is an AsyncTaskListStorage
+    lookups = stale_lookups(entities)
+    results = await asyncio.gather(
+        *(
+            storage.lookup(
+                entity_type, CANDIDATE_FIELDS, condition=lookup_condition(term)
+            )
+            for entity_type, term in lookups
+        )
+    )
+    for (entity_type, term), result in zip(lookups, results):
+        entity_index.add(entity_type, term, candidate_rows(result))
+
+
+class EntityPrefetch:
+    """
+    on_entity callback for entity_extraction_agent. Starts looking up the
+    existing entities each entity could match in the background as soon as
+    it has been generated, instead of after the whole response; `wait`
+    finishes the lookups.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or get_storage()
+        self.lookups = []
+
+    def __call__(self, entity):
+        if isinstance(entity, dict) and has_type_and_name(entity):
+            if stale_lookups([entity]):
+                self.lookups.append(self.start(entity))
+
+    def start(self, entity):
+        return prefetch_executor.submit(refresh_entities, self.storage, [entity])
+
+    def wait(self):
+        for lookup in self.lookups:
+            lookup.result()
+
+
+class AsyncEntityPrefetch(EntityPrefetch):
+    # For entity_extraction_agent_async, with an AsyncTaskListStorage
+
+    def start(self, entity):
+        return asyncio.create_task(refresh_entities_async(self.storage, [entity]))
+
+    async def wait(self):
+        await asyncio.gather(*self.lookups)
+
+
+def conditional_entity_addition(data):
+    storage = get_storage()
+    entities = valid_entities(data)
+
+    refresh_entities(storage, entities)
+    resolved, candidates = entity_index.prefilter(
+        entities, MAX_CANDIDATES, embed=get_ollama_embeddings
+    )
+
+    if candidates:
+        response_text = ollama_chat(
+            model="llama3",
+            messages=entity_resolution_messages(entities, candidates),
+            stream=True,
+            agent="entity_dedup",
+            format="json",
+            validate=lambda text: parse_entity_resolution(text, candidates) is not None,
+        )
+        batch = parse_entity_resolution(response_text, candidates)
+        if batch is None:
+            logger.warning("Could not parse entity resolution, resolving one by one")
+            batch = {}
+        resolved.update(batch)
+
+        # Ask about each entity the batch didn't answer for on its own
+        for index in candidates.keys() - batch.keys():
+            prompt = entity_dedup_messages(format_candidates(candidates[index]), data)
+            response_text = ollama_chat(
+                model="llama3", messages=prompt, stream=True, agent="entity_dedup"
+            )
+            resolved[index] = matched_entity_id(response_text, candidates[index])
+
+    return link_entities(assign_entity_ids(entities, resolved))
+
+
+async def conditional_entity_addition_async(data, storage):
+    # storage is an AsyncTaskListStorage
+    entities = valid_entities(data)
+
+    await refresh_entities_async(storage, entities)
+    resolved, candidates = await asyncio.to_thread(
+        entity_index.prefilter, entities, MAX_CANDIDATES, get_ollama_embeddings
+    )
+
+    if candidates:
+        response_text = await ollama_chat_async(
+            model="llama3",
+            messages=entity_resolution_messages(entities, candidates),
+            stream=True,
+            agent="entity_dedup",
+            format="json",
+            validate=lambda text: parse_entity_resolution(text, candidates) is not None,
+        )
+        batch = parse_entity_resolution(response_text, candidates)
+        if batch is None:
+            logger.warning("Could not parse entity resolution, resolving one by one")
+            batch = {}
+        resolved.update(batch)
+
+        for index in candidates.keys() - batch.keys():
+            prompt = entity_dedup_messages(format_candidates(candidates[index]), data)
+            response_text = await ollama_chat_async(
+                model="llama3", messages=prompt, stream=True, agent="entity_dedup"
+            )
+            resolved[index] = matched_entity_id(response_text, candidates[index])
+
+    return link_entities(assign_entity_ids(entities, resolved))
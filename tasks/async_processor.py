@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import threading
+
+from integrations.email.fetcher import email_queue
+from tasks.agents import (
+    AsyncEntityPrefetch,
+    conditional_entity_addition_async,
+    entity_extraction_agent_async,
+    objective_agent_async,
+    task_creation_agent_async,
+)
+from tasks.async_storage import AsyncTaskListStorage
+from tasks.email_flow import CLASSIFY, DONE, EmailFlow
+from tasks.entity_pool import EntityExtractionPool
+from tasks.execution import MORE_CONTEXT_NEEDED, execution_agent_async
+from tasks.processor import tasks_storage
+from utils.llm_scheduler import current_email
+from utils.ollama import warm_model
+
+logger = logging.getLogger(__name__)
+
+# Most emails processed at once by the asyncio engine. Each one is a coroutine,
+# so this can be far higher than MAX_THREADS; Ollama and NexusDB calls are
+# capped separately by OLLAMA_CONCURRENCY and NEXUSDB_CONCURRENCY.
+ASYNC_MAX_EMAILS = int(os.getenv("ASYNC_MAX_EMAILS", 1000))
+
+storage = AsyncTaskListStorage(tasks_storage)
+
+
+async def process_entity_extraction_and_addition(email_data):
+    current_email.set(email_data["Message-ID"])
+    try:
+        body = email_data["Body"]
+        logger.debug("Calling entity_extraction_agent...")
+        prefetch = AsyncEntityPrefetch(storage)
+        entities = await entity_extraction_agent_async(body, on_entity=prefetch)
+        await prefetch.wait()
+
+        if entities:
+            addition_response = await conditional_entity_addition_async(
+                {"entities": entities}, storage
+            )
+            logger.info(f"Entity addition response: {addition_response}")
+
+        else:
+            logger.info("No entities extracted.")
+    except Exception as e:
+        logger.error(
+            f"Error processing entity extraction and addition: {e}", exc_info=True
+        )
+
+
+entity_loop = None
+
+
+def extract_on_loop(email_data):
+    # Pool workers are threads; run the extraction on the engine's loop
+    asyncio.run_coroutine_threadsafe(
+        process_entity_extraction_and_addition(email_data), entity_loop
+    ).result()
+
+
+entity_pool = EntityExtractionPool(extract_on_loop)
+
+
+def entity_extraction_processor(email_data):
+    global entity_loop
+    entity_loop = asyncio.get_running_loop()
+    entity_pool.submit(email_data)
+
+
+async def process_email(email_data):
+    try:
+        flow = EmailFlow(email_data)
+        current_email.set(flow.email_id)
+        step = flow.start(await storage.get_tasks(object=flow.email_id))
+        if step == DONE:
+            return
+
+        if step == CLASSIFY:
+            entity_extraction_processor(email_data)
+
+            logger.debug("Calling objective_agent...")
+            objective_response = await objective_agent_async(*flow.objective_args())
+            primary_task = flow.primary_task(objective_response, storage.next_task_id())
+            if primary_task is None:
+                return
+            await storage.append(primary_task)
+            logger.debug(f"Primary task created: {primary_task}")
+
+        while task := flow.next_task():
+            previous_results, context = await asyncio.gather(
+                storage.get_previous_results(flow.email_id),
+                storage.get_context(task["name"], 5),
+            )
+            result = await execution_agent_async(
+                task["name"], previous_results, context
+            )
+
+            if result == MORE_CONTEXT_NEEDED:
+                new_tasks = await task_creation_agent_async(
+                    task["name"], previous_results
+                )
+                flow.added_subtasks(
+                    new_tasks,
+                    *await storage.add_subtasks(
+                        task["uuid"], task["name"], new_tasks, flow.max_identifier
+                    ),
+                )
+            else:
+                flow.completed(task)
+                await storage.update_task_status(
+                    task["uuid"], task["name"], "Complete", result
+                )
+
+    except Exception as e:
+        logger.error(f"Error processing email: {e}", exc_info=True)
+    finally:
+        email_queue.task_done(email_data)
+
+
+async def email_processor():
+    slots = asyncio.Semaphore(ASYNC_MAX_EMAILS)
+    in_flight = {}
+    await asyncio.to_thread(warm_model, "llama3")
+
+    def finished(email_id):
+        in_flight.pop(email_id, None)
+        slots.release()
+
+    while True:
+        await slots.acquire()
+        # email_queue blocks until the fetcher, maybe in another process, adds mail
+        email_data = await asyncio.to_thread(email_queue.get)
+        email_id = email_data["Message-ID"]
+        if email_id in in_flight:
+            # Redelivered while still in flight; the running copy acknowledges it
+            logger.debug(f"Email {email_id} is already being processed")
+            slots.release()
+            continue
+
+        task = asyncio.create_task(process_email(email_data), name=email_id)
+        in_flight[email_id] = task
+        task.add_done_callback(lambda _, email_id=email_id: finished(email_id))
+
+
+def start_processing():
+    logger.info(f"Starting asyncio engine with up to {ASYNC_MAX_EMAILS} emails")
+    processor_thread = threading.Thread(
+        target=asyncio.run,
+        args=(email_processor(),),
+        daemon=True,
+        name="EmailProcessorLoop",
+    )
+    processor_thread.start()
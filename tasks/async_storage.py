@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from utils.ollama import get_ollama_embedding_async
+
+from .http_pool import NEXUSDB_POOL_SIZE
+from .storage import SingleTaskListStorage
+
+logger = logging.getLogger(__name__)
+
+# Most NexusDB calls the asyncio engine has in flight at once
+NEXUSDB_CONCURRENCY = int(os.getenv("NEXUSDB_CONCURRENCY", NEXUSDB_POOL_SIZE))
+
+
+class AsyncTaskListStorage:
+    """
+    Awaitable front for SingleTaskListStorage. nexus_python only offers a
+    blocking client, so calls run on a dedicated thread pool whose size caps
+    how many NexusDB requests the event loop can have outstanding. Methods
+    that only touch in-process indexes are passed through synchronously.
+    """
+
+    def __init__(
+        self, storage: SingleTaskListStorage, concurrency: int = NEXUSDB_CONCURRENCY
+    ):
+        self.storage = storage
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="NexusDB"
+        )
+
+    async def _run(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(method, *args, **kwargs)
+        )
+
+    def next_task_id(self):
+        return self.storage.next_task_id()
+
+    def find_tasks(self, **criteria):
+        return self.storage.find_tasks(**criteria)
+
+    async def get_tasks(self, object=None, condition=None):
+        return await self._run(self.storage.get_tasks, object, condition)
+
+    async def append(self, task: Dict):
+        return await self._run(self.storage.append, task)
+
+    async def add_subtasks(
+        self,
+        current_task_id: str,
+        current_task_name: str,
+        potential_actions: List[Dict[str, str]] | None,
+        max_identifier: int,
+    ):
+        return await self._run(
+            self.storage.add_subtasks,
+            current_task_id,
+            current_task_name,
+            potential_actions,
+            max_identifier,
+        )
+
+    async def update_task_status(
+        self, task_uuid: str, task_name: str, status: str, result: str
+    ):
+        return await self._run(
+            self.storage.update_task_status, task_uuid, task_name, status, result
+        )
+
+    async def update_task_statuses(self, updates: List[Dict[str, str]]):
+        return await self._run(self.storage.update_task_statuses, updates)
+
+    async def get_previous_results(self, email_id: str):
+        return await self._run(self.storage.get_previous_results, email_id)
+
+    async def get_context(self, query: str, top_results_num: int):
+        # Embed on the loop, through the LLM scheduler, so the NexusDB pool
+        # only runs the search
+        query_embedding = await get_ollama_embedding_async(query)
+        return await self._run(
+            self.storage.get_context, query, top_results_num, query_embedding
+        )
+
+    async def lookup(self, relation_name, fields=None, condition=""):
+        return await self._run(
+            self.storage.lookup, relation_name, fields, condition=condition
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from utils.work_queue import EMAIL_QUEUE_PATH, EMAIL_QUEUE_POLL_SECONDS
+
+from .events import TaskEvent
+
+logger = logging.getLogger(__name__)
+
+# Seconds a change stays in the log; followers that fall further behind than
+# this miss it
+TASK_CHANGE_LOG_RETENTION = 3600
+# Delete expired changes after this many appends
+PRUNE_EVERY = 500
+
+
+class TaskChangeLog:
+    """
+    Task events shared between processes through a table in the email queue's
+    SQLite database. Worker processes append every task event they publish;
+    the app follows the log and applies the changes to its own task index, so
+    what the dashboard shows stays current while other processes do the work.
+    """
+
+    def __init__(
+        self,
+        path: str = EMAIL_QUEUE_PATH,
+        poll_interval: float = EMAIL_QUEUE_POLL_SECONDS,
+        retention: float = TASK_CHANGE_LOG_RETENTION,
+    ):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.appends = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS task_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        self.db.commit()
+
+    def append(self, event: TaskEvent):
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO task_changes (event, created_at) VALUES (?, ?)",
+                (json.dumps(event), now),
+            )
+            self.appends += 1
+            if self.appends % PRUNE_EVERY == 0:
+                self.db.execute(
+                    "DELETE FROM task_changes WHERE created_at < ?",
+                    (now - self.retention,),
+                )
+            self.db.commit()
+
+    def last_id(self) -> int:
+        with self.lock:
+            return self.db.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM task_changes"
+            ).fetchone()[0]
+
+    def since(self, last_id: int) -> List[Tuple[int, TaskEvent]]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, event FROM task_changes WHERE id > ? ORDER BY id",
+                (last_id,),
+            ).fetchall()
+        return [(id, json.loads(event)) for id, event in rows]
+
+    def follow(self, apply: Callable[[TaskEvent], None], last_id: int | None = None):
+        # Calls `apply` with each change appended after `last_id` (by default,
+        # after the ones already in the log), forever
+        if last_id is None:
+            last_id = self.last_id()
+        while True:
+            for id, event in self.since(last_id):
+                try:
+                    apply(event)
+                except Exception as e:
+                    logger.error(f"Failed to apply task change: {e}", exc_info=True)
+                last_id = id
+            time.sleep(self.poll_interval)
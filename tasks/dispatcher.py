@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from utils.work_queue import WorkQueue
+
+logger = logging.getLogger(__name__)
+
+MAX_THREADS = int(os.getenv("MAX_THREADS", 4))
+# Emails taken off the email queue to wait for a free worker. With 0, an email
+# stays on the email queue until a worker can start it.
+EMAIL_DISPATCH_QUEUE_DEPTH = int(os.getenv("EMAIL_DISPATCH_QUEUE_DEPTH", 0))
+
+
+class EmailDispatcher:
+    """
+    Hands emails from `source` to a fixed pool of `workers` threads. The
+    dispatcher blocks, rather than polling, while the queue is empty and
+    while every worker is busy with `queue_depth` more emails waiting. An
+    email whose Message-ID is already in flight is not started again.
+    """
+
+    def __init__(
+        self,
+        source: WorkQueue,
+        handle: Callable[[Dict[str, Any]], None],
+        workers: int = MAX_THREADS,
+        queue_depth: int = EMAIL_DISPATCH_QUEUE_DEPTH,
+    ):
+        self.source = source
+        self.handle = handle
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="EmailProcessor"
+        )
+        self.slots = threading.BoundedSemaphore(workers + queue_depth)
+        self.lock = threading.Lock()
+        self.in_flight = set()
+
+        self.running = 0
+        self.dispatched = 0
+        self.completed = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.saturated = 0
+        self.saturated_time = 0.0
+
+    def run(self):
+        while True:
+            self.wait_for_slot()
+            self.dispatch(self.source.get())
+
+    def wait_for_slot(self):
+        if self.slots.acquire(blocking=False):
+            return
+        logger.debug(f"All {self.workers} email workers busy, waiting")
+        start = time.perf_counter()
+        self.slots.acquire()
+        with self.lock:
+            self.saturated += 1
+            self.saturated_time += time.perf_counter() - start
+
+    def dispatch(self, email_data: Dict[str, Any]):
+        # Called holding a slot, which is released once the email is done
+        email_id = email_data["Message-ID"]
+        with self.lock:
+            duplicate = email_id in self.in_flight
+            if duplicate:
+                self.duplicates += 1
+            else:
+                self.in_flight.add(email_id)
+                self.dispatched += 1
+        if duplicate:
+            # Redelivered while still in flight; the running copy acknowledges it
+            logger.debug(f"Email {email_id} is already being processed")
+            self.slots.release()
+            return
+        self.executor.submit(self._process, email_id, email_data)
+
+    def _process(self, email_id: str, email_data: Dict[str, Any]):
+        with self.lock:
+            self.running += 1
+        failed = False
+        try:
+            self.handle(email_data)
+        except Exception as e:
+            logger.error(f"Error processing email {email_id}: {e}", exc_info=True)
+            failed = True
+        finally:
+            with self.lock:
+                self.in_flight.discard(email_id)
+                self.running -= 1
+                self.completed += 1
+                self.failed += failed
+            self.slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "running": self.running,
+                "waiting": len(self.in_flight) - self.running,
+                "utilization": self.running / self.workers,
+                "dispatched": self.dispatched,
+                "completed": self.completed,
+                "failed": self.failed,
+                "duplicates": self.duplicates,
+                # Times the dispatcher found every slot taken, and how long
+                # it waited in total
+                "saturated": self.saturated,
+                "saturated_seconds": self.saturated_time,
+            }
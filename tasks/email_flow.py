@@ -0,0 +1,129 @@
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# What an engine does next with an email
+DONE = "done"
+CLASSIFY = "classify"
+EXECUTE = "execute"
+
+
+class EmailFlow:
+    """
+    The decisions process_email makes for one email, kept apart from the
+    agent and storage calls so the threads, asyncio and pipeline engines all
+    follow the same flow. An engine starts the flow with the email's existing
+    tasks, then runs the objective agent if asked to classify, and executes
+    tasks from next_task() until it returns None, reporting each completion
+    or set of new subtasks back.
+    """
+
+    def __init__(self, email_data: Dict[str, Any]):
+        self.email_data = email_data
+        self.email_id = email_data["Message-ID"]
+        self.tasks: Dict[str, Dict] = {}
+        self.current_identifier = 0
+        self.max_identifier = 0
+
+    def start(self, existing_tasks: Dict[str, Dict]) -> str:
+        logger.info(
+            f"Existing tasks for email '{self.email_data['Subject']}': {existing_tasks}"
+        )
+
+        # Check if the task with identifier 0 is complete
+        if any(
+            task["identifier"] == 0 and task["actionStatus"] == "Complete"
+            for task in existing_tasks.values()
+        ):
+            logger.info(
+                f"Email with ID {self.email_id} has already been fully processed. Skipping."
+            )
+            return DONE
+
+        # If no existing tasks, proceed with objective agent and primary task creation
+        if not existing_tasks:
+            logger.info(f"Starting entity extraction for email ID {self.email_id}")
+            return CLASSIFY
+
+        # Set current_identifier to the largest identifier that is not complete
+        incomplete_tasks = [
+            task
+            for task in existing_tasks.values()
+            if task["actionStatus"] != "Complete"
+        ]
+        if not incomplete_tasks:
+            logger.info(
+                f"All tasks for email ID {self.email_id} are complete. Skipping."
+            )
+            return DONE
+        self.tasks = existing_tasks
+        self.max_identifier = max(task["identifier"] for task in incomplete_tasks)
+        self.current_identifier = self.max_identifier
+        return EXECUTE
+
+    def objective_args(self) -> tuple:
+        email_data = self.email_data
+        return (
+            email_data["To"],
+            email_data["From"],
+            email_data["Subject"],
+            email_data["Timestamp"],
+            email_data["Body"],
+            "",  # Assuming no attachments for simplicity
+        )
+
+    def primary_task(self, objective_response: Dict, task_id: str) -> Dict | None:
+        # The task to append for the objective, or None if there is nothing to do
+        if not objective_response["tasks_found"]:
+            logger.info("No tasks identified in the email.")
+            return None
+
+        objective = objective_response["tasks"][0]["name"]
+        logger.info(f"OBJECTIVE: {objective}")
+        task = {
+            "uuid": task_id,
+            "name": objective,
+            "agent": "AI",
+            "actionStatus": "Active",
+            "identifier": 0,
+            "object": self.email_id,
+        }
+        self.tasks = {task_id: task}
+        self.current_identifier = 0
+        self.max_identifier = 0
+        return task
+
+    def next_task(self) -> Dict | None:
+        # The AI task with the current identifier, or None once there is none
+        if self.current_identifier < 0:
+            return None
+        task = next(
+            (
+                t
+                for t in self.tasks.values()
+                if t["identifier"] == self.current_identifier and t["agent"] == "AI"
+            ),
+            None,
+        )
+        if not task:
+            logger.info("No more AI tasks to process.")
+            return None
+
+        logger.info(
+            f"Processing task: {task['name']} with identifier {self.current_identifier}"
+        )
+        return task
+
+    def completed(self, task: Dict):
+        task["actionStatus"] = "Complete"
+        self.current_identifier -= 1
+
+    def added_subtasks(
+        self, new_tasks: List[Dict], current_identifier: int, tasks: Dict[str, Dict]
+    ):
+        # Takes add_subtasks' return value; the new subtasks are worked next
+        self.current_identifier = current_identifier
+        self.max_identifier = current_identifier
+        self.tasks = tasks
+        logger.info(f"Created new sub-tasks: {new_tasks}")
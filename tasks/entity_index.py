@@ -0,0 +1,317 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds before an entity type's rows are looked up again
+ENTITY_INDEX_TTL = float(os.getenv("ENTITY_INDEX_TTL", 300))
+# Existing entities whose names share less than this fraction of trigrams with
+# a new entity are not considered candidates for it
+ENTITY_MATCH_MIN_SIMILARITY = float(os.getenv("ENTITY_MATCH_MIN_SIMILARITY", 0.3))
+# Cosine similarity above which the closest candidate is accepted without
+# asking the model. 0 disables the embedding check.
+ENTITY_EMBEDDING_THRESHOLD = float(os.getenv("ENTITY_EMBEDDING_THRESHOLD", 0))
+# Optional JSON file of {"alias": "canonical name"} entries
+ENTITY_ALIASES_PATH = os.getenv("ENTITY_ALIASES_PATH", "")
+
+DEFAULT_ALIASES = {"ea": "electronic arts"}
+# Types whose names are commonly shortened to their initials
+ACRONYM_TYPES = {"Organization", "Project"}
+SUFFIXES = {"inc", "incorporated", "corp", "corporation", "llc", "ltd", "co", "plc"}
+
+
+def normalize_name(name: str) -> str:
+    # Lowercase, fold accents, drop punctuation and company suffixes
+    name = unicodedata.normalize("NFKD", name.lower())
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    words = re.sub(r"[^\w\s]", " ", name).split()
+    while len(words) > 1 and words[-1] in SUFFIXES:
+        words.pop()
+    if len(words) > 1 and words[0] == "the":
+        words.pop(0)
+    return " ".join(words)
+
+
+def strip_name(name: str) -> str:
+    # The name as written, without a leading "the" or company suffixes
+    words = name.split()
+    while len(words) > 1 and words[-1].strip(".,").lower() in SUFFIXES:
+        words.pop()
+    if len(words) > 1 and words[0].lower() == "the":
+        words.pop(0)
+    return " ".join(words).rstrip(",")
+
+
+def written_form(normalized: str) -> str:
+    # How an alias or initials are likely written in a stored name
+    if " " not in normalized and len(normalized) <= 4:
+        return normalized.upper()
+    return " ".join(word.capitalize() for word in normalized.split())
+
+
+def acronym(normalized: str) -> Optional[str]:
+    words = normalized.split()
+    return "".join(word[0] for word in words) if len(words) > 1 else None
+
+
+def trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def load_aliases(path: str = ENTITY_ALIASES_PATH) -> Dict[str, str]:
+    aliases = dict(DEFAULT_ALIASES)
+    if path:
+        with open(path) as f:
+            aliases.update(
+                {normalize_name(k): normalize_name(v) for k, v in json.load(f).items()}
+            )
+    return aliases
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(x * x for x in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
+
+
+class EntityIndex:
+    """
+    Per-type index of existing entity names used to settle obvious cases
+    before asking the model. A name that equals exactly one entity's name
+    after normalization is taken as that entity; a name with no alias,
+    acronym or trigram-similar entities is new. Only the rest go to the
+    model, with those entities as candidates.
+
+    Rows are added for each lookup term (see lookup_terms) as it is looked
+    up, so the index only holds the entities new names could match.
+    """
+
+    def __init__(
+        self,
+        ttl: float = ENTITY_INDEX_TTL,
+        min_similarity: float = ENTITY_MATCH_MIN_SIMILARITY,
+        embedding_threshold: float = ENTITY_EMBEDDING_THRESHOLD,
+        aliases: Optional[Dict[str, str]] = None,
+    ):
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self.embedding_threshold = embedding_threshold
+        self.aliases = load_aliases() if aliases is None else aliases
+        self.lock = threading.Lock()
+        self.rows: Dict[str, Dict[str, Dict]] = {}
+        self.keys: Dict[str, Dict[str, Set[str]]] = {}
+        self.postings: Dict[str, Dict[str, Set[str]]] = {}
+        self.grams: Dict[str, Dict[str, Set[str]]] = {}
+        # When each (type, lookup term) was last looked up
+        self.loaded_at: Dict[Tuple[str, str], float] = {}
+        self.decisions = Counter()
+        # Entities the per-entity str_includes lookup would have found
+        # candidates for, each costing a dedup call, and how many of those
+        # were settled here instead
+        self.baseline_calls = 0
+        self.llm_calls_avoided = 0
+        self.resolver_calls_skipped = 0
+
+    def stale(self, entity_type: str, term: str) -> bool:
+        loaded_at = self.loaded_at.get((entity_type, term))
+        return loaded_at is None or time.monotonic() - loaded_at > self.ttl
+
+    def name_keys(self, entity_type: str, name: str) -> Set[str]:
+        normalized = normalize_name(name)
+        keys = {normalized, self.aliases.get(normalized, normalized)}
+        if entity_type in ACRONYM_TYPES and acronym(normalized):
+            keys.add(acronym(normalized))
+        return keys
+
+    def lookup_terms(self, entity_type: str, name: str) -> Set[str]:
+        """
+        Text an existing entity's name has to contain to be a candidate for
+        `name`: the name itself without company suffixes, plus how its
+        aliases and initials are written.
+        """
+        terms = {strip_name(name)}
+        normalized = normalize_name(name)
+        for alias, canonical in self.aliases.items():
+            if normalized in (alias, canonical):
+                terms |= {written_form(alias), written_form(canonical)}
+        if entity_type in ACRONYM_TYPES and acronym(normalized):
+            terms.add(written_form(acronym(normalized)))
+        terms.discard("")
+        return terms
+
+    def add(self, entity_type: str, term: str, rows: List[Dict]):
+        # Rows found by looking up `term`
+        with self.lock:
+            self._add_rows(entity_type, rows)
+            self.loaded_at[(entity_type, term)] = time.monotonic()
+
+    def load(self, entity_type: str, rows: List[Dict]):
+        # Replaces the type's rows, for callers that already hold all of them
+        with self.lock:
+            for index in (self.rows, self.keys, self.postings, self.grams):
+                index.pop(entity_type, None)
+            self._add_rows(entity_type, rows)
+
+    def _add_rows(self, entity_type: str, rows: List[Dict]):
+        by_uuid = self.rows.setdefault(entity_type, {})
+        keys = self.keys.setdefault(entity_type, defaultdict(set))
+        postings = self.postings.setdefault(entity_type, defaultdict(set))
+        grams = self.grams.setdefault(entity_type, {})
+        for row in rows:
+            if not isinstance(row.get("name"), str):
+                continue
+            uuid = row["uuid"]
+            if uuid in by_uuid:
+                # Drop what the row was indexed under, in case it was renamed
+                for key in self.name_keys(entity_type, by_uuid[uuid]["name"]):
+                    keys[key].discard(uuid)
+                for gram in grams[uuid]:
+                    postings[gram].discard(uuid)
+            by_uuid[uuid] = row
+            for key in self.name_keys(entity_type, row["name"]):
+                keys[key].add(uuid)
+            grams[uuid] = trigrams(normalize_name(row["name"]))
+            for gram in grams[uuid]:
+                postings[gram].add(uuid)
+
+    def exact_matches(self, entity_type: str, name: str) -> Set[str]:
+        # Entities whose normalized name is the same as `name`'s
+        normalized = normalize_name(name)
+        rows = self.rows.get(entity_type, {})
+        return {
+            uuid
+            for uuid in self.keys.get(entity_type, {}).get(normalized, ())
+            if normalize_name(rows[uuid]["name"]) == normalized
+        }
+
+    def key_matches(self, entity_type: str, name: str) -> Set[str]:
+        # Entities sharing any name key with `name`, including through an
+        # alias or initials
+        keys = self.keys.get(entity_type, {})
+        matches = set()
+        for key in self.name_keys(entity_type, name):
+            matches |= keys.get(key, set())
+        return matches
+
+    def similar(
+        self, entity_type: str, name: str, limit: int
+    ) -> List[Tuple[Dict, float]]:
+        query = trigrams(normalize_name(name))
+        postings = self.postings.get(entity_type, {})
+        grams = self.grams.get(entity_type, {})
+        shared = Counter()
+        for gram in query:
+            shared.update(postings.get(gram, ()))
+        scored = [
+            (uuid, count / (len(query) + len(grams[uuid]) - count))
+            for uuid, count in shared.items()
+        ]
+        scored = [item for item in scored if item[1] >= self.min_similarity]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        rows = self.rows[entity_type] if scored else {}
+        return [(rows[uuid], score) for uuid, score in scored[:limit]]
+
+    def prefilter(
+        self,
+        entities: List[Dict],
+        limit: int,
+        embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    ) -> Tuple[Dict[int, Optional[str]], Dict[int, List[Dict]]]:
+        """
+        Returns the entities settled here, as index to uuid (None for new),
+        and the candidates for each entity still left for the model.
+        """
+        resolved, ambiguous, baseline = {}, {}, set()
+        with self.lock:
+            for index, entity in enumerate(entities):
+                if any(
+                    entity["name"] in row["name"]
+                    for row in self.rows.get(entity["type"], {}).values()
+                ):
+                    baseline.add(index)
+                exact = self.exact_matches(entity["type"], entity["name"])
+                if len(exact) == 1:
+                    resolved[index] = next(iter(exact))
+                    self.decisions["exact"] += 1
+                    continue
+                # Alias and initials hits can be wrong ("IT" is not always
+                # Intel Technologies), so the model decides on them
+                keyed = self.key_matches(entity["type"], entity["name"])
+                rows = self.rows.get(entity["type"], {})
+                candidates = [rows[uuid] for uuid in keyed]
+                candidates += [
+                    row
+                    for row, _ in self.similar(entity["type"], entity["name"], limit)
+                    if row["uuid"] not in keyed
+                ]
+                if not candidates:
+                    resolved[index] = None
+                    self.decisions["new"] += 1
+                else:
+                    ambiguous[index] = candidates[:limit]
+
+        if ambiguous and embed is not None and self.embedding_threshold > 0:
+            for index, uuid in self.embedding_matches(entities, ambiguous, embed):
+                resolved[index] = uuid
+                del ambiguous[index]
+        with self.lock:
+            self.decisions["model"] += len(ambiguous)
+            self.baseline_calls += len(baseline)
+            self.llm_calls_avoided += len(baseline - ambiguous.keys())
+            if entities and not ambiguous:
+                self.resolver_calls_skipped += 1
+        return resolved, ambiguous
+
+    def embedding_matches(self, entities, ambiguous, embed):
+        def describe(item):
+            return f"{item['name']}: {item.get('description') or ''}"
+
+        order = list(ambiguous)
+        texts = [describe(entities[index]) for index in order]
+        for index in order:
+            texts.extend(describe(row) for row in ambiguous[index])
+        vectors = iter(embed(texts))
+        queries = [next(vectors) for _ in order]
+
+        matches = []
+        for index, query in zip(order, queries):
+            scores = sorted(
+                [
+                    (cosine(query, next(vectors)), row["uuid"])
+                    for row in ambiguous[index]
+                ],
+                reverse=True,
+            )
+            # Accept only a clear winner
+            best = scores[0]
+            runner_up = scores[1][0] if len(scores) > 1 else 0.0
+            if best[0] >= self.embedding_threshold > runner_up:
+                matches.append((index, best[1]))
+        with self.lock:
+            self.decisions["embedding"] += len(matches)
+        return matches
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                **self.decisions,
+                "baseline_calls": self.baseline_calls,
+                "llm_calls_avoided": self.llm_calls_avoided,
+                "avoided_rate": (
+                    self.llm_calls_avoided / self.baseline_calls
+                    if self.baseline_calls
+                    else 0.0
+                ),
+                "resolver_calls_skipped": self.resolver_calls_skipped,
+            }
+
+
+entity_index = EntityIndex()
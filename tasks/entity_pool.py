@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+ENTITY_WORKERS = int(os.getenv("ENTITY_WORKERS", 1))
+ENTITY_QUEUE_DEPTH = int(os.getenv("ENTITY_QUEUE_DEPTH", 100))
+# Longest combined body extracted in one call when emails are merged
+ENTITY_MERGE_MAX_CHARS = int(os.getenv("ENTITY_MERGE_MAX_CHARS", 8000))
+
+
+def merge_keys(email_data: Dict[str, Any]) -> List[tuple]:
+    # A waiting extraction can be joined by an email sharing any of these
+    keys = [("thread", email_data.get("Thread-ID")), ("from", email_data.get("From"))]
+    keys = [key for key in keys if key[1]]
+    return keys or [("message", email_data["Message-ID"])]
+
+
+def merged_email(emails: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if len(emails) == 1:
+        return emails[0]
+    return dict(emails[0], Body="\n\n".join(email["Body"] for email in emails))
+
+
+class EntityExtractionPool:
+    """
+    Runs entity extraction for new emails on a fixed number of workers.
+    Waiting emails from the same thread or the same sender are merged into
+    one extraction of their combined bodies, up to
+    `merge_max_chars`. Once `max_pending` extractions are waiting, further
+    emails are dropped rather than holding up email processing. Extraction
+    requests also run in the LLM scheduler's background class, behind task
+    execution.
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[Dict[str, Any]], None],
+        workers: int = ENTITY_WORKERS,
+        max_pending: int = ENTITY_QUEUE_DEPTH,
+        merge_max_chars: int = ENTITY_MERGE_MAX_CHARS,
+    ):
+        self.handle = handle
+        self.workers = workers
+        self.max_pending = max_pending
+        self.merge_max_chars = merge_max_chars
+        self.condition = threading.Condition()
+        self.queue = deque()
+        # Waiting job per merge key that later emails can still join
+        self.open: Dict[tuple, Dict] = {}
+        self.active = 0
+        self.threads: List[threading.Thread] = []
+
+        self.submitted = 0
+        self.merged = 0
+        self.dropped = 0
+        self.started = 0
+        self.extracted = 0
+        self.failed = 0
+        self.queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.latency = 0.0
+
+    def submit(self, email_data: Dict[str, Any]) -> bool:
+        keys = merge_keys(email_data)
+        chars = len(email_data.get("Body") or "")
+        with self.condition:
+            if not self.threads:
+                self._start()
+            self.submitted += 1
+            for key in keys:
+                job = self.open.get(key)
+                if job is not None and job["chars"] + chars <= self.merge_max_chars:
+                    job["emails"].append(email_data)
+                    job["chars"] += chars
+                    self._open(job, keys)
+                    self.merged += 1
+                    return True
+            if len(self.queue) >= self.max_pending:
+                self.dropped += 1
+                logger.warning(
+                    f"Entity extraction queue full, skipping {email_data['Message-ID']}"
+                )
+                return False
+            job = {
+                "keys": set(),
+                "emails": [email_data],
+                "chars": chars,
+                "queued_at": time.perf_counter(),
+            }
+            self.queue.append(job)
+            self._open(job, keys)
+            self.condition.notify()
+            return True
+
+    def _open(self, job: Dict, keys: List[tuple]):
+        # Later emails sharing a thread or sender with any email in the job can
+        # join it
+        for key in keys:
+            self.open[key] = job
+            job["keys"].add(key)
+
+    def _start(self):
+        self.threads = [
+            threading.Thread(
+                target=self._worker, daemon=True, name=f"EntityExtraction-{i}"
+            )
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                job = self.queue.popleft()
+                for key in job["keys"]:
+                    if self.open.get(key) is job:
+                        del self.open[key]
+                self.active += 1
+                self.started += 1
+                start = time.perf_counter()
+                waited = start - job["queued_at"]
+                self.queue_time += waited
+                self.max_queue_time = max(self.max_queue_time, waited)
+
+            failed = False
+            try:
+                self.handle(merged_email(job["emails"]))
+            except Exception as e:
+                logger.error(f"Entity extraction failed: {e}", exc_info=True)
+                failed = True
+
+            with self.condition:
+                self.active -= 1
+                self.extracted += 1
+                self.failed += failed
+                self.latency += time.perf_counter() - job["queued_at"]
+                self.condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.queue and not self.active, timeout=timeout
+            )
+
+    def stats(self) -> Dict[str, float]:
+        with self.condition:
+            return {
+                "workers": self.workers,
+                "pending": len(self.queue),
+                "active": self.active,
+                "submitted": self.submitted,
+                "merged": self.merged,
+                "dropped": self.dropped,
+                "extracted": self.extracted,
+                "failed": self.failed,
+                "mean_queue_seconds": (
+                    self.queue_time / self.started if self.started else 0.0
+                ),
+                "max_queue_seconds": self.max_queue_time,
+                # From the first email being queued to its extraction finishing
+                "mean_latency_seconds": (
+                    self.latency / self.extracted if self.extracted else 0.0
+                ),
+            }
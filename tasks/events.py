@@ -0,0 +1,90 @@
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Events are dicts with a "type" ("created" or "updated"), the names of the
+# fields an update "changed", and the task's fields after the change: uuid,
+# name, object, identifier, actionStatus, agent and potentialAction
+TaskEvent = Dict[str, Any]
+
+
+class TaskEvents:
+    """
+    Task-change bus. The storage layer publishes an event for every task it
+    creates or updates; subscribers are called on the publishing thread, so
+    they should only record the change and return.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers: List[Callable[[TaskEvent], None]] = []
+
+    def subscribe(self, callback: Callable[[TaskEvent], None]) -> Callable[[], None]:
+        with self.lock:
+            self.subscribers.append(callback)
+
+        def unsubscribe():
+            with self.lock:
+                if callback in self.subscribers:
+                    self.subscribers.remove(callback)
+
+        return unsubscribe
+
+    def publish(self, event: TaskEvent):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Task event subscriber failed: {e}", exc_info=True)
+
+
+class TaskChangeFeed:
+    """
+    Counts task changes so readers, such as the dashboard, can wait for the
+    next one instead of polling.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+
+    def notify(self, event: TaskEvent):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, since: int, timeout: float) -> int:
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > since, timeout=timeout)
+            return self.version
+
+
+class TaskMetrics:
+    """Counts task events by type and by the status they leave the task in."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = Counter()
+        self.statuses = Counter()
+
+    def record(self, event: TaskEvent):
+        with self.lock:
+            self.events[event["type"]] += 1
+            if event["type"] == "created" or "actionStatus" in event.get("changed", ()):
+                self.statuses[event.get("actionStatus")] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            return {"events": dict(self.events), "statuses": dict(self.statuses)}
+
+
+task_events = TaskEvents()
+task_feed = TaskChangeFeed()
+task_metrics = TaskMetrics()
+task_events.subscribe(task_feed.notify)
+task_events.subscribe(task_metrics.record)
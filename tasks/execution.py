@@ -1,21 +1,57 @@
 import logging
 
-from utils.ollama import ollama_generate
+from utils.ollama import ollama_generate, ollama_generate_async, register_agent
 
 logger = logging.getLogger(__name__)
 
+MORE_CONTEXT_NEEDED = "More context needed"
 
-def execution_agent(task_name: str, previous_results: list, context: list) -> str:
-    try:
-        prompt = f"""
-Perform the following task: {task_name}.
+# Stop reading as soon as the model asks for more context
+register_agent("execution", sentinels=[MORE_CONTEXT_NEEDED])
+
+
+# Sent as the system prompt so its evaluation can be reused across tasks
+EXECUTION_SYSTEM = """You will be given a task to perform, the results of previously completed tasks and the contexts of similar tasks.
+If you can complete the task based on the context provided, execute it and respond with the result.
+If more context is needed, respond with "More context needed" - DO NOT SAY ANYTHING ELSE."""
+
+
+def execution_prompt(task_name: str, previous_results: list, context: list) -> str:
+    return f"""Perform the following task: {task_name}.
 Take into account these previously completed tasks and their results: {previous_results}.
 Additionally, consider these similar tasks and their contexts: {context}.
-If you can complete the task based on the context provided, execute it and respond with the result. 
-If more context is needed, respond with "More context needed" - DO NOT SAY ANYTHING ELSE.
 Response:
 """
-        response_text = ollama_generate(model="llama3", prompt=prompt, stream=True)
+
+
+def execution_agent(task_name: str, previous_results: list, context: list) -> str:
+    try:
+        prompt = execution_prompt(task_name, previous_results, context)
+        response_text = ollama_generate(
+            model="llama3",
+            prompt=prompt,
+            system=EXECUTION_SYSTEM,
+            stream=True,
+            agent="execution",
+        )
+        return response_text
+    except Exception as e:
+        logger.error(f"Error in execution_agent: {e}")
+        raise
+
+
+async def execution_agent_async(
+    task_name: str, previous_results: list, context: list
+) -> str:
+    try:
+        prompt = execution_prompt(task_name, previous_results, context)
+        response_text = await ollama_generate_async(
+            model="llama3",
+            prompt=prompt,
+            system=EXECUTION_SYSTEM,
+            stream=True,
+            agent="execution",
+        )
         return response_text
     except Exception as e:
         logger.error(f"Error in execution_agent: {e}")
@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+import requests
+from nexus_python import nexusdb
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+NEXUSDB_POOL_SIZE = int(os.getenv("NEXUSDB_POOL_SIZE", os.getenv("MAX_THREADS", 4)))
+
+
+class PooledSession(requests.Session):
+    """
+    Keep-alive session whose connection pool is shared by every thread that
+    talks to NexusDB. Tracks in-flight requests so pool utilization can be
+    reported.
+    """
+
+    def __init__(self, pool_size: int = NEXUSDB_POOL_SIZE):
+        super().__init__()
+        self.pool_size = pool_size
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+        self.stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    def request(self, *args, **kwargs):
+        with self.stats_lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            return super().request(*args, **kwargs)
+        except requests.RequestException:
+            with self.stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            with self.stats_lock:
+                self.in_flight -= 1
+                self.total_time += time.perf_counter() - start
+
+    def stats(self) -> Dict[str, float]:
+        with self.stats_lock:
+            return {
+                "pool_size": self.pool_size,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "utilization": self.in_flight / self.pool_size,
+                "requests": self.requests,
+                "errors": self.errors,
+                "mean_latency": (
+                    self.total_time / self.requests if self.requests else 0.0
+                ),
+            }
+
+
+session = PooledSession()
+
+
+def install():
+    # nexus_python posts through the module-level requests.post with no way to
+    # pass a session, so point that module at the shared pool instead
+    if nexusdb.requests is not session:
+        nexusdb.requests = session
+        logger.debug(f"NexusDB client using a pool of {session.pool_size} connections")
+
+
+def stats() -> Dict[str, float]:
+    return session.stats()
@@ -0,0 +1,260 @@
+import ast
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from nexus_python.nexusdb import NexusDB
+
+logger = logging.getLogger(__name__)
+
+NEXUSDB_LATENCY_MS = float(os.getenv("NEXUSDB_LATENCY_MS", 0))
+NEXUSDB_LATENCY_JITTER_MS = float(os.getenv("NEXUSDB_LATENCY_JITTER_MS", 0))
+
+# NexusDB serializes a missing value as the string "Null"
+NULL = "Null"
+
+
+def unwrap_raw(value):
+    # Strings written as ___"..."___ are raw literals; the server stores the inside
+    if isinstance(value, str) and value.startswith('___"') and value.endswith('"___'):
+        return value[4:-4]
+    return value
+
+
+def split_top_level(condition: str) -> List[str]:
+    # Split on commas that are not inside quotes, brackets or parentheses
+    parts, depth, quote, current = [], 0, None, ""
+    for char in condition:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+            continue
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def parse_condition(condition: str):
+    """
+    Turns the subset of NexusDB conditions this app uses into a row predicate:
+    comma-separated (AND) clauses of `field = value`, `str_includes('field',
+    'text')` and `is_in('field', [values])`.
+    """
+    clauses = []
+    for clause in split_top_level(condition or ""):
+        if clause.startswith("str_includes("):
+            field, text = ast.literal_eval(clause[len("str_includes") :])
+            clauses.append(
+                lambda row, f=field, t=text: isinstance(row.get(f), str) and t in row[f]
+            )
+        elif clause.startswith("is_in("):
+            field, values = ast.literal_eval(clause[len("is_in") :])
+            values = set(values)
+            clauses.append(lambda row, f=field, v=values: row.get(f) in v)
+        elif "=" in clause:
+            field, value = (part.strip() for part in clause.split("=", 1))
+            value = ast.literal_eval(value)
+            clauses.append(lambda row, f=field, v=value: row.get(f) == v)
+        else:
+            raise ValueError(f"Unsupported condition: {clause}")
+    return lambda row: all(clause(row) for clause in clauses)
+
+
+class InMemoryNexusDB(NexusDB):
+    """
+    Local stand-in for the NexusDB client that keeps relations in memory and
+    returns the same JSON shapes. Every call sleeps for `latency_ms` plus up
+    to `jitter_ms` of uniform noise to imitate network round trips.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = NEXUSDB_LATENCY_MS,
+        jitter_ms: float = NEXUSDB_LATENCY_JITTER_MS,
+        seed: int | None = None,
+    ):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self.relations: Dict[str, Dict[str, Dict]] = {}
+        self.columns: Dict[str, List[str]] = {}
+        self.vectors: Dict[Tuple, Dict] = {}
+        self.db_lock = threading.Lock()
+        self.calls = 0
+
+    def _round_trip(self):
+        with self.db_lock:
+            self.calls += 1
+        delay = self.latency_ms + self.random.uniform(-1, 1) * self.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _rows(self, relation_name: str) -> Dict[str, Dict]:
+        return self.relations.setdefault(relation_name, {})
+
+    def _add_columns(self, relation_name: str, fields: List[str]):
+        columns = self.columns.setdefault(relation_name, [])
+        columns.extend(field for field in fields if field not in columns)
+
+    def modify_data(
+        self,
+        operation_type,
+        relation_name,
+        fields=None,
+        values=None,
+        text=None,
+        embeddings=None,
+        access_keys=None,
+        metadata=None,
+        references=None,
+    ):
+        if (fields is None) != (values is None):
+            raise ValueError("Both fields and values must be specified together.")
+        if (text is None) != (embeddings is None):
+            raise ValueError("Both text and embeddings must be specified together.")
+        if fields is None and text is None:
+            raise ValueError(
+                "You must specify fields/values or text/embeddings, or both."
+            )
+
+        self._round_trip()
+        with self.db_lock:
+            if fields is not None:
+                error = self._write_rows(operation_type, relation_name, fields, values)
+                if error:
+                    return json.dumps({"error": error})
+            if text is not None:
+                key = json.dumps(references, sort_keys=True) if references else text
+                self.vectors[(relation_name, key)] = {
+                    "text": unwrap_raw(text),
+                    "embedding": embeddings,
+                    "references": references,
+                    "metadata": metadata,
+                }
+        return json.dumps({"status": "OK"})
+
+    def _write_rows(self, operation_type, relation_name, fields, values):
+        rows = self._rows(relation_name)
+        self._add_columns(relation_name, fields)
+        # Relations are keyed by uuid, or by their first column if they have none
+        columns = self.columns[relation_name]
+        key_field = "uuid" if "uuid" in columns else columns[0]
+        if key_field not in fields:
+            return f"Missing key field '{key_field}'"
+
+        for value in values:
+            row = {field: unwrap_raw(v) for field, v in zip(fields, value)}
+            key = row[key_field]
+            if operation_type == "Insert" and key in rows:
+                return f"Row '{key}' already exists in {relation_name}"
+            if operation_type == "Update" and key not in rows:
+                return f"Row '{key}' does not exist in {relation_name}"
+            rows.setdefault(key, {}).update(row)
+        return None
+
+    def lookup(
+        self,
+        relation_name,
+        fields=None,
+        condition="",
+        tabulate=False,
+        include_types=False,
+    ):
+        self._round_trip()
+        predicate = parse_condition(condition)
+        with self.db_lock:
+            fields = fields or list(self.columns.get(relation_name, []))
+            rows = [
+                [self._value(row, field) for field in fields]
+                for row in self._rows(relation_name).values()
+                if predicate(row)
+            ]
+        return json.dumps({"headers": fields, "rows": rows})
+
+    @staticmethod
+    def _value(row: Dict, field: str):
+        value = row.get(field)
+        return NULL if value is None else value
+
+    def recursive_query(
+        self,
+        relation_name,
+        source_field,
+        target_field,
+        starting_condition,
+        tabulate=False,
+        include_types=False,
+    ):
+        self._round_trip()
+        predicate = parse_condition(starting_condition)
+        with self.db_lock:
+            fields = list(self.columns.get(relation_name, []))
+            edges = list(self._rows(relation_name).values())
+            found = [row for row in edges if predicate(row)]
+            seen = {id(row) for row in found}
+            frontier = {row.get(source_field) for row in found}
+            # Follow edges whose target is a source reached so far
+            while frontier:
+                next_rows = [
+                    row
+                    for row in edges
+                    if row.get(target_field) in frontier and id(row) not in seen
+                ]
+                seen.update(id(row) for row in next_rows)
+                found.extend(next_rows)
+                frontier = {row.get(source_field) for row in next_rows}
+            rows = [[self._value(row, field) for field in fields] for row in found]
+        return json.dumps({"headers": fields, "rows": rows})
+
+    def vector_search(
+        self,
+        query_vector,
+        access_keys=None,
+        search_radius=None,
+        number_of_results=None,
+        filter_statement=None,
+        tabulate=False,
+        include_types=False,
+    ):
+        self._round_trip()
+        query_norm = math.sqrt(sum(x * x for x in query_vector)) or 1.0
+        with self.db_lock:
+            scored = []
+            for entry in self.vectors.values():
+                embedding = entry["embedding"]
+                norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+                similarity = sum(a * b for a, b in zip(query_vector, embedding)) / (
+                    norm * query_norm
+                )
+                distance = 1 - similarity
+                if search_radius is None or distance <= search_radius:
+                    references = entry["references"] or [[None, [None]]]
+                    scored.append([references[0][1][0], entry["text"], distance])
+        scored.sort(key=lambda row: row[2])
+        if number_of_results is not None:
+            scored = scored[:number_of_results]
+        return json.dumps({"headers": ["id", "text", "distance"], "rows": scored})
+
+    def delete(self, relation_name, condition):
+        self._round_trip()
+        predicate = parse_condition(condition)
+        with self.db_lock:
+            rows = self._rows(relation_name)
+            for key in [key for key, row in rows.items() if predicate(row)]:
+                del rows[key]
+        return json.dumps({"status": "OK"})
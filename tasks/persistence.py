@@ -0,0 +1,137 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+RESULT_WRITERS = int(os.getenv("RESULT_WRITERS", 2))
+RESULT_QUEUE_DEPTH = int(os.getenv("RESULT_QUEUE_DEPTH", 100))
+
+# Upper bound on how many queued results one worker embeds and writes together
+BATCH_SIZE = 16
+
+
+class ResultWriter:
+    """
+    Write-behind queue for result vectors. Each uuid has at most one queued
+    write: a newer result replaces the queued one, and a uuid is never written
+    by two workers at once, so the last submitted result is the one stored.
+    submit() blocks once `max_pending` results are waiting.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Tuple[str, str]]], None],
+        workers: int = RESULT_WRITERS,
+        max_pending: int = RESULT_QUEUE_DEPTH,
+    ):
+        self.write = write
+        self.max_pending = max_pending
+        self.pending: Dict[str, str] = {}
+        self.order = deque()
+        self.active: Set[str] = set()
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.written = 0
+        self.failed = 0
+
+        self.threads = [
+            threading.Thread(target=self._worker, daemon=True, name=f"ResultWriter-{i}")
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+        atexit.register(self.close)
+
+    def submit(self, uuid: str, result: str):
+        with self.condition:
+            if self.closed:
+                write_now = True
+            else:
+                write_now = False
+                self.submitted += 1
+                if uuid in self.pending:
+                    self.pending[uuid] = result
+                    self.coalesced += 1
+                    return
+                while len(self.pending) >= self.max_pending and not self.closed:
+                    self.condition.wait()
+                self.pending[uuid] = result
+                self.order.append(uuid)
+                self.condition.notify_all()
+
+        if write_now:
+            self.write([(uuid, result)])
+
+    def _take_batch(self) -> List[Tuple[str, str]]:
+        batch = []
+        for uuid in list(self.order):
+            if uuid in self.active:
+                continue
+            self.order.remove(uuid)
+            self.active.add(uuid)
+            batch.append((uuid, self.pending.pop(uuid)))
+            if len(batch) == BATCH_SIZE:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                batch = self._take_batch()
+                while not batch:
+                    if self.closed and not self.order:
+                        return
+                    self.condition.wait()
+                    batch = self._take_batch()
+                # Free up queue slots for blocked submitters
+                self.condition.notify_all()
+
+            try:
+                self.write(batch)
+                written, failed = len(batch), 0
+            except Exception as e:
+                logger.error(
+                    f"Failed to write {len(batch)} results: {e}", exc_info=True
+                )
+                written, failed = 0, len(batch)
+
+            with self.condition:
+                for uuid, _ in batch:
+                    self.active.discard(uuid)
+                self.written += written
+                self.failed += failed
+                self.condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.pending and not self.active, timeout=timeout
+            )
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        logger.debug(f"Result writer closed: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        with self.condition:
+            return {
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "written": self.written,
+                "failed": self.failed,
+                "pending": len(self.pending),
+                "in_flight": len(self.active),
+            }
@@ -0,0 +1,279 @@
+import logging
+import os
+import threading
+import time
+from queue import Queue
+from typing import Any, Callable, Dict
+
+from integrations.email.fetcher import email_queue
+from tasks.agents import objective_agent, task_creation_agent
+from tasks.email_flow import CLASSIFY, DONE, EmailFlow
+from tasks.execution import MORE_CONTEXT_NEEDED, execution_agent
+from tasks.processor import entity_extraction_processor, tasks_storage
+from utils.env import parse_counts
+from utils.llm_scheduler import current_email
+from utils.ollama import warm_model
+from utils.work_queue import WorkQueue
+
+logger = logging.getLogger(__name__)
+
+STAGES = ["ingest", "classify", "plan", "execute", "persist"]
+# Worker threads per stage, e.g. "classify=2,execute=8"
+PIPELINE_WORKERS = {
+    "ingest": 1,
+    "classify": 2,
+    "plan": 2,
+    "execute": 4,
+    "persist": 2,
+    **parse_counts(os.getenv("PIPELINE_WORKERS", "")),
+}
+# Most emails in the pipeline at once. Each stage's queue holds up to this many.
+PIPELINE_MAX_EMAILS = int(os.getenv("PIPELINE_MAX_EMAILS", 100))
+
+
+class EmailJob(EmailFlow):
+    """An email's progress through the pipeline."""
+
+    def __init__(self, email_data: Dict[str, Any]):
+        super().__init__(email_data)
+        # The task being worked on and the write persist should make for it
+        self.task = None
+        self.previous_results = None
+        self.write = None
+
+
+class Stage:
+    """
+    A pool of `workers` threads taking jobs from a bounded queue and passing
+    them to `handle`. Tracks throughput, time spent queued and time spent
+    being handled.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handle: Callable[[EmailJob], None],
+        workers: int,
+        depth: int,
+        on_error: Callable[[EmailJob, Exception], None],
+    ):
+        self.name = name
+        self.handle = handle
+        self.workers = workers
+        self.on_error = on_error
+        self.queue = Queue(maxsize=depth)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.queue_time = 0.0
+        self.service_time = 0.0
+        self.threads = [
+            threading.Thread(
+                target=self._worker, daemon=True, name=f"Pipeline-{name}-{i}"
+            )
+            for i in range(workers)
+        ]
+
+    def start(self):
+        self.started = time.monotonic()
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, job: EmailJob):
+        self.queue.put((time.perf_counter(), job))
+
+    def _worker(self):
+        while True:
+            queued_at, job = self.queue.get()
+            start = time.perf_counter()
+            with self.lock:
+                self.busy += 1
+                self.queue_time += start - queued_at
+            current_email.set(job.email_id)
+            failed = False
+            try:
+                self.handle(job)
+            except Exception as e:
+                failed = True
+                self.on_error(job, e)
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                    self.processed += 1
+                    self.failed += failed
+                    self.service_time += time.perf_counter() - start
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "workers": self.workers,
+                "busy": self.busy,
+                "queued": self.queue.qsize(),
+                "processed": self.processed,
+                "failed": self.failed,
+                "per_second": self.processed / elapsed if elapsed else 0.0,
+                "mean_queue_seconds": (
+                    self.queue_time / self.processed if self.processed else 0.0
+                ),
+                "mean_service_seconds": (
+                    self.service_time / self.processed if self.processed else 0.0
+                ),
+            }
+
+
+class EmailPipeline:
+    """
+    Runs process_email's steps as separate stages, each with its own pool:
+    ingest (load existing tasks), classify (objective agent), plan (task
+    creation agent), execute (execution agent) and persist (task writes).
+    An email moves between stages until it has no AI task left, so cheap
+    classification and slow execution can be sized independently.
+
+    At most `max_emails` emails are admitted at once and each is in one
+    queue at a time, so queues of that depth never block a worker for good.
+    """
+
+    def __init__(
+        self,
+        source: WorkQueue,
+        workers: Dict[str, int] = PIPELINE_WORKERS,
+        max_emails: int = PIPELINE_MAX_EMAILS,
+    ):
+        self.source = source
+        self.slots = threading.BoundedSemaphore(max_emails)
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.completed = 0
+        self.duplicates = 0
+        self.stages = {
+            name: Stage(
+                name, getattr(self, name), workers.get(name, 1), max_emails, self.fail
+            )
+            for name in STAGES
+        }
+
+    def run(self):
+        for stage in self.stages.values():
+            stage.start()
+        while True:
+            self.slots.acquire()
+            email_data = self.source.get()
+            email_id = email_data["Message-ID"]
+            with self.lock:
+                duplicate = email_id in self.in_flight
+                if duplicate:
+                    self.duplicates += 1
+                else:
+                    self.in_flight.add(email_id)
+            if duplicate:
+                # Redelivered while still in flight; the running copy acknowledges it
+                logger.debug(f"Email {email_id} is already being processed")
+                self.slots.release()
+                continue
+            self.stages["ingest"].put(EmailJob(email_data))
+
+    def finish(self, job: EmailJob):
+        with self.lock:
+            self.in_flight.discard(job.email_id)
+            self.completed += 1
+        self.source.task_done(job.email_data)
+        self.slots.release()
+
+    def fail(self, job: EmailJob, error: Exception):
+        logger.error(f"Error processing email: {error}", exc_info=error)
+        self.finish(job)
+
+    def ingest(self, job: EmailJob):
+        step = job.start(tasks_storage.get_tasks(object=job.email_id))
+        if step == DONE:
+            return self.finish(job)
+        if step == CLASSIFY:
+            entity_extraction_processor(job.email_data)
+            return self.stages["classify"].put(job)
+        self.stages["execute"].put(job)
+
+    def classify(self, job: EmailJob):
+        objective_response = objective_agent(*job.objective_args())
+        primary_task = job.primary_task(
+            objective_response, tasks_storage.next_task_id()
+        )
+        if primary_task is None:
+            return self.finish(job)
+        job.write = ("primary", primary_task)
+        self.stages["persist"].put(job)
+
+    def execute(self, job: EmailJob):
+        task = job.next_task()
+        if task is None:
+            return self.finish(job)
+
+        job.task = task
+        job.previous_results = tasks_storage.get_previous_results(job.email_id)
+        context = tasks_storage.get_context(task["name"], 5)
+        result = execution_agent(task["name"], job.previous_results, context)
+
+        if result == MORE_CONTEXT_NEEDED:
+            self.stages["plan"].put(job)
+        else:
+            job.write = ("complete", result)
+            self.stages["persist"].put(job)
+
+    def plan(self, job: EmailJob):
+        new_tasks = task_creation_agent(job.task["name"], job.previous_results)
+        job.write = ("subtasks", new_tasks)
+        self.stages["persist"].put(job)
+
+    def persist(self, job: EmailJob):
+        kind, value = job.write
+        job.write = None
+        if kind == "primary":
+            tasks_storage.append(value)
+            logger.debug(f"Primary task created: {value}")
+        elif kind == "complete":
+            job.completed(job.task)
+            tasks_storage.update_task_status(
+                job.task["uuid"], job.task["name"], "Complete", value
+            )
+        else:
+            job.added_subtasks(
+                value,
+                *tasks_storage.add_subtasks(
+                    current_task_id=job.task["uuid"],
+                    current_task_name=job.task["name"],
+                    potential_actions=value,
+                    max_identifier=job.max_identifier,
+                ),
+            )
+
+        self.stages["execute"].put(job)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            emails = {
+                "in_flight": len(self.in_flight),
+                "completed": self.completed,
+                "duplicates": self.duplicates,
+            }
+        return {
+            "emails": emails,
+            **{name: stage.stats() for name, stage in self.stages.items()},
+        }
+
+
+pipeline = EmailPipeline(email_queue)
+
+
+def email_processor():
+    warm_model("llama3")
+    pipeline.run()
+
+
+def start_processing():
+    logger.info(f"Starting pipeline engine with workers {PIPELINE_WORKERS}")
+    processor_thread = threading.Thread(
+        target=email_processor, daemon=True, name="EmailPipeline"
+    )
+    processor_thread.start()
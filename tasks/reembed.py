@@ -0,0 +1,15 @@
+import logging
+
+from dotenv import load_dotenv
+
+# Load .env before importing storage, since it reads settings at import time
+load_dotenv()
+
+from tasks.storage import get_storage  # noqa: E402
+
+# Writes the embedding of every completed result to NexusDB again, as unit
+# vectors. Run once on a database written before embeddings were normalized:
+# python -m tasks.reembed
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    get_storage().reembed_results()
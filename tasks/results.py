@@ -0,0 +1,136 @@
+import json
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover - optional dependency
+    loads = json.loads
+
+
+class ResultSet:
+    """
+    A NexusDB lookup result decoded once and held by column. Rows are only
+    turned into dicts when they are read, and only with the fields asked for.
+    """
+
+    def __init__(self, raw, fields: Optional[List[str]] = None):
+        data = loads(raw) if isinstance(raw, (str, bytes)) else raw
+        self._rows = data.get("rows", [])
+        # Lookups return rows in the order of the requested fields, so prefer
+        # those names over whatever headers the server sent back
+        self.fields = list(fields or data.get("headers", []))
+        self._columns: Optional[Dict[str, list]] = None
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, list]) -> "ResultSet":
+        result = cls({"rows": []}, list(columns))
+        result._columns = {field: list(values) for field, values in columns.items()}
+        result._rows = None
+        return result
+
+    def __len__(self):
+        if self._rows is not None:
+            return len(self._rows)
+        return len(next(iter(self._columns.values()), []))
+
+    @property
+    def columns(self) -> Dict[str, list]:
+        if self._columns is None:
+            transposed = list(zip(*self._rows)) if self._rows else []
+            self._columns = {
+                field: list(transposed[i]) if i < len(transposed) else []
+                for i, field in enumerate(self.fields)
+            }
+            self._rows = None
+        return self._columns
+
+    def column(self, field: str) -> list:
+        return self.columns[field]
+
+    def first_column(self) -> list:
+        return self.columns[self.fields[0]] if self.fields else []
+
+    def project(self, fields: List[str]) -> "ResultSet":
+        return ResultSet.from_columns({field: self.columns[field] for field in fields})
+
+    def row(self, index: int, fields: Optional[List[str]] = None) -> Dict:
+        return {field: self.columns[field][index] for field in fields or self.fields}
+
+    def rows(self, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield self.row(index, fields)
+
+
+class TaskRows(MutableMapping):
+    """
+    Mapping of uuid to task dict over a ResultSet of Action rows. Only the uuid
+    column is read up front; a task dict, with potentialAction uuids resolved
+    to names, is built the first time that task is accessed.
+    """
+
+    def __init__(self, result: ResultSet):
+        self.result = result
+        self.positions = {
+            uuid: index for index, uuid in enumerate(result.column("uuid"))
+        }
+        self.built: Dict[str, Dict] = {}
+        self.overrides: Dict[str, Dict] = {}
+        self.removed = set()
+        self._names: Optional[Dict[str, str]] = None
+
+    def _name_for(self, uuid: str) -> str:
+        if self._names is None:
+            self._names = dict(
+                zip(self.result.column("uuid"), self.result.column("name"))
+            )
+        return self._names.get(uuid, uuid)
+
+    def _build(self, uuid: str) -> Dict:
+        task = self.result.row(self.positions[uuid])
+        potential_actions = task.get("potentialAction")
+        if isinstance(potential_actions, list) and potential_actions:
+            task["potentialAction"] = [
+                self._name_for(action) for action in potential_actions
+            ]
+        else:
+            task["potentialAction"] = None
+        return task
+
+    def __getitem__(self, uuid: str) -> Dict:
+        if uuid in self.overrides:
+            return self.overrides[uuid]
+        if uuid in self.removed or uuid not in self.positions:
+            raise KeyError(uuid)
+        if uuid not in self.built:
+            self.built[uuid] = self._build(uuid)
+        return self.built[uuid]
+
+    def __setitem__(self, uuid: str, task: Dict):
+        self.overrides[uuid] = task
+        self.removed.discard(uuid)
+
+    def __delitem__(self, uuid: str):
+        if uuid not in self:
+            raise KeyError(uuid)
+        self.overrides.pop(uuid, None)
+        self.removed.add(uuid)
+
+    def __contains__(self, uuid) -> bool:
+        return uuid in self.overrides or (
+            uuid in self.positions and uuid not in self.removed
+        )
+
+    def __iter__(self):
+        for uuid in self.positions:
+            if uuid not in self.removed and uuid not in self.overrides:
+                yield uuid
+        yield from self.overrides
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"TaskRows({len(self)} tasks)"
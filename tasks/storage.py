@@ -1,20 +1,86 @@
 import ast
 import json
 import logging
+import os
+import threading
 from re import S
 from typing import Dict, List
 
 from nexus_python.nexusdb import NexusDB
 from typeid import TypeID
 
-from utils.ollama import get_ollama_embedding
+from utils.ollama import get_ollama_embedding, get_ollama_embeddings
+
+from . import http_pool
+from .events import task_events
+from .memory_db import InMemoryNexusDB
+from .persistence import RESULT_WRITERS, ResultWriter
+from .results import ResultSet, TaskRows, loads
+from .task_index import TASK_FIELDS, ClosureCache, TaskIndex
+from .vector_index import LOCAL_VECTOR_INDEX, LocalVectorIndex
 
 logger = logging.getLogger(__name__)
 
+# "memory" runs against an in-process stand-in instead of the NexusDB service
+NEXUSDB_BACKEND = os.getenv("NEXUSDB_BACKEND", "nexusdb")
+# Columns written for a new subtask
+SUBTASK_FIELDS = ["uuid", "name", "actionStatus", "identifier", "object", "agent"]
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    # One storage client per process, so every thread shares its connection
+    # pool and in-process indexes
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if NEXUSDB_BACKEND == "memory":
+                logger.info("Using the in-memory NexusDB backend")
+                _storage = InMemoryTaskListStorage()
+            else:
+                http_pool.install()
+                _storage = SingleTaskListStorage()
+        return _storage
+
+
+def raw(result: str) -> str:
+    # formatting like this allows us to store newlines, tabs and other special characters in the databse without breaking the query
+    return f'___"{result}"___'
+
+
+def is_error_response(response) -> bool:
+    if not isinstance(response, str):
+        return False
+    if response.startswith("Error"):
+        return True
+    try:
+        parsed = json.loads(response)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(parsed, dict) and ("error" in parsed or "Error" in parsed)
+
 
 class SingleTaskListStorage(NexusDB):
+    # Cleared at runtime if the backend rejects a multi-row upsert
+    supports_multi_row_upsert = True
+
     def __init__(self):
         super().__init__()
+        self.task_index = TaskIndex()
+        self.closures = ClosureCache()
+        self.vector_index = None
+        self.vector_index_seeding = threading.Lock()
+        self.vector_index_seeder = None
+        if LOCAL_VECTOR_INDEX:
+            try:
+                self.vector_index = LocalVectorIndex()
+            except ImportError as e:
+                logger.warning(f"Local vector index disabled: {e}")
+        self.result_writer = None
+        if RESULT_WRITERS > 0:
+            self.result_writer = ResultWriter(self.write_result_vectors)
 
     def append(self, task: Dict):
         logger.debug(f"Appending task: {task}")
@@ -27,11 +93,76 @@ class SingleTaskListStorage(NexusDB):
         fields = list(task.keys())
         values = [list(task.values())]
         self.insert("Action", fields, values)
+        self.task_index.put(task)
+        if task.get("identifier") == 0 and task.get("object"):
+            self.closures.set(task["object"], [task["uuid"]])
+        self.publish("created", task)
+
+    def invalidate_closure(self, uuid: str):
+        # Drops the closure of the objective above `uuid`, found through the
+        # task index when the closure cache doesn't track the task
+        object = self.closures.owner(uuid)
+        row = self.task_index.rows.get(uuid)
+        # Rows already walked, so object links that loop end the walk
+        seen = set()
+        while object is None and row is not None and row["uuid"] not in seen:
+            if row["identifier"] == 0:
+                object = row["object"]
+                break
+            seen.add(row["uuid"])
+            row = self.task_index.rows.get(row["object"])
+        self.closures.invalidate(object)
+
+    def publish(self, event_type: str, task: Dict, changed: List[str] = ()):
+        # Sends the task as the index now has it, or as given if it isn't
+        # indexed
+        row = self.task_index.rows.get(task["uuid"], task)
+        task_events.publish({"type": event_type, "changed": list(changed), **row})
+
+    def apply_change(self, event: Dict):
+        # A task change made by another process, read from the task change log
+        changed = [field for field in event["changed"] if field in TASK_FIELDS]
+        if all(field in event for field in TASK_FIELDS):
+            self.task_index.put(event)
+        elif all(field in event for field in changed) and (
+            event["uuid"] in self.task_index.rows or not self.task_index.loaded
+        ):
+            self.task_index.update(
+                event["uuid"], **{field: event[field] for field in changed}
+            )
+        else:
+            # The writer didn't have the whole row, so read it back
+            tasks = self.lookup(
+                "Action", TASK_FIELDS, condition=f"uuid = '{event['uuid']}'"
+            )
+            for task in ResultSet(tasks, TASK_FIELDS).rows():
+                self.task_index.put(task)
+        self.invalidate_closure(event["uuid"])
+        task_events.publish(event)
 
     def next_task_id(self):
         return str(TypeID(prefix="action"))
 
+    def find_tasks(self, **criteria):
+        # Served from the in-process index; criteria are equality matches on
+        # actionStatus, agent and/or object
+        if not self.task_index.loaded:
+            self.load_task_index()
+        return self.task_index.find(**criteria)
+
+    def load_task_index(self):
+        tasks = ResultSet(self.lookup("Action", TASK_FIELDS), TASK_FIELDS)
+        self.task_index.load(list(tasks.rows()))
+        logger.debug(f"Loaded {len(self.task_index.rows)} tasks into the task index")
+
     def get_tasks(self, object=None, condition=None):
+        if object and not condition:
+            closure = self.closures.get(object)
+            if closure is not None:
+                tasks = self.task_index.select(closure)
+                if tasks is not None:
+                    return tasks
+
         conditions = self.prepare_conditions(object, condition)
         return self.fetch_tasks(conditions)
 
@@ -44,21 +175,25 @@ class SingleTaskListStorage(NexusDB):
         return " , ".join(conditions) if conditions else ""
 
     def get_conditions_for_object(self, object):
-        objective_ids = self.get_objective_ids(object)
-        logger.debug(f"Objective IDs: {objective_ids}\n\n\n")
-        if objective_ids == [] or not objective_ids:
-            return [f"object = '{object}'"]
+        closure = self.closures.get(object)
+        if closure is None:
+            generation = self.closures.generation
+            objective_ids = self.get_objective_ids(object)
+            logger.debug(f"Objective IDs: {objective_ids}\n\n\n")
+            if objective_ids == [] or not objective_ids:
+                return [f"object = '{object}'"]
+
+            try:
+                related_uuids = self.get_related_uuids(objective_ids[0])
+            except Exception as e:
+                logger.error(f"Error executing recursive query: {e}")
+                return []
+            closure = self.closures.set(
+                object, [objective_ids[0], *related_uuids], generation
+            )
 
-        try:
-            related_uuids = self.get_related_uuids(objective_ids[0])
-            if related_uuids:
-                uuid_list = ", ".join([f"'{uuid}'" for uuid in related_uuids])
-                return [f"is_in('uuid', [{uuid_list}])"]
-            else:
-                return [f"uuid = '{objective_ids[0]}'"]
-        except Exception as e:
-            logger.error(f"Error executing recursive query: {e}")
-            return []
+        uuid_list = ", ".join([f"'{uuid}'" for uuid in sorted(closure)])
+        return [f"is_in('uuid', [{uuid_list}])"]
 
     def get_objective_ids(self, object=None):
         if object:
@@ -69,7 +204,7 @@ class SingleTaskListStorage(NexusDB):
         else:
             objective = self.lookup("Action", condition="identifier = 0")
             logger.debug(f"Objective: {objective}")
-        return [row[0] for row in json.loads(objective)["rows"]]
+        return ResultSet(objective).first_column()
 
     def get_related_uuids(self, objective_id):
         result = self.recursive_query(
@@ -78,66 +213,20 @@ class SingleTaskListStorage(NexusDB):
             target_field="targetId",
             starting_condition=f"targetId = '{objective_id}'",
         )
-        return [row[0] for row in json.loads(result)["rows"]]
+        return ResultSet(result).first_column()
 
     def fetch_tasks(self, condition_str):
-        fields = [
-            "name",
-            "uuid",
-            "object",
-            "identifier",
-            "actionStatus",
-            "agent",
-            "potentialAction",
-        ]
         if condition_str:
-            tasks = self.lookup("Action", fields, condition=condition_str)
+            tasks = self.lookup("Action", TASK_FIELDS, condition=condition_str)
         else:
-            tasks = self.lookup("Action", fields)
-
-        return self.process_tasks(json.loads(tasks))
+            tasks = self.lookup("Action", TASK_FIELDS)
 
-    def process_tasks(self, tasks):
-
-        logger.debug(f"Processing Tasks from lookup: {tasks}\n\n")
-
-        # Create a dictionary to map UUIDs to task names
-        uuid_to_name = {}
-
-        # First pass: Collect UUIDs and their corresponding task names
-        for task in tasks["rows"]:
-            uuid = task[1]
-            name = task[0]
-            uuid_to_name[uuid] = name
-
-        # Second pass: Construct task data with potentialAction names
-        task_data = {}
-        for task in tasks["rows"]:
-            uuid = task[1]
-
-            potential_actions = None
-            if task[6] != "Null":
-                try:
-                    potential_actions = task[6]
-
-                    action_names = [
-                        uuid_to_name.get(action, action) for action in potential_actions
-                    ]
-
-                except (TypeError, KeyError) as e:
-                    logger.error(f"Error parsing potentialAction for task {uuid}: {e}")
-                    potential_actions = task[6]
-
-            task_data[uuid] = {
-                "name": task[0],
-                "uuid": uuid,
-                "object": task[2],
-                "identifier": task[3],
-                "actionStatus": task[4],
-                "agent": task[5],
-                "potentialAction": action_names if potential_actions else None,
-            }
+        return self.process_tasks(ResultSet(tasks, TASK_FIELDS))
 
+    def process_tasks(self, tasks: ResultSet):
+        # Task dicts, with potentialAction uuids resolved to names, are only
+        # built for the tasks that are read
+        task_data = TaskRows(tasks)
         logger.debug(f"Tasks: {task_data}")
         return task_data
 
@@ -158,21 +247,6 @@ class SingleTaskListStorage(NexusDB):
         for action in potential_actions:
             current_identifier += 1
             task_id = self.next_task_id()
-            self.upsert(
-                "Action",
-                ["uuid", "name", "actionStatus", "identifier", "object", "agent"],
-                [
-                    [
-                        task_id,
-                        action["task"],
-                        "Active",
-                        current_identifier,
-                        current_task_id,
-                        action.get("agent", "Human"),
-                    ]
-                ],
-            )
-
             subtasks.append(task_id)
 
             task_data[task_id] = {
@@ -184,10 +258,26 @@ class SingleTaskListStorage(NexusDB):
                 "agent": action.get("agent", "Human"),
             }
 
-        self.update(
-            "Action",
-            ["uuid", "name", "potentialAction"],
-            [[current_task_id, current_task_name, subtasks]],
+        if self.supports_multi_row_upsert:
+            self.write_subtasks_batched(
+                current_task_id, current_task_name, subtasks, list(task_data.values())
+            )
+        else:
+            self.write_subtasks_per_row(
+                current_task_id, current_task_name, subtasks, list(task_data.values())
+            )
+
+        for task in task_data.values():
+            self.task_index.put(task)
+        self.task_index.update(current_task_id, potentialAction=subtasks)
+        if not self.closures.add_children(current_task_id, subtasks):
+            self.invalidate_closure(current_task_id)
+        for task in task_data.values():
+            self.publish("created", task)
+        self.publish(
+            "updated",
+            {"uuid": current_task_id, "name": current_task_name},
+            ["potentialAction"],
         )
         logger.debug(
             f"Updated potentialAction for task UUID '{current_task_id}' with: {subtasks}"
@@ -195,41 +285,183 @@ class SingleTaskListStorage(NexusDB):
 
         return current_identifier, task_data
 
+    def write_subtasks_batched(
+        self,
+        current_task_id: str,
+        current_task_name: str,
+        subtask_ids: List[str],
+        subtasks: List[Dict],
+    ):
+        # Only the new rows are upserted. The parent's potentialAction is set
+        # with an update, so none of its other columns are rewritten from a
+        # copy that may be stale.
+        response = self.upsert(
+            "Action",
+            SUBTASK_FIELDS,
+            [[subtask[field] for field in SUBTASK_FIELDS] for subtask in subtasks],
+        )
+        if is_error_response(response):
+            logger.warning(
+                f"Multi-row upsert rejected, falling back to per-row writes: {response}"
+            )
+            self.supports_multi_row_upsert = False
+            self.write_subtasks_per_row(
+                current_task_id, current_task_name, subtask_ids, subtasks
+            )
+            return
+
+        self.update(
+            "Action",
+            ["uuid", "name", "potentialAction"],
+            [[current_task_id, current_task_name, subtask_ids]],
+        )
+
+    def write_subtasks_per_row(
+        self,
+        current_task_id: str,
+        current_task_name: str,
+        subtask_ids: List[str],
+        subtasks: List[Dict],
+    ):
+        for subtask in subtasks:
+            self.upsert(
+                "Action",
+                SUBTASK_FIELDS,
+                [[subtask[field] for field in SUBTASK_FIELDS]],
+            )
+
+        self.update(
+            "Action",
+            ["uuid", "name", "potentialAction"],
+            [[current_task_id, current_task_name, subtask_ids]],
+        )
+
     def update_task_status(
         self, task_uuid: str, task_name: str, status: str, result: str
     ):
-        raw_result = f'___"{result}"___'  # formatting like this allows us to store newlines, tabs and other special characters in the databse without breaking the query
+        self.update_task_statuses(
+            [{"uuid": task_uuid, "name": task_name, "status": status, "result": result}]
+        )
+        logger.debug(f"Updated actionStatus for task UUID '{task_uuid}' to '{status}'")
 
-        vector_embeddings = get_ollama_embedding(result)
+    def update_task_statuses(self, updates: List[Dict[str, str]]):
+        # Each update has the same keys as update_task_status' arguments:
+        # uuid, name, status and result
+        if not updates:
+            return
 
-        # Update method here so we don't overwrite any field that is not being updated
+        # The status and result text are committed before returning, so
+        # get_previous_results always sees them. Only the embedding and the
+        # searchable content are written behind.
         self.update(
             "Action",
             ["uuid", "name", "actionStatus", "result"],
-            [[task_uuid, task_name, status, raw_result]],
+            [
+                [
+                    update["uuid"],
+                    update["name"],
+                    update["status"],
+                    raw(update["result"]),
+                ]
+                for update in updates
+            ],
         )
+        for update in updates:
+            if update["uuid"] not in self.task_index.rows:
+                # Written by another process, so cached closures may be
+                # missing its subtasks as well
+                self.invalidate_closure(update["uuid"])
+            self.task_index.update(update["uuid"], actionStatus=update["status"])
+            self.publish(
+                "updated",
+                {
+                    "uuid": update["uuid"],
+                    "name": update["name"],
+                    "actionStatus": update["status"],
+                },
+                ["actionStatus", "result"],
+            )
 
-        # Need to do this part separately because Update will fail if the text field does not already exist
-        self.upsert(
-            "Action",
-            text=raw_result,
-            embeddings=vector_embeddings,
-            references=[["Action", [task_uuid]]],
-        )
-        logger.debug(f"Updated actionStatus for task UUID '{task_uuid}' to '{status}'")
+        results = [(update["uuid"], update["result"]) for update in updates]
+        if self.result_writer is not None:
+            for uuid, result in results:
+                self.result_writer.submit(uuid, result)
+        else:
+            self.write_result_vectors(results)
+        logger.debug(f"Updated actionStatus for {len(updates)} tasks")
+
+    def write_result_vectors(self, results: List[tuple]):
+        embeddings = get_ollama_embeddings([result for _, result in results])
+
+        # Need to do this part separately because Update will fail if the text
+        # field does not already exist. Searchable content only holds one
+        # text/vector pair per request.
+        for (uuid, result), embedding in zip(results, embeddings):
+            self.upsert(
+                "Action",
+                text=raw(result),
+                embeddings=embedding,
+                references=[["Action", [uuid]]],
+            )
+            if self.vector_index is not None:
+                self.vector_index.add(uuid, result, embedding)
 
     def get_previous_results(self, email_id: str):
         results = self.lookup("Action", ["result"], condition=f"object = '{email_id}'")
-        results = json.loads(results)
-        return [result[0] for result in results["rows"]]
+        return ResultSet(results, ["result"]).column("result")
 
-    def get_context(self, query: str, top_results_num: int):
-        query_embedding = get_ollama_embedding(query)
+    def get_context(
+        self,
+        query: str,
+        top_results_num: int,
+        query_embedding: List[float] | None = None,
+    ):
+        if query_embedding is None:
+            query_embedding = get_ollama_embedding(query)
+        if self.vector_index is not None:
+            if self.vector_index.seeded:
+                return [
+                    text.strip('"')
+                    for _, text in self.vector_index.search(
+                        query_embedding, top_results_num
+                    )
+                ]
+            # Until the local index holds the results already in NexusDB,
+            # search NexusDB so they stay in context
+            self.seed_vector_index()
+        return self.get_remote_context(query, top_results_num, query_embedding)
+
+    def seed_vector_index(self):
+        with self.vector_index_seeding:
+            if self.vector_index_seeder is not None:
+                return
+            self.vector_index_seeder = threading.Thread(
+                target=self._seed_vector_index, daemon=True, name="VectorIndexSeed"
+            )
+            self.vector_index_seeder.start()
+
+    def _seed_vector_index(self):
+        try:
+            self.rebuild_vector_index()
+        except Exception as e:
+            logger.error(f"Failed to seed local vector index: {e}", exc_info=True)
+            # Let the next get_context try again
+            with self.vector_index_seeding:
+                self.vector_index_seeder = None
+
+    def get_remote_context(
+        self,
+        query: str,
+        top_results_num: int,
+        query_embedding: List[float] | None = None,
+    ):
+        if query_embedding is None:
+            query_embedding = get_ollama_embedding(query)
         results = self.vector_search(
             query_vector=query_embedding, number_of_results=top_results_num
         )
         try:
-            results = json.loads(results)
+            results = loads(results)
         except json.JSONDecodeError as e:
             logger.error(f"Failed to decode JSON results: {e}")
             return []
@@ -245,3 +477,40 @@ class SingleTaskListStorage(NexusDB):
                 context_text = row[1]
                 context_list.append(context_text.strip('"'))
         return context_list
+
+    def completed_results(self) -> List[tuple]:
+        results = ResultSet(
+            self.lookup(
+                "Action", ["uuid", "result"], condition="actionStatus = 'Complete'"
+            ),
+            ["uuid", "result"],
+        )
+        return [
+            (uuid, result.removeprefix('___"').removesuffix('"___'))
+            for uuid, result in zip(results.column("uuid"), results.column("result"))
+            if isinstance(result, str)
+        ]
+
+    def reembed_results(self):
+        # Vectors stored before embeddings were scaled to unit length are raw
+        # /api/embeddings output; write every result's vector again so NexusDB
+        # searches compare like with like
+        rows = self.completed_results()
+        self.write_result_vectors(rows)
+        logger.info(f"Re-embedded {len(rows)} results")
+
+    def rebuild_vector_index(self):
+        # Backfill the local index from results already stored in NexusDB
+        if self.vector_index is None:
+            return
+        rows = self.completed_results()
+        embeddings = get_ollama_embeddings([result for _, result in rows])
+        for (uuid, result), embedding in zip(rows, embeddings):
+            self.vector_index.add(uuid, result, embedding)
+        self.vector_index.seeded = True
+        self.vector_index.save()
+        logger.info(f"Rebuilt local vector index with {len(rows)} results")
+
+
+class InMemoryTaskListStorage(SingleTaskListStorage, InMemoryNexusDB):
+    pass
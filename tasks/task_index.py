@@ -0,0 +1,179 @@
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+TASK_FIELDS = [
+    "name",
+    "uuid",
+    "object",
+    "identifier",
+    "actionStatus",
+    "agent",
+    "potentialAction",
+]
+
+INDEXED_FIELDS = ["actionStatus", "agent", "object"]
+
+
+class TaskIndex:
+    """
+    In-process mirror of the Action relation. Rows are keyed by uuid, with
+    secondary indexes on actionStatus, agent and object so filtered reads
+    only touch the matching rows.
+    """
+
+    def __init__(self):
+        self.rows: Dict[str, Dict] = {}
+        # Insertion order, so reads list tasks in the order they were created
+        self.sequence: Dict[str, int] = {}
+        self.indexes: Dict[str, Dict[object, Set[str]]] = {
+            field: defaultdict(set) for field in INDEXED_FIELDS
+        }
+        self.lock = threading.RLock()
+        self.loaded = False
+        # Updates to rows not seen yet, made while the first load was running
+        self.pending: Dict[str, Dict] = {}
+
+    def _unindex(self, row: Dict):
+        for field in INDEXED_FIELDS:
+            uuids = self.indexes[field].get(row.get(field))
+            if uuids is not None:
+                uuids.discard(row["uuid"])
+                if not uuids:
+                    del self.indexes[field][row.get(field)]
+
+    def _index(self, row: Dict):
+        for field in INDEXED_FIELDS:
+            self.indexes[field][row.get(field)].add(row["uuid"])
+
+    def put(self, task: Dict):
+        row = {field: task.get(field) for field in TASK_FIELDS}
+        if row["potentialAction"] == "Null":
+            row["potentialAction"] = None
+        with self.lock:
+            self.pending.pop(row["uuid"], None)
+            existing = self.rows.get(row["uuid"])
+            if existing:
+                self._unindex(existing)
+            else:
+                self.sequence[row["uuid"]] = len(self.sequence)
+            self.rows[row["uuid"]] = row
+            self._index(row)
+
+    def update(self, uuid: str, **fields):
+        with self.lock:
+            row = self.rows.get(uuid)
+            if row is None:
+                if not self.loaded:
+                    self.pending.setdefault(uuid, {}).update(fields)
+                return
+            self._unindex(row)
+            row.update(fields)
+            self._index(row)
+
+    def load(self, rows: List[Dict]):
+        # Rows already present were written by this process after the snapshot
+        # was taken, so they are at least as new as what the database returned
+        with self.lock:
+            for row in rows:
+                if row["uuid"] not in self.rows:
+                    fields = self.pending.pop(row["uuid"], None)
+                    self.put(row)
+                    if fields:
+                        self.update(row["uuid"], **fields)
+            self.pending.clear()
+            self.loaded = True
+
+    def select(self, uuids) -> Optional[Dict[str, Dict]]:
+        # Returns None unless every requested row is present
+        with self.lock:
+            if any(uuid not in self.rows for uuid in uuids):
+                return None
+            return {
+                uuid: self._resolve(self.rows[uuid])
+                for uuid in sorted(uuids, key=self.sequence.__getitem__)
+            }
+
+    def find(self, **criteria) -> Dict[str, Dict]:
+        with self.lock:
+            uuids: Optional[Set[str]] = None
+            for field, value in criteria.items():
+                if field not in self.indexes:
+                    raise ValueError(f"Field '{field}' is not indexed")
+                matches = self.indexes[field].get(value, set())
+                uuids = set(matches) if uuids is None else uuids & matches
+            if uuids is None:
+                uuids = self.rows.keys()
+
+            return {
+                uuid: self._resolve(self.rows[uuid])
+                for uuid in sorted(uuids, key=self.sequence.__getitem__)
+            }
+
+    def _resolve(self, row: Dict) -> Dict:
+        task = dict(row)
+        if row["potentialAction"]:
+            task["potentialAction"] = [
+                self.rows[action]["name"] if action in self.rows else action
+                for action in row["potentialAction"]
+            ]
+        return task
+
+
+class ClosureCache:
+    """
+    Maps an objective's object (the email id) to the uuids of the objective
+    and every subtask beneath it. Entries are created from the recursive Graph
+    query or when the objective is appended, then extended as subtasks are
+    added, so repeat reads don't need the recursive query. Writes the cache
+    can't apply exactly invalidate the affected entry and bump `generation`,
+    so a recursive query that was already running isn't cached.
+    """
+
+    def __init__(self):
+        self.closures: Dict[str, Set[str]] = {}
+        self.owners: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, object: str) -> Optional[Set[str]]:
+        with self.lock:
+            closure = self.closures.get(object)
+            return set(closure) if closure is not None else None
+
+    def set(self, object: str, uuids, generation: int | None = None) -> Set[str]:
+        # `generation` is the value read before querying the uuids
+        with self.lock:
+            closure = set(uuids)
+            if generation is not None and generation != self.generation:
+                return closure
+            self._drop(object)
+            self.closures[object] = closure
+            for uuid in closure:
+                self.owners[uuid] = object
+            return set(closure)
+
+    def add_children(self, parent_uuid: str, child_uuids: List[str]) -> bool:
+        with self.lock:
+            object = self.owners.get(parent_uuid)
+            if object is None:
+                return False
+            self.closures[object].update(child_uuids)
+            for uuid in child_uuids:
+                self.owners[uuid] = object
+            return True
+
+    def owner(self, uuid: str) -> Optional[str]:
+        with self.lock:
+            return self.owners.get(uuid)
+
+    def invalidate(self, object: str | None = None):
+        with self.lock:
+            self.generation += 1
+            if object is not None:
+                self._drop(object)
+
+    def _drop(self, object: str):
+        for uuid in self.closures.pop(object, ()):
+            if self.owners.get(uuid) == object:
+                del self.owners[uuid]
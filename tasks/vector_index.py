@@ -0,0 +1,195 @@
+import atexit
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+try:
+    import hnswlib
+except ImportError:  # pragma: no cover - optional dependency
+    hnswlib = None
+
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "false").lower() == "true"
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", ".cache/vector_index")
+VECTOR_INDEX_HNSW_THRESHOLD = int(os.getenv("VECTOR_INDEX_HNSW_THRESHOLD", 10000))
+VECTOR_INDEX_EF = int(os.getenv("VECTOR_INDEX_EF", 128))
+
+# Persist after this many additions, on top of the save at interpreter exit
+SAVE_EVERY = 50
+
+
+class LocalVectorIndex:
+    """
+    Cosine-similarity index over Action result embeddings. Small corpora are
+    searched with a NumPy matrix product; once the corpus passes
+    `hnsw_threshold` vectors an HNSW graph is built (if hnswlib is installed)
+    and used for queries instead.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = VECTOR_INDEX_DIR,
+        hnsw_threshold: int = VECTOR_INDEX_HNSW_THRESHOLD,
+        ef_search: int = VECTOR_INDEX_EF,
+    ):
+        if np is None:
+            raise ImportError("numpy is required for the local vector index")
+        self.directory = directory
+        self.hnsw_threshold = hnsw_threshold
+        self.ef_search = ef_search
+        self.lock = threading.RLock()
+
+        self.uuids: List[str] = []
+        self.texts: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.vectors = None
+        self.hnsw = None
+        self.unsaved = 0
+        # Set once every result already in NexusDB has been added
+        self.seeded = False
+
+        if directory:
+            self.load()
+            atexit.register(self.save)
+
+    def __len__(self):
+        return len(self.uuids)
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, uuid: str, text: str, embedding: List[float]):
+        vector = self._normalize(embedding)
+        with self.lock:
+            position = self.positions.get(uuid)
+            if position is None:
+                position = len(self.uuids)
+                self._grow(position + 1, vector.shape[0])
+                self.uuids.append(uuid)
+                self.texts.append(text)
+                self.positions[uuid] = position
+            else:
+                self.texts[position] = text
+
+            self.vectors[position] = vector
+            if self.hnsw is not None:
+                self._hnsw_add([position])
+            elif hnswlib is not None and len(self.uuids) >= self.hnsw_threshold:
+                self._build_hnsw()
+
+            self.unsaved += 1
+            if self.directory and self.unsaved >= SAVE_EVERY:
+                self.save()
+
+    def _grow(self, size: int, dim: int):
+        if self.vectors is None:
+            self.vectors = np.zeros((max(size, 64), dim), dtype=np.float32)
+        elif size > self.vectors.shape[0]:
+            grown = np.zeros((self.vectors.shape[0] * 2, dim), dtype=np.float32)
+            grown[: self.vectors.shape[0]] = self.vectors
+            self.vectors = grown
+
+    def _build_hnsw(self):
+        count, dim = len(self.uuids), self.vectors.shape[1]
+        logger.info(f"Building HNSW vector index over {count} results")
+        self.hnsw = hnswlib.Index(space="cosine", dim=dim)
+        self.hnsw.init_index(max_elements=max(count * 2, 1024), ef_construction=200)
+        self.hnsw.set_ef(self.ef_search)
+        self._hnsw_add(range(count))
+
+    def _hnsw_add(self, positions):
+        positions = list(positions)
+        needed = max(positions) + 1
+        if needed > self.hnsw.get_max_elements():
+            self.hnsw.resize_index(needed * 2)
+        # Re-adding an existing label replaces its vector
+        self.hnsw.add_items(self.vectors[positions], positions)
+
+    def search(self, query_embedding: List[float], k: int) -> List[Tuple[str, str]]:
+        query = self._normalize(query_embedding)
+        with self.lock:
+            count = len(self.uuids)
+            if not count:
+                return []
+            k = min(k, count)
+            if self.hnsw is not None:
+                labels, _ = self.hnsw.knn_query(query, k=k)
+                positions = labels[0]
+            else:
+                scores = self.vectors[:count] @ query
+                positions = np.argpartition(-scores, k - 1)[:k]
+                positions = positions[np.argsort(-scores[positions])]
+            return [(self.uuids[p], self.texts[p]) for p in positions]
+
+    def save(self):
+        if not self.directory:
+            return
+        with self.lock:
+            if not self.uuids and not self.seeded:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            vectors = self.vectors
+            if vectors is None:
+                vectors = np.zeros((0, 0), dtype=np.float32)
+            np.save(
+                os.path.join(self.directory, "vectors.npy"),
+                vectors[: len(self.uuids)],
+            )
+            with open(os.path.join(self.directory, "meta.json.tmp"), "w") as f:
+                json.dump(
+                    {"uuids": self.uuids, "texts": self.texts, "seeded": self.seeded},
+                    f,
+                )
+            os.replace(
+                os.path.join(self.directory, "meta.json.tmp"),
+                os.path.join(self.directory, "meta.json"),
+            )
+            if self.hnsw is not None:
+                self.hnsw.save_index(os.path.join(self.directory, "hnsw.bin"))
+            self.unsaved = 0
+
+    def load(self):
+        meta_path = os.path.join(self.directory, "meta.json")
+        vectors_path = os.path.join(self.directory, "vectors.npy")
+        if not (os.path.exists(meta_path) and os.path.exists(vectors_path)):
+            return
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            vectors = np.load(vectors_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load local vector index, starting empty: {e}")
+            return
+        if len(meta["uuids"]) != vectors.shape[0]:
+            logger.error("Local vector index files disagree, starting empty")
+            return
+        self.seeded = meta.get("seeded", False)
+        if not meta["uuids"]:
+            return
+
+        self.uuids, self.texts = meta["uuids"], meta["texts"]
+        self.positions = {uuid: i for i, uuid in enumerate(self.uuids)}
+        self._grow(len(self.uuids), vectors.shape[1])
+        self.vectors[: len(self.uuids)] = vectors
+
+        hnsw_path = os.path.join(self.directory, "hnsw.bin")
+        if hnswlib is not None and len(self.uuids) >= self.hnsw_threshold:
+            if os.path.exists(hnsw_path):
+                self.hnsw = hnswlib.Index(space="cosine", dim=vectors.shape[1])
+                self.hnsw.load_index(hnsw_path, max_elements=len(self.uuids) * 2)
+                self.hnsw.set_ef(self.ef_search)
+            if self.hnsw is None or self.hnsw.get_current_count() != len(self.uuids):
+                self._build_hnsw()
+        logger.info(f"Loaded local vector index with {len(self.uuids)} results")
@@ -0,0 +1,109 @@
+import atexit
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+# Load .env before importing the engines, since they read settings at import time
+load_dotenv()
+
+from tasks import async_processor, pipeline, processor  # noqa: E402
+from tasks.change_log import TaskChangeLog  # noqa: E402
+from tasks.events import task_events  # noqa: E402
+from utils.custom_log_formatter import ThreadNameColoredFormatter  # noqa: E402
+from utils.embedding_cache import EMBEDDING_CACHE_DIR  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# "threads" runs a thread per email, "asyncio" runs emails as coroutines,
+# "pipeline" runs each step of an email in its own pool of workers
+PROCESSING_ENGINE = os.getenv("PROCESSING_ENGINE", "threads")
+# Separate processes consuming the email queue. With 0, emails are processed in
+# the app's own process.
+EMAIL_WORKER_PROCESSES = int(os.getenv("EMAIL_WORKER_PROCESSES", 0))
+
+started = False
+start_lock = threading.Lock()
+
+
+def start_processing():
+    if PROCESSING_ENGINE == "asyncio":
+        async_processor.start_processing()
+    elif PROCESSING_ENGINE == "pipeline":
+        pipeline.start_processing()
+    else:
+        processor.start_processing()
+
+
+def start():
+    # Starts email processing once per process: here, or in worker processes
+    # whose task changes are followed through the task change log
+    global started
+    with start_lock:
+        if started:
+            return
+        started = True
+    if EMAIL_WORKER_PROCESSES:
+        # Changes the workers make from the moment they start are followed
+        change_log = TaskChangeLog()
+        last_id = change_log.last_id()
+        start_worker_processes()
+        follow_task_changes(change_log, last_id)
+    else:
+        start_processing()
+
+
+def worker_environment(number: int):
+    # A local vector index only holds the results its own process wrote, so
+    # workers search NexusDB, which has every worker's results
+    environment = {**os.environ, "LOCAL_VECTOR_INDEX": "false"}
+    if EMBEDDING_CACHE_DIR:
+        # The on-disk embedding cache has a single writer, so each worker keeps
+        # its own, reused by the worker with the same number next time
+        environment["EMBEDDING_CACHE_DIR"] = os.path.join(
+            EMBEDDING_CACHE_DIR, f"worker-{number}"
+        )
+    return environment
+
+
+def start_worker_processes(count: int = EMAIL_WORKER_PROCESSES):
+    logger.info(f"Starting {count} {PROCESSING_ENGINE} worker processes")
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "tasks.worker"], env=worker_environment(number)
+        )
+        for number in range(count)
+    ]
+
+    def stop():
+        for worker in workers:
+            worker.terminate()
+
+    atexit.register(stop)
+    return workers
+
+
+def follow_task_changes(change_log: TaskChangeLog, last_id: int):
+    threading.Thread(
+        target=change_log.follow,
+        args=(processor.tasks_storage.apply_change, last_id),
+        daemon=True,
+        name="TaskChangeLog",
+    ).start()
+
+
+if __name__ == "__main__":
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        ThreadNameColoredFormatter(
+            "%(log_color)s[worker %(process)d %(threadName)s] - %(message)s"
+        )
+    )
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.INFO)
+    task_events.subscribe(TaskChangeLog().append)
+    start_processing()
+    threading.Event().wait()
@@ -0,0 +1,51 @@
+import time
+
+from tasks.storage import SingleTaskListStorage
+
+# Compares the per-row and batched add_subtasks write paths with a fixed
+# simulated round-trip time per NexusDB call
+LATENCY = 0.05
+PLAN_SIZES = [1, 5, 10, 20]
+
+
+class LatencyStorage(SingleTaskListStorage):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def _round_trip(self, *args, **kwargs):
+        self.calls += 1
+        time.sleep(LATENCY)
+        return "{}"
+
+    insert = upsert = update = _round_trip
+
+
+def run(batched, plan_size):
+    storage = LatencyStorage()
+    storage.supports_multi_row_upsert = batched
+    storage.task_index.put(
+        {
+            "uuid": "action_parent",
+            "name": "Parent",
+            "object": "email",
+            "identifier": 0,
+            "actionStatus": "Active",
+            "agent": "AI",
+        }
+    )
+    actions = [{"task": f"Step {i}", "agent": "AI"} for i in range(plan_size)]
+
+    start = time.perf_counter()
+    storage.add_subtasks("action_parent", "Parent", actions, 0)
+    return time.perf_counter() - start, storage.calls
+
+
+for plan_size in PLAN_SIZES:
+    per_row_time, per_row_calls = run(False, plan_size)
+    batched_time, batched_calls = run(True, plan_size)
+    print(
+        f"{plan_size:>3} subtasks  per-row: {per_row_calls:>2} calls {per_row_time:.3f}s"
+        f"  batched: {batched_calls} calls {batched_time:.3f}s"
+        f"  speedup: {per_row_time / batched_time:.1f}x"
+    )
@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+
+os.environ.setdefault("NEXUSDB_BACKEND", "memory")
+os.environ.setdefault("NEXUSDB_LATENCY_MS", "20")
+os.environ.setdefault("LLM_CACHE_AGENTS", "")
+os.environ["EMAIL_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(), "emails.sqlite3")
+# The fake query embeddings must not reach the real embedding cache
+os.environ["EMBEDDING_CACHE_DISK_MB"] = "0"
+
+import tasks.storage as storage_module  # noqa: E402
+import utils.ollama as ollama_module  # noqa: E402
+from integrations.email.fetcher import email_queue  # noqa: E402
+from tasks import async_processor  # noqa: E402
+from tasks.async_storage import NEXUSDB_CONCURRENCY  # noqa: E402
+from utils.llm_scheduler import OLLAMA_CONCURRENCY  # noqa: E402
+
+# Runs thousands of emails through the asyncio engine at once, against the
+# in-memory NexusDB backend and a stand-in for ollama.AsyncClient that streams
+# a canned reply after LLM_LATENCY seconds.
+EMAILS = 2000
+LLM_LATENCY = 0.05
+
+
+def fake_embedding(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [byte / 255 for byte in digest]
+
+
+class FakeAsyncClient:
+    async def _stream(self, text):
+        await asyncio.sleep(LLM_LATENCY)
+        for word in text.split(" "):
+            yield {"response": word + " ", "message": {"content": word + " "}}
+
+    async def generate(self, model, prompt, system="", stream=False, **kwargs):
+        if "determine if the email contains any actionable tasks" in system:
+            return self._stream("Reply to the sender")
+        return self._stream("Done")
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        return self._stream('{"entities": []}')
+
+    async def embeddings(self, model, prompt, **kwargs):
+        return {"embedding": fake_embedding(prompt)}
+
+
+storage_module.get_ollama_embedding = fake_embedding
+storage_module.get_ollama_embeddings = lambda texts: [fake_embedding(t) for t in texts]
+ollama_module.async_client = FakeAsyncClient()
+
+
+async def main():
+    emails = [
+        {
+            "Message-ID": f"<load-{i}@example.com>",
+            "Subject": f"Load test {i}",
+            "To": "me@example.com",
+            "From": "sender@example.com",
+            "Timestamp": "2024-01-01T00:00:00",
+            "Body": f"Please reply to message {i}.",
+        }
+        for i in range(EMAILS)
+    ]
+    for email_data in emails:
+        email_queue.put(email_data)
+    leased = [email_queue.get() for _ in emails]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(async_processor.process_email(e) for e in leased))
+    await asyncio.to_thread(async_processor.entity_pool.flush)
+    async_processor.tasks_storage.result_writer.flush()
+    elapsed = time.perf_counter() - start
+
+    completed = async_processor.tasks_storage.find_tasks(actionStatus="Complete")
+    print(
+        f"{EMAILS} emails in {elapsed:.2f}s ({EMAILS / elapsed:.0f} emails/s), "
+        f"{len(completed)} tasks completed, "
+        f"Ollama concurrency {OLLAMA_CONCURRENCY}, "
+        f"NexusDB concurrency {NEXUSDB_CONCURRENCY}"
+    )
+
+
+asyncio.run(main())
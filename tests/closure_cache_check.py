@@ -0,0 +1,60 @@
+import os
+
+os.environ.setdefault("NEXUSDB_BACKEND", "memory")
+os.environ["RESULT_WRITERS"] = "0"
+
+import tasks.storage as storage_module  # noqa: E402
+from tasks.storage import InMemoryTaskListStorage  # noqa: E402
+
+# Checks that get_tasks' cached closures follow writes: subtasks added under a
+# cached objective appear in its closure, a recursive query that raced a write
+# isn't cached, and a status update for a task this process hasn't seen drops
+# the closure so the next read queries NexusDB again.
+storage_module.get_ollama_embeddings = lambda texts: [[1.0, 0.0] for _ in texts]
+
+
+def objective(storage, email_id):
+    task = {
+        "uuid": storage.next_task_id(),
+        "name": f"Objective for {email_id}",
+        "agent": "AI",
+        "actionStatus": "Active",
+        "identifier": 0,
+        "object": email_id,
+    }
+    storage.append(task)
+    return task
+
+
+storage = InMemoryTaskListStorage()
+
+# Subtasks added under a cached objective extend its closure
+primary = objective(storage, "email-1")
+before = storage.closures.get("email-1")
+_, subtasks = storage.add_subtasks(
+    primary["uuid"], primary["name"], [{"task": "Draft reply", "agent": "AI"}], 0
+)
+after = storage.closures.get("email-1")
+assert after == before | set(subtasks), (before, after)
+assert set(storage.get_tasks(object="email-1")) == after
+
+# A recursive query that started before a write isn't cached
+primary = objective(storage, "email-2")
+storage.closures.invalidate("email-2")
+generation = storage.closures.generation
+storage.add_subtasks(
+    primary["uuid"], primary["name"], [{"task": "Find invoice", "agent": "AI"}], 0
+)
+storage.closures.set("email-2", [primary["uuid"]], generation)
+assert storage.closures.get("email-2") is None
+
+# A status update for a task another process created drops its closure
+primary = objective(storage, "email-3")
+storage.closures.add_children(primary["uuid"], ["action_from_another_process"])
+storage.task_index.rows.pop("action_from_another_process", None)
+storage.update_task_status(
+    "action_from_another_process", "Elsewhere", "Complete", "Done elsewhere"
+)
+assert storage.closures.get("email-3") is None
+
+print("Closure cache follows subtask and status writes")
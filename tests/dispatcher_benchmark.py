@@ -0,0 +1,77 @@
+import threading
+import time
+from queue import Queue
+
+from tasks.dispatcher import EmailDispatcher
+
+# Compares the old email_processor loop, which polls its threads while every
+# worker is busy and keys in-flight emails by Subject, with EmailDispatcher.
+# Each email takes WORK seconds of (idle) processing; half the emails share a
+# subject. Reports CPU used by the process over the same window and how many
+# emails were processed.
+WORKERS = 4
+EMAILS = 40
+WORK = 0.2
+WINDOW = 3.0
+
+
+def make_queue():
+    queue = Queue()
+    for i in range(EMAILS):
+        subject = "Re: Invoice" if i % 2 else f"Request {i}"
+        queue.put({"Message-ID": f"<{i}@example.com>", "Subject": subject})
+    return queue
+
+
+def old_email_processor(queue, process_email, stop):
+    active_threads = {}
+    while not stop.is_set():
+        if len(active_threads) < WORKERS:
+            email_data = queue.get()
+            email_id = email_data["Subject"]
+            if email_id not in active_threads:
+                thread = threading.Thread(
+                    target=process_email, args=(email_data,), daemon=True
+                )
+                active_threads[email_id] = thread
+                thread.start()
+        for email_id, thread in list(active_threads.items()):
+            if not thread.is_alive():
+                del active_threads[email_id]
+
+
+def measure(label, start_loop):
+    processed = []
+
+    def process_email(email_data):
+        time.sleep(WORK)
+        processed.append(email_data["Message-ID"])
+
+    queue = make_queue()
+    cpu, wall = time.process_time(), time.perf_counter()
+    extra = start_loop(queue, process_email)
+    time.sleep(WINDOW)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    print(
+        f"{label:>10}: {len(processed)}/{EMAILS} emails processed,"
+        f" {cpu / wall:.0%} of a core used over {wall:.1f}s {extra()}"
+    )
+
+
+def start_old(queue, process_email):
+    stop = threading.Event()
+    threading.Thread(
+        target=old_email_processor, args=(queue, process_email, stop), daemon=True
+    ).start()
+    return lambda: stop.set() or ""
+
+
+def start_new(queue, process_email):
+    dispatcher = EmailDispatcher(queue, process_email, workers=WORKERS)
+    threading.Thread(target=dispatcher.run, daemon=True).start()
+    return lambda: f"\n{'':>12}{dispatcher.stats()}"
+
+
+measure("old loop", start_old)
+measure("dispatcher", start_new)
@@ -0,0 +1,50 @@
+import os
+import time
+
+os.environ.setdefault("LLM_CACHE_AGENTS", "")
+
+import utils.ollama as ollama_module  # noqa: E402
+from tasks.agents import NO_TASKS_FOUND  # noqa: E402
+from tasks.execution import MORE_CONTEXT_NEEDED  # noqa: E402
+
+# A model that gives its answer and then keeps talking. Compares reading the
+# whole stream with stopping at the registered sentinel for each agent.
+TOKEN_DELAY = 0.01
+RAMBLE_TOKENS = 100
+
+
+class RamblingClient:
+    def __init__(self, answer):
+        self.answer = answer
+        self.tokens_sent = 0
+        self.options = None
+
+    def generate(self, model, prompt, options=None, **kwargs):
+        self.options = options
+        return self._stream()
+
+    def _stream(self):
+        words = self.answer.split(" ") + ["and", "also"] * (RAMBLE_TOKENS // 2)
+        for word in words:
+            time.sleep(TOKEN_DELAY)
+            self.tokens_sent += 1
+            yield {"response": word + " ", "done": False}
+        yield {"response": "", "done": True}
+
+
+for agent, answer in [
+    ("execution", MORE_CONTEXT_NEEDED),
+    ("objective", NO_TASKS_FOUND),
+]:
+    for label, agent_name in [("full stream", None), ("sentinel", agent)]:
+        fake = RamblingClient(answer)
+        ollama_module.client = fake
+        start = time.perf_counter()
+        response = ollama_module.ollama_generate(
+            "llama3", "prompt", stream=True, agent=agent_name
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            f"{agent:>9} {label:>11}: {elapsed:.3f}s, {fake.tokens_sent} tokens read,"
+            f" options={fake.options}, response={response[:40]!r}"
+        )
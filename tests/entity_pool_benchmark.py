@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+from tasks.entity_pool import EntityExtractionPool
+
+# Compares the old one-thread-per-email entity extraction with
+# EntityExtractionPool during a burst of emails. The model serves
+# MODEL_PARALLEL requests at a time; each extraction takes WORK seconds (the
+# system prompt and few-shot example) plus PER_CHAR seconds per character of
+# body. Emails come from SENDERS senders, and like Gmail's every one carries a
+# thread id, shared by the REPLIES emails of a conversation. Reports how
+# many extractions ran, how many were in flight at once and how long the burst
+# took to drain.
+EMAILS = 200
+SENDERS = 10
+REPLIES = 3
+MODEL_PARALLEL = 2
+WORK = 0.02
+PER_CHAR = 0.00002
+BODY = "Please forward the signed contract to Jane Doe at Acme Corp. " * 4
+
+
+def make_emails():
+    return [
+        {
+            "Message-ID": f"<{i}@example.com>",
+            "Thread-ID": f"thread-{i // REPLIES}",
+            "From": f"sender{i % SENDERS}@example.com",
+            "Body": BODY,
+        }
+        for i in range(EMAILS)
+    ]
+
+
+class Extractor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+        self.model = threading.Semaphore(MODEL_PARALLEL)
+
+    def __call__(self, email_data):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        with self.model:
+            time.sleep(WORK + PER_CHAR * len(email_data["Body"]))
+        with self.lock:
+            self.running -= 1
+
+
+def run_threads():
+    extract = Extractor()
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=extract, args=(email_data,), daemon=True)
+        for email_data in make_emails()
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return extract, time.perf_counter() - start, ""
+
+
+def run_pool(**kwargs):
+    extract = Extractor()
+    pool = EntityExtractionPool(extract, **kwargs)
+    start = time.perf_counter()
+    for email_data in make_emails():
+        pool.submit(email_data)
+    pool.flush()
+    return extract, time.perf_counter() - start, f"\n{'':>22}{pool.stats()}"
+
+
+logging.disable(logging.WARNING)
+for label, run in [
+    ("threads", run_threads),
+    ("pool", lambda: run_pool(workers=2)),
+    ("pool, no merging", lambda: run_pool(workers=2, merge_max_chars=0)),
+    (
+        "pool, depth 20",
+        lambda: run_pool(workers=2, max_pending=20, merge_max_chars=0),
+    ),
+]:
+    extract, elapsed, stats = run()
+    print(
+        f"{label:>20}: {extract.calls} extractions, {extract.peak} in flight at once,"
+        f" drained in {elapsed:.2f}s{stats}"
+    )
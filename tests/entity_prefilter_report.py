@@ -0,0 +1,88 @@
+from tasks.entity_index import EntityIndex
+
+# Labeled sample for the entity pre-filter: existing entities, and extracted
+# entities with the uuid they should resolve to (None for a new entity).
+# Reports how many dedup LLM calls the pre-filter avoids compared with sending
+# every entity that has a str_includes candidate to the model, and whether the
+# entities it settles on its own are settled correctly.
+EXISTING = {
+    "Person": [
+        {"uuid": "person_1", "name": "John Smith", "description": "IT admin"},
+        {"uuid": "person_2", "name": "Jane Doe", "description": "HR lead"},
+        {"uuid": "person_3", "name": "John Carter", "description": "Sales"},
+        {"uuid": "person_4", "name": "Priya Raman", "description": "Engineer"},
+        {"uuid": "person_5", "name": "María López", "description": "Finance"},
+    ],
+    "Organization": [
+        {"uuid": "org_1", "name": "Electronic Arts", "description": "Games"},
+        {"uuid": "org_2", "name": "Acme Corp.", "description": "Supplier"},
+        {"uuid": "org_3", "name": "International Business Machines"},
+        {"uuid": "org_4", "name": "IT", "description": "IT department"},
+        {"uuid": "org_5", "name": "The Finance Team", "description": "Finance"},
+        {"uuid": "org_6", "name": "Intel Technologies", "description": "Vendor"},
+    ],
+    "Project": [
+        {"uuid": "project_1", "name": "IT Modernization", "description": "Infra"},
+        {"uuid": "project_2", "name": "Atlas Migration", "description": "Cloud"},
+    ],
+}
+
+SAMPLE = [
+    ({"type": "Person", "name": "John Smith"}, "person_1"),
+    ({"type": "Person", "name": "Jane Doe"}, "person_2"),
+    ({"type": "Person", "name": "John"}, "person_1"),
+    ({"type": "Person", "name": "Priya Raman"}, "person_4"),
+    ({"type": "Person", "name": "Maria Lopez"}, "person_5"),
+    ({"type": "Person", "name": "Dev Patel"}, None),
+    ({"type": "Person", "name": "Sam Green"}, None),
+    ({"type": "Organization", "name": "EA"}, "org_1"),
+    ({"type": "Organization", "name": "Electronic Arts Inc"}, "org_1"),
+    ({"type": "Organization", "name": "Acme Corporation"}, "org_2"),
+    ({"type": "Organization", "name": "IBM"}, "org_3"),
+    ({"type": "Organization", "name": "IT"}, "org_4"),
+    ({"type": "Organization", "name": "Finance Team"}, "org_5"),
+    ({"type": "Organization", "name": "Information Technology"}, "org_4"),
+    ({"type": "Organization", "name": "Globex"}, None),
+    ({"type": "Organization", "name": "Initech"}, None),
+    ({"type": "Project", "name": "IT Modernization"}, "project_1"),
+    ({"type": "Project", "name": "Atlas"}, "project_2"),
+    ({"type": "Project", "name": "Hermes Rollout"}, None),
+]
+
+
+def str_includes_candidates(entity):
+    return [row for row in EXISTING[entity["type"]] if entity["name"] in row["name"]]
+
+
+index = EntityIndex(ttl=float("inf"))
+for entity_type, rows in EXISTING.items():
+    index.load(entity_type, rows)
+
+entities = [entity for entity, _ in SAMPLE]
+resolved, ambiguous = index.prefilter(entities, limit=10)
+
+baseline_calls = sum(1 for entity in entities if str_includes_candidates(entity))
+settled_correctly = sum(1 for i, uuid in resolved.items() if uuid == SAMPLE[i][1])
+recall = sum(
+    1
+    for i, rows in ambiguous.items()
+    if SAMPLE[i][1] is None or SAMPLE[i][1] in {row["uuid"] for row in rows}
+)
+
+for i, (entity, expected) in enumerate(SAMPLE):
+    if i in resolved:
+        outcome = f"settled as {resolved[i]}"
+        if resolved[i] != expected:
+            outcome += f" (expected {expected})"
+    else:
+        outcome = f"to model with {[row['uuid'] for row in ambiguous[i]]}"
+    print(f"{entity['type']:>12} {entity['name']:<22} {outcome}")
+
+print()
+print(f"str_includes baseline: {baseline_calls} dedup calls for {len(SAMPLE)} entities")
+print(
+    f"pre-filter: {len(ambiguous)} entities left for the model,"
+    f" {len(resolved)} settled ({settled_correctly} correctly),"
+    f" true match among candidates for {recall}/{len(ambiguous)}"
+)
+print(f"stats: {index.stats()}")
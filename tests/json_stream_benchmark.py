@@ -0,0 +1,96 @@
+import json
+import os
+import re
+import time
+
+os.environ.setdefault("LLM_CACHE_AGENTS", "")
+
+import utils.ollama as ollama_module  # noqa: E402
+from tasks.agents import (  # noqa: E402
+    EntityPrefetch,
+    entity_extraction_agent,
+    refresh_entities,
+)
+from tasks.entity_index import entity_index  # noqa: E402
+from utils.json_stream import parse_items  # noqa: E402
+
+# Compares waiting for the whole entity extraction response before looking up
+# existing entities with starting each entity's lookups as soon as it has
+# streamed in, then checks how much of some malformed responses the
+# tolerant parser recovers compared with the old trailing-comma regex.
+TOKEN_DELAY = 0.01
+LOOKUP_DELAY = 0.3
+
+ENTITIES = [
+    {"name": "John Smith", "type": "Person", "description": "IT admin"},
+    {"name": "IT", "type": "Organization", "description": "IT department"},
+    {"name": "IT Modernization", "type": "Project", "description": "Infra"},
+    {"name": "Jane Doe", "type": "Person", "description": "HR lead"},
+    {"name": "Acme Corp", "type": "Organization", "description": "Supplier"},
+]
+
+
+class StreamingClient:
+    def __init__(self, text):
+        self.text = text
+        self.format = None
+
+    def chat(self, model, messages, format="", **kwargs):
+        self.format = format
+        return self._stream()
+
+    def _stream(self):
+        for i in range(0, len(self.text), 4):
+            time.sleep(TOKEN_DELAY)
+            yield {"message": {"content": self.text[i : i + 4]}, "done": False}
+        yield {"message": {"content": ""}, "done": True}
+
+
+class SlowStorage:
+    def lookup(self, relation, fields, condition=None):
+        time.sleep(LOOKUP_DELAY)
+        return json.dumps({"headers": fields, "rows": []})
+
+
+def old_sanitize(response):
+    return json.loads(re.sub(r",\s*([\]}])", r"\1", response))["entities"]
+
+
+storage = SlowStorage()
+response = json.dumps({"entities": ENTITIES}, indent=2)
+client = StreamingClient(response)
+ollama_module.client = client
+
+for label, prefetch in [
+    ("lookups after response", None),
+    ("lookups while streaming", EntityPrefetch(storage)),
+]:
+    entity_index.loaded_at.clear()
+    start = time.perf_counter()
+    entities = entity_extraction_agent("email body", on_entity=prefetch)
+    generated = time.perf_counter() - start
+    if prefetch:
+        prefetch.wait()
+    refresh_entities(storage, entities)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>24}: {len(entities)} entities, response done at {generated:.2f}s,"
+        f" ready to resolve at {elapsed:.2f}s (format={client.format!r})"
+    )
+
+print()
+MALFORMED = {
+    "trailing commas": '{"entities": [{"name": "A", "type": "Person",},]}',
+    "missing comma": '{"entities": [{"name": "A", "type": "Person"}, {"name": "B" "type": "Person"}, {"name": "C", "type": "Person"}]}',
+    "cut off": '{"entities": [{"name": "A", "type": "Person"}, {"name": "B", "type": "Pers',
+    "code fence": '```json\n{"entities": [{"name": "A", "type": "Person"}]}\n```',
+    "single quotes": "{'entities': [{'name': 'A', 'type': 'Person'}]}",
+}
+for label, text in MALFORMED.items():
+    try:
+        old = len(old_sanitize(text))
+    except (json.JSONDecodeError, KeyError):
+        old = 0
+    print(
+        f"{label:>16}: old parser {old} entities, tolerant parser {len(parse_items(text))}"
+    )
@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.llm_scheduler import LLMScheduler, current_email
+
+# A burst of background entity extraction lands just before a few execution
+# requests. Compares how long the execution requests wait behind a plain FIFO
+# semaphore and behind the scheduler, then shows one busy email sharing the
+# model with a quiet one.
+CONCURRENCY = 2
+LLM_TIME = 0.05
+BURST = 40
+
+
+class FifoScheduler:
+    def __init__(self):
+        self.semaphore = threading.Semaphore(CONCURRENCY)
+
+    def slot(self, agent):
+        return self.semaphore
+
+
+def request(scheduler, agent, email, submitted):
+    current_email.set(email)
+    with scheduler.slot(agent):
+        waited = time.perf_counter() - submitted
+        time.sleep(LLM_TIME)
+    return agent, email, waited
+
+
+def run(scheduler, jobs):
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = []
+        for agent, email in jobs:
+            futures.append(
+                executor.submit(request, scheduler, agent, email, time.perf_counter())
+            )
+            time.sleep(0.001)
+        return [future.result() for future in futures]
+
+
+def mean_wait(results, **match):
+    waits = [
+        waited
+        for agent, email, waited in results
+        if all({"agent": agent, "email": email}[k] == v for k, v in match.items())
+    ]
+    return sum(waits) / len(waits)
+
+
+priority_jobs = [("entity_extraction", f"email-{i % 10}") for i in range(BURST)]
+priority_jobs += [("execution", f"email-{i}") for i in range(3)]
+caps = {"entity_extraction": CONCURRENCY}
+for name, scheduler in [
+    ("fifo", FifoScheduler()),
+    ("scheduler", LLMScheduler(CONCURRENCY, caps)),
+]:
+    results = run(scheduler, priority_jobs)
+    print(
+        f"{name:>9}  execution waited {mean_wait(results, agent='execution'):.3f}s"
+        f"  entity extraction waited"
+        f" {mean_wait(results, agent='entity_extraction'):.3f}s"
+    )
+
+fair_jobs = [("execution", "busy")] * 20 + [("execution", "quiet")] * 3
+for name, scheduler in [("fifo", FifoScheduler()), ("scheduler", LLMScheduler())]:
+    scheduler.concurrency = CONCURRENCY
+    results = run(scheduler, fair_jobs)
+    print(
+        f"{name:>9}  busy email waited {mean_wait(results, email='busy'):.3f}s"
+        f"  quiet email waited {mean_wait(results, email='quiet'):.3f}s"
+    )
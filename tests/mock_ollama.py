@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Stand-in for the Ollama HTTP API, for benchmarking the pipeline without a
+# model server. Serves /api/generate, /api/chat, /api/embeddings and /api/embed
+# with Ollama's streaming NDJSON format, answering each agent's prompt by rule
+# (or from a script file) at a fixed token rate after a fixed time to first
+# token. Embeddings are deterministic per text, but fake, so point the
+# embedding cache and vector index at scratch directories (and leave the
+# response cache off) to keep them out of the real caches.
+#
+#   python -m tests.mock_ollama --port 11435 --tokens-per-second 40 --ttft 0.3
+#   OLLAMA_HOST=http://127.0.0.1:11435 EMBEDDING_CACHE_DIR=/tmp/mock/embeddings \
+#       VECTOR_INDEX_DIR=/tmp/mock/vector_index LLM_CACHE_AGENTS= python main.py
+#
+# A script file is a JSON list of {"match": "...", "response": "..."} entries,
+# with an optional "agent" label for the stats, checked in order against the
+# system prompt and last message before the rules.
+
+
+def execution_response(text):
+    return "The task has been completed."
+
+
+def objective_response(text):
+    subject = re.search(r"Subject: (.*)", text)
+    return f"Reply to {subject.group(1).strip()}" if subject else "Reply to the sender"
+
+
+def task_creation_response(text):
+    return json.dumps(
+        {
+            "tasks": [
+                {"task": "Collect the missing details", "agent": "Human"},
+                {"task": "Draft a reply", "agent": "AI"},
+            ]
+        }
+    )
+
+
+def entity_extraction_response(text):
+    # Capitalised word pairs in the last message become people
+    names = dict.fromkeys(re.findall(r"\b[A-Z][a-z]+ [A-Z][a-z]+\b", text))
+    entities = [
+        {"name": name, "type": "Person", "description": "Mentioned in the email."}
+        for name in names
+    ]
+    return json.dumps({"entities": entities})
+
+
+def entity_resolution_response(text):
+    numbers = re.findall(r"^(\d+)\. ", text, re.MULTILINE)
+    return json.dumps({number: "new" for number in numbers})
+
+
+def entity_dedup_response(text):
+    return "No Matches"
+
+
+# Agent, a phrase from its instructions, and its rule; checked in order
+RULES = [
+    ("objective", "actionable tasks", objective_response),
+    ("task_creation", "task creation AI", task_creation_response),
+    ("entity_extraction", "entity identification", entity_extraction_response),
+    ("entity_dedup", "input entities match entities", entity_resolution_response),
+    ("entity_dedup", "new input data matches", entity_dedup_response),
+    ("execution", "given a task to perform", execution_response),
+]
+
+
+def fake_embedding(text, dimensions):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+def tokens(text):
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class MockOllama:
+    def __init__(
+        self, tokens_per_second=50.0, ttft=0.2, embedding_dim=1024, script=None
+    ):
+        self.tokens_per_second = tokens_per_second
+        self.ttft = ttft
+        self.embedding_dim = embedding_dim
+        self.script = script or []
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        # Time the simulated model spent generating for each agent, for
+        # comparison with the pipeline's wall-clock time
+        self.model_seconds = Counter()
+
+    def respond(self, system, prompt_text):
+        # Returns the agent the prompt belongs to and the response text
+        text = f"{system}\n{prompt_text}"
+        for entry in self.script:
+            if entry["match"] in text:
+                return entry.get("agent", "script"), entry["response"]
+        for agent, phrase, rule in RULES:
+            if phrase in system:
+                return agent, rule(prompt_text)
+        return "other", "OK"
+
+    def generation(self, agent, text, prompt_chars):
+        parts = tokens(text)
+        delay = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        with self.lock:
+            self.requests[agent] += 1
+            self.model_seconds[agent] += self.ttft + delay * len(parts)
+        return (
+            parts,
+            delay,
+            {
+                "prompt_eval_count": prompt_chars // 4,
+                "eval_count": len(parts),
+                "prompt_eval_duration": int(self.ttft * 1e9),
+                "eval_duration": int(delay * len(parts) * 1e9),
+                "total_duration": int((self.ttft + delay * len(parts)) * 1e9),
+            },
+        )
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "model_seconds": {
+                    agent: round(seconds, 3)
+                    for agent, seconds in self.model_seconds.items()
+                },
+            }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock: MockOllama
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        routes = {
+            "/api/generate": self.generate,
+            "/api/chat": self.chat,
+            "/api/embeddings": self.embeddings,
+            "/api/embed": self.embed,
+        }
+        route = routes.get(self.path)
+        if route is None:
+            self.send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+        else:
+            route(body)
+
+    def generate(self, body):
+        prompt = body.get("prompt") or ""
+        if not prompt:
+            # Loading a model: nothing to generate
+            return self.send_json(
+                {"model": body.get("model"), "response": "", "done": True}
+            )
+        system = body.get("system") or ""
+        agent, text = self.mock.respond(system, prompt)
+        self.send_generation(
+            body,
+            agent,
+            text,
+            len(system) + len(prompt),
+            lambda part: {"response": part},
+        )
+
+    def chat(self, body):
+        messages = body.get("messages") or []
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        last = messages[-1]["content"] if messages else ""
+        agent, text = self.mock.respond(system, last)
+        prompt_chars = sum(len(m.get("content") or "") for m in messages)
+        self.send_generation(
+            body,
+            agent,
+            text,
+            prompt_chars,
+            lambda part: {"message": {"role": "assistant", "content": part}},
+        )
+
+    def embeddings(self, body):
+        embedding = fake_embedding(body.get("prompt", ""), self.mock.embedding_dim)
+        self.send_json({"embedding": embedding})
+
+    def embed(self, body):
+        texts = body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        self.send_json(
+            {
+                "model": body.get("model"),
+                "embeddings": [
+                    fake_embedding(text, self.mock.embedding_dim) for text in texts
+                ],
+            }
+        )
+
+    def send_generation(self, body, agent, text, prompt_chars, content):
+        parts, delay, metrics = self.mock.generation(agent, text, prompt_chars)
+        base = {
+            "model": body.get("model"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        time.sleep(self.mock.ttft)
+        if not body.get("stream", True):
+            time.sleep(delay * len(parts))
+            return self.send_json({**base, **content(text), "done": True, **metrics})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for part in parts:
+                self.send_chunk({**base, **content(part), "done": False})
+                time.sleep(delay)
+            self.send_chunk({**base, **content(""), "done": True, **metrics})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, as it does at a sentinel answer
+            self.close_connection = True
+
+    def send_chunk(self, data):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_server(mock: MockOllama, host="127.0.0.1", port=0) -> ThreadingHTTPServer:
+    """Serves `mock` on a background thread; port 0 picks a free port."""
+    handler = type("MockOllamaHandler", (Handler,), {"mock": mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, daemon=True, name="MockOllama"
+    ).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds")
+    parser.add_argument("--embedding-dim", type=int, default=1024)
+    parser.add_argument("--script", help="JSON list of match/response entries")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    mock = MockOllama(args.tokens_per_second, args.ttft, args.embedding_dim, script)
+    server = start_server(mock, args.host, args.port)
+    print(f"Mock Ollama listening on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(f"Stats: {mock.stats()}")
+
+
+if __name__ == "__main__":
+    main()
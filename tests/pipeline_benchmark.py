@@ -0,0 +1,73 @@
+import os
+import tempfile
+import threading
+import time
+
+from tests.mock_ollama import MockOllama, start_server
+
+# Runs the same emails through the threads engine (one thread per email) and
+# the staged pipeline engine against tests/mock_ollama.py and the in-memory
+# NexusDB backend, then prints the pipeline's per-stage stats. Each email's
+# first task asks for more context once, so every stage is used.
+EMAILS = 20
+TOKENS_PER_SECOND = 100
+TTFT = 0.1
+
+mock = MockOllama(
+    tokens_per_second=TOKENS_PER_SECOND,
+    ttft=TTFT,
+    script=[
+        {
+            "match": "for the quarter.\nTake into account these previously"
+            " completed tasks and their results: ['Null'].",
+            "response": "More context needed",
+            "agent": "execution",
+        }
+    ],
+)
+server = start_server(mock)
+os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_port}"
+os.environ.setdefault("NEXUSDB_BACKEND", "memory")
+os.environ.setdefault("LLM_CACHE_AGENTS", "")
+# The mock's vectors must not land in the real embedding cache or vector index
+QUEUE_DIR = tempfile.mkdtemp()
+os.environ["EMAIL_QUEUE_PATH"] = os.path.join(QUEUE_DIR, "emails.sqlite3")
+os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(QUEUE_DIR, "embeddings")
+os.environ["VECTOR_INDEX_DIR"] = os.path.join(QUEUE_DIR, "vector_index")
+
+from integrations.email.fetcher import email_queue  # noqa: E402
+from tasks import processor  # noqa: E402
+from tasks.pipeline import EmailPipeline  # noqa: E402
+from utils.work_queue import WorkQueue  # noqa: E402
+
+
+def emails(engine):
+    return [
+        {
+            "Message-ID": f"<{engine}-{i}@example.com>",
+            "Subject": f"Report {i} for the quarter",
+            "To": "me@example.com",
+            "From": "sender@example.com",
+            "Timestamp": "2024-01-01T00:00:00",
+            "Body": f"Hi, can you send report {i} to Jane Doe?",
+        }
+        for i in range(EMAILS)
+    ]
+
+
+def run(label, queue, engine):
+    for email_data in emails(label):
+        queue.put(email_data)
+    start = time.perf_counter()
+    threading.Thread(target=engine, daemon=True).start()
+    queue.join()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>8}: {EMAILS} emails in {elapsed:.2f}s")
+
+
+run("threads", email_queue, processor.dispatcher.run)
+pipeline = EmailPipeline(WorkQueue(os.path.join(QUEUE_DIR, "pipeline.sqlite3")))
+run("pipeline", pipeline.source, pipeline.run)
+
+for name, stats in pipeline.stats().items():
+    print(f"{name:>8}: {stats}")
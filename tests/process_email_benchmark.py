@@ -0,0 +1,57 @@
+import os
+import tempfile
+import time
+
+from tests.mock_ollama import MockOllama, start_server
+
+# Runs process_email end to end against tests/mock_ollama.py and the in-memory
+# NexusDB backend, and reports how much of each email's time is the simulated
+# model and how much is the pipeline's own overhead.
+EMAILS = 5
+TOKENS_PER_SECOND = 50
+TTFT = 0.2
+
+mock = MockOllama(tokens_per_second=TOKENS_PER_SECOND, ttft=TTFT)
+server = start_server(mock)
+os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_port}"
+os.environ.setdefault("NEXUSDB_BACKEND", "memory")
+os.environ.setdefault("LLM_CACHE_AGENTS", "")
+# The mock's vectors must not land in the real embedding cache or vector index
+scratch = tempfile.mkdtemp()
+os.environ["EMAIL_QUEUE_PATH"] = os.path.join(scratch, "emails.sqlite3")
+os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(scratch, "embeddings")
+os.environ["VECTOR_INDEX_DIR"] = os.path.join(scratch, "vector_index")
+
+from integrations.email.fetcher import email_queue  # noqa: E402
+from tasks import processor  # noqa: E402
+
+# Agents process_email waits on; entity extraction runs alongside it
+FOREGROUND_AGENTS = ["objective", "execution", "task_creation"]
+
+for i in range(EMAILS):
+    email_queue.put(
+        {
+            "Message-ID": f"<benchmark-{i}@example.com>",
+            "Subject": f"Quarterly report {i}",
+            "To": "me@example.com",
+            "From": "sender@example.com",
+            "Timestamp": "2024-01-01T00:00:00",
+            "Body": f"Hi, can you ask Jane Doe to send John Smith report {i}?",
+        }
+    )
+
+start = time.perf_counter()
+for _ in range(EMAILS):
+    processor.process_email(email_queue.get())
+elapsed = time.perf_counter() - start
+processor.entity_pool.flush()
+
+stats = mock.stats()
+model = sum(stats["model_seconds"].get(agent, 0) for agent in FOREGROUND_AGENTS)
+print(f"Mock Ollama: {TOKENS_PER_SECOND} tokens/s, {TTFT}s to first token")
+print(
+    f"{EMAILS} emails in {elapsed:.2f}s ({elapsed / EMAILS:.2f}s each):"
+    f" model {model / EMAILS:.2f}s, pipeline overhead {(elapsed - model) / EMAILS:.2f}s"
+)
+print(f"Requests by agent: {stats['requests']}")
+print(f"Model seconds by agent: {stats['model_seconds']}")
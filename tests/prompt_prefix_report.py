@@ -0,0 +1,32 @@
+import os
+import time
+
+os.environ.setdefault("LLM_CACHE_AGENTS", "")
+
+from tasks.agents import entity_extraction_agent, objective_agent  # noqa: E402
+from utils.prompt_prefix import prefix_stats  # noqa: E402
+
+# Runs the objective and entity extraction agents over a handful of emails
+# against a local Ollama and reports how much prompt evaluation time was saved
+# by reusing the evaluated static prefix. Needs llama3 pulled.
+EMAILS = [
+    "Can you send me the Q3 budget by Friday? Maria from Finance needs it.",
+    "Please book a room for the Atlas project kickoff with Dev and Priya.",
+    "Reminder: the Electronic Arts contract review moved to Tuesday.",
+    "John Smith from IT needs access to the reporting system.",
+    "Could you ask Acme Corp for an updated quote on the servers?",
+]
+
+start = time.perf_counter()
+for i, body in enumerate(EMAILS):
+    objective_agent("me@example.com", "sender@example.com", f"Email {i}", "", body, "")
+    entity_extraction_agent(body)
+elapsed = time.perf_counter() - start
+
+print(f"{len(EMAILS)} emails in {elapsed:.1f}s")
+for agent, stats in prefix_stats.stats().items():
+    print(
+        f"{agent:>18}: {stats['requests']} requests,"
+        f" {stats['prompt_eval_seconds']:.2f}s evaluating prompts,"
+        f" ~{stats['saved_seconds']:.2f}s saved by prefix reuse"
+    )
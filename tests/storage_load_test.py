@@ -0,0 +1,68 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("RESULT_WRITERS", "2")
+
+import tasks.storage as storage_module  # noqa: E402
+from tasks.storage import InMemoryTaskListStorage  # noqa: E402
+
+# Drives SingleTaskListStorage the way process_email does, against the in-memory
+# NexusDB backend at several simulated latencies. Embeddings are derived from a
+# hash of the text so the numbers reflect storage cost only.
+EMAILS = 40
+SUBTASKS = 5
+WORKERS = int(os.getenv("MAX_THREADS", 4))
+LATENCIES_MS = [(0, 0), (20, 5), (100, 30)]
+
+
+def fake_embedding(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [byte / 255 for byte in digest]
+
+
+storage_module.get_ollama_embedding = fake_embedding
+storage_module.get_ollama_embeddings = lambda texts: [fake_embedding(t) for t in texts]
+
+
+def simulate_email(storage, index):
+    email_id = f"email-{index}"
+    storage.get_tasks(object=email_id)
+    objective = {
+        "uuid": storage.next_task_id(),
+        "name": f"Objective {index}",
+        "agent": "AI",
+        "actionStatus": "Active",
+        "identifier": 0,
+        "object": email_id,
+    }
+    storage.append(objective)
+    _, subtasks = storage.add_subtasks(
+        objective["uuid"],
+        objective["name"],
+        [{"task": f"Step {i} of {index}", "agent": "AI"} for i in range(SUBTASKS)],
+        0,
+    )
+    for task in [*subtasks.values(), objective]:
+        storage.get_previous_results(email_id)
+        storage.get_context(task["name"], 5)
+        storage.update_task_status(task["uuid"], task["name"], "Complete", "Done")
+    storage.get_tasks(object=email_id)
+
+
+for latency_ms, jitter_ms in LATENCIES_MS:
+    storage = InMemoryTaskListStorage()
+    storage.latency_ms, storage.jitter_ms = latency_ms, jitter_ms
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        list(executor.map(lambda i: simulate_email(storage, i), range(EMAILS)))
+    storage.result_writer.flush()
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"latency={latency_ms}±{jitter_ms}ms  {EMAILS} emails in {elapsed:.2f}s"
+        f"  ({EMAILS / elapsed:.1f} emails/s, {storage.calls} database calls)"
+    )
+    storage.result_writer.close()
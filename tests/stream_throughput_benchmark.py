@@ -0,0 +1,47 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.ollama import handle_response
+
+# Consumes simulated token streams concurrently, with and without a global lock
+# held for the whole stream (the old print_lock behaviour). Each stream yields
+# TOKENS chunks spaced TOKEN_DELAY apart, like a server generating in parallel.
+TOKENS = 50
+TOKEN_DELAY = 0.002
+STREAMS = 16
+CONCURRENCY = [1, 2, 4, 8]
+
+global_lock = threading.Lock()
+
+
+def fake_stream():
+    for i in range(TOKENS):
+        time.sleep(TOKEN_DELAY)
+        yield {"response": f"token{i} "}
+
+
+def consume(serialized):
+    if serialized:
+        with global_lock:
+            return handle_response(fake_stream(), stream=True)
+    return handle_response(fake_stream(), stream=True)
+
+
+def run(serialized, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        responses = list(executor.map(lambda _: consume(serialized), range(STREAMS)))
+    elapsed = time.perf_counter() - start
+    assert all(len(response.split()) == TOKENS for response in responses)
+    return STREAMS * TOKENS / elapsed
+
+
+for workers in CONCURRENCY:
+    locked = run(True, workers)
+    lock_free = run(False, workers)
+    print(
+        f"{workers} streams  global lock: {locked:>7.0f} tokens/s"
+        f"  per-request sink: {lock_free:>7.0f} tokens/s"
+        f"  speedup: {lock_free / locked:.1f}x"
+    )
@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+
+os.environ.setdefault("NEXUSDB_BACKEND", "memory")
+os.environ["RESULT_WRITERS"] = "0"
+os.environ["EMAIL_QUEUE_POLL_SECONDS"] = "0.05"
+
+import tasks.storage as storage_module  # noqa: E402
+from tasks.change_log import TaskChangeLog  # noqa: E402
+from tasks.events import task_events, task_feed  # noqa: E402
+from tasks.storage import InMemoryTaskListStorage  # noqa: E402
+
+# Checks that task changes made in a worker process reach the app's process
+# through the task change log: the app's task index shows them, and a
+# dashboard long poll waiting on the task feed wakes for each one.
+storage_module.get_ollama_embeddings = lambda texts: [[1.0, 0.0] for _ in texts]
+CHANGE_LOG_PATH = os.path.join(tempfile.mkdtemp(), "emails.sqlite3")
+
+
+def work(path, email_id):
+    # A worker process: its own storage, publishing to the change log
+    task_events.subscribe(TaskChangeLog(path).append)
+    storage = InMemoryTaskListStorage()
+    primary = {
+        "uuid": storage.next_task_id(),
+        "name": f"Objective for {email_id}",
+        "agent": "AI",
+        "actionStatus": "Active",
+        "identifier": 0,
+        "object": email_id,
+    }
+    storage.append(primary)
+    storage.add_subtasks(
+        primary["uuid"], primary["name"], [{"task": "Ask for the invoice"}], 0
+    )
+    storage.update_task_status(primary["uuid"], primary["name"], "Complete", "Done")
+
+
+def main():
+    app_storage = InMemoryTaskListStorage()
+    assert app_storage.find_tasks(actionStatus="Active") == {}
+    threading.Thread(
+        target=TaskChangeLog(CHANGE_LOG_PATH).follow,
+        args=(app_storage.apply_change,),
+        daemon=True,
+    ).start()
+
+    version = task_feed.version
+    # Spawned, like the app's worker processes, rather than forked
+    worker = multiprocessing.get_context("spawn").Process(
+        target=work, args=(CHANGE_LOG_PATH, "email-1")
+    )
+    worker.start()
+    worker.join()
+
+    # Created objective, created subtask, potentialAction update, status update
+    while task_feed.version < version + 4:
+        woke_at = task_feed.wait(task_feed.version, 5)
+        assert woke_at > version, "long poll didn't wake for the worker's changes"
+
+    active = app_storage.find_tasks(actionStatus="Active")
+    complete = app_storage.find_tasks(actionStatus="Complete")
+    assert [task["name"] for task in active.values()] == ["Ask for the invoice"], active
+    assert [task["name"] for task in complete.values()] == ["Objective for email-1"]
+    assert list(complete.values())[0]["potentialAction"] == ["Ask for the invoice"]
+    print(f"App saw {task_feed.version - version} task changes from the worker process")
+
+
+if __name__ == "__main__":
+    main()
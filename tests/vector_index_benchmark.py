@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+
+from tasks.vector_index import LocalVectorIndex
+
+# Recall of the local index against exact brute-force search, and query latency,
+# on random unit vectors the width of mxbai-embed-large
+DIM = 1024
+QUERIES = 200
+K = 5
+
+
+def exact_top_k(vectors, query, k):
+    scores = vectors @ query
+    return set(np.argsort(-scores)[:k])
+
+
+def benchmark(corpus_size, hnsw_threshold, ef_search=128):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((corpus_size, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = rng.standard_normal((QUERIES, DIM)).astype(np.float32)
+
+    index = LocalVectorIndex(
+        directory=None, hnsw_threshold=hnsw_threshold, ef_search=ef_search
+    )
+    start = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        index.add(str(i), f"result {i}", vector)
+    build_time = time.perf_counter() - start
+
+    recall = 0.0
+    start = time.perf_counter()
+    for query in queries:
+        found = {int(uuid) for uuid, _ in index.search(query, K)}
+        recall += len(found & exact_top_k(vectors, query / np.linalg.norm(query), K))
+    query_time = (time.perf_counter() - start) / QUERIES
+
+    mode = "hnsw" if index.hnsw is not None else "numpy"
+    print(
+        f"{corpus_size:>7} vectors  {mode:<5} ef={ef_search:<4} "
+        f"recall@{K}={recall / (QUERIES * K):.3f}  "
+        f"query={query_time * 1000:.2f}ms  build={build_time:.1f}s"
+    )
+
+
+for size in [1_000, 10_000, 50_000]:
+    benchmark(size, hnsw_threshold=size + 1)
+    for ef in [32, 128, 512]:
+        benchmark(size, hnsw_threshold=0, ef_search=ef)
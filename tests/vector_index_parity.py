@@ -0,0 +1,32 @@
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from tasks.storage import SingleTaskListStorage  # noqa: E402
+
+# Compares get_context served from the local vector index against NexusDB's
+# vector_search for the names of existing tasks. Requires LOCAL_VECTOR_INDEX=true
+# and a NEXUSDB_API_KEY with stored results.
+K = 5
+
+storage = SingleTaskListStorage()
+if storage.vector_index is None:
+    sys.exit("Set LOCAL_VECTOR_INDEX=true (and install numpy) to run this check")
+
+if not storage.vector_index.seeded:
+    storage.rebuild_vector_index()
+
+queries = [task["name"] for task in storage.find_tasks().values()][:50]
+overlap = 0
+for query in queries:
+    local = set(storage.get_context(query, K))
+    remote = set(storage.get_remote_context(query, K))
+    overlap += len(local & remote) / max(len(remote), 1)
+    if local != remote:
+        print(f"Mismatch for '{query}':\n  local:  {local}\n  remote: {remote}")
+
+print(
+    f"Mean top-{K} overlap over {len(queries)} queries: {overlap / max(len(queries), 1):.3f}"
+)
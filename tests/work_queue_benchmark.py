@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from queue import Empty, Queue
+
+from utils.work_queue import WorkQueue
+
+# Measures the durable email queue. First, raw put and get/ack throughput
+# against an in-memory queue.Queue. Then CPU-bound handlers (WORK seconds of
+# pure Python per item) consumed by threads in one process and by separate
+# processes sharing the queue. Last, a consumer that dies holding leased items,
+# to show them redelivered once the visibility timeout passes.
+ITEMS = 2000
+CPU_ITEMS = 400
+WORK = 0.005
+CONSUMERS = [1, 2, 4]
+VISIBILITY_TIMEOUT = 1.0
+
+
+def items(count):
+    return [
+        {"Message-ID": f"<{i}@example.com>", "Body": "x" * 200} for i in range(count)
+    ]
+
+
+def burn(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def drain(path, work, results):
+    queue = WorkQueue(path, poll_interval=0.05)
+    done = 0
+    finished = time.monotonic()
+    while True:
+        try:
+            item = queue.get(timeout=0.2)
+        except Empty:
+            break
+        burn(work)
+        queue.task_done(item)
+        done += 1
+        finished = time.monotonic()
+    # Time of the last ack, so the final wait for more items isn't counted
+    results.put((done, finished))
+
+
+def fill(path, count):
+    queue = WorkQueue(path)
+    start = time.perf_counter()
+    for item in items(count):
+        queue.put(item)
+    return time.perf_counter() - start
+
+
+def run_processes(path, consumers, work):
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=drain, args=(path, work, results))
+        for _ in range(consumers)
+    ]
+    start = time.monotonic()
+    for worker in workers:
+        worker.start()
+    done, finished = zip(*(results.get() for _ in workers))
+    for worker in workers:
+        worker.join()
+    return sum(done), max(finished) - start
+
+
+def run_threads(path, consumers, work):
+    results = Queue()
+    threads = [
+        threading.Thread(target=drain, args=(path, work, results))
+        for _ in range(consumers)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done, finished = zip(*(results.get() for _ in threads))
+    return sum(done), max(finished) - start
+
+
+def die_holding(path, count):
+    queue = WorkQueue(path, visibility_timeout=VISIBILITY_TIMEOUT)
+    for _ in range(count):
+        queue.get()
+    os._exit(1)
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    print(f"{os.cpu_count()} cores")
+
+    memory = Queue()
+    start = time.perf_counter()
+    for item in items(ITEMS):
+        memory.put(item)
+    while not memory.empty():
+        memory.get()
+        memory.task_done()
+    print(f"queue.Queue: {ITEMS / (time.perf_counter() - start):,.0f} items/s put+get")
+
+    for consumers in CONSUMERS:
+        path = os.path.join(directory, f"raw-{consumers}.sqlite3")
+        put_seconds = fill(path, ITEMS)
+        done, elapsed = run_processes(path, consumers, 0)
+        print(
+            f"WorkQueue, {consumers} processes: {ITEMS / put_seconds:,.0f} puts/s,"
+            f" {done / elapsed:,.0f} get+acks/s"
+        )
+
+    print(f"\n{CPU_ITEMS} items with {WORK * 1000:.0f}ms of CPU each")
+    for consumers in CONSUMERS:
+        for label, run in [("threads", run_threads), ("processes", run_processes)]:
+            path = os.path.join(directory, f"cpu-{label}-{consumers}.sqlite3")
+            fill(path, CPU_ITEMS)
+            done, elapsed = run(path, consumers, WORK)
+            print(
+                f"{consumers} {label:>9}: {done} items in {elapsed:.2f}s"
+                f" ({done / elapsed:,.0f} items/s)"
+            )
+
+    path = os.path.join(directory, "redelivery.sqlite3")
+    fill(path, 100)
+    crashed = multiprocessing.Process(target=die_holding, args=(path, 10))
+    crashed.start()
+    crashed.join()
+    time.sleep(VISIBILITY_TIMEOUT)
+    queue = WorkQueue(path, visibility_timeout=VISIBILITY_TIMEOUT)
+    acked = 0
+    while True:
+        try:
+            item = queue.get(timeout=0.2)
+        except Empty:
+            break
+        queue.task_done(item)
+        acked += 1
+    stats = queue.stats()
+    print(
+        f"\nConsumer exited holding 10 of 100 items: {acked} acknowledged by"
+        f" another consumer, {stats['redelivered']} redelivered, {stats}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 2048))
+EMBEDDING_CACHE_DISK_MB = int(os.getenv("EMBEDDING_CACHE_DISK_MB", 256))
+
+# Grow the vector file this many slots at a time to avoid remapping on every write
+GROWTH_SLOTS = 256
+
+
+def normalize_text(text: str) -> str:
+    # Only used for the cache key; the model is sent the text as given
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(
+        f"{model}\0{normalize_text(text)}".encode("utf-8")
+    ).hexdigest()
+
+
+class DiskTier:
+    """
+    Fixed-width float32 slots in a memory-mapped file, plus an append-only
+    index log of "<key> <slot>" lines. Replaying the log rebuilds the index;
+    a slot that is reassigned drops whichever key held it before.
+    """
+
+    def __init__(self, directory: str, model: str, dim: int, max_bytes: int):
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self.dim = dim
+        self.slot_size = dim * 4
+        self.max_slots = max(1, max_bytes // self.slot_size)
+        self.vector_path = os.path.join(directory, f"{safe_model}.{dim}.vec")
+        self.index_path = os.path.join(directory, f"{safe_model}.{dim}.idx")
+
+        self.index: OrderedDict[str, int] = OrderedDict()
+        self.slot_keys: Dict[int, str] = {}
+        self.log_lines = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+        self.file = open(self.vector_path, "a+b")
+        self.capacity = os.path.getsize(self.vector_path) // self.slot_size
+        self.map = None
+        if self.capacity:
+            self.map = mmap.mmap(self.file.fileno(), self.capacity * self.slot_size)
+        self.index_log = open(self.index_path, "a", encoding="utf-8")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                self.log_lines += 1
+                try:
+                    key, slot = line.split()
+                    slot = int(slot)
+                except ValueError:
+                    continue
+                self._assign(key, slot)
+
+    def _assign(self, key: str, slot: int):
+        previous = self.slot_keys.get(slot)
+        if previous is not None and previous != key:
+            self.index.pop(previous, None)
+        self.slot_keys[slot] = key
+        self.index[key] = slot
+        self.index.move_to_end(key)
+
+    def _ensure_capacity(self, slot: int):
+        if slot < self.capacity:
+            return
+        new_capacity = min(self.max_slots, slot + GROWTH_SLOTS)
+        self.file.truncate(new_capacity * self.slot_size)
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), new_capacity * self.slot_size)
+        self.capacity = new_capacity
+
+    def get(self, key: str) -> Optional[List[float]]:
+        slot = self.index.get(key)
+        if slot is None or slot >= self.capacity:
+            return None
+        self.index.move_to_end(key)
+        offset = slot * self.slot_size
+        return list(struct.unpack_from(f"<{self.dim}f", self.map, offset))
+
+    def put(self, key: str, embedding: List[float]):
+        if key in self.index:
+            return
+        if len(self.slot_keys) < self.max_slots:
+            slot = len(self.slot_keys)
+        else:
+            # Evict the least recently used slot and reuse it
+            evicted, slot = next(iter(self.index.items()))
+            self.index.pop(evicted)
+            self.evictions += 1
+
+        self._ensure_capacity(slot)
+        struct.pack_into(f"<{self.dim}f", self.map, slot * self.slot_size, *embedding)
+        self._assign(key, slot)
+
+        self.index_log.write(f"{key} {slot}\n")
+        self.index_log.flush()
+        self.log_lines += 1
+        if self.log_lines > 2 * self.max_slots:
+            self._compact_log()
+
+    def _compact_log(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, slot in self.index.items():
+                f.write(f"{key} {slot}\n")
+        self.index_log.close()
+        os.replace(tmp_path, self.index_path)
+        self.index_log = open(self.index_path, "a", encoding="utf-8")
+        self.log_lines = len(self.index)
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.map = None
+        self.file.close()
+        self.index_log.close()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        directory: Optional[str] = EMBEDDING_CACHE_DIR,
+        memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+        disk_mb: int = EMBEDDING_CACHE_DISK_MB,
+    ):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_bytes = disk_mb * 1024 * 1024
+        self.memory: OrderedDict[str, List[float]] = OrderedDict()
+        self.disk: Dict[tuple, DiskTier] = {}
+        # The vector width is only known once a model has returned an embedding
+        self.model_dims: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+
+    def _disk_tier(self, model: str) -> Optional[DiskTier]:
+        if not self.directory or not self.disk_bytes or model not in self.model_dims:
+            return None
+        dim = self.model_dims[model]
+        if (model, dim) not in self.disk:
+            try:
+                self.disk[(model, dim)] = DiskTier(
+                    self.directory, model, dim, self.disk_bytes
+                )
+            except OSError as e:
+                logger.error(f"Disabling on-disk embedding cache: {e}")
+                self.directory = None
+                return None
+        return self.disk[(model, dim)]
+
+    def _remember(self, key: str, embedding: List[float]):
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = cache_key(model, text)
+        with self.lock:
+            embedding = self.memory.get(key)
+            if embedding is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return embedding
+
+            if model not in self.model_dims:
+                self._discover_dim(model)
+            disk = self._disk_tier(model)
+            embedding = disk.get(key) if disk else None
+            if embedding is not None:
+                self._remember(key, embedding)
+                self.disk_hits += 1
+                return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        key = cache_key(model, text)
+        with self.lock:
+            self.model_dims.setdefault(model, len(embedding))
+            self._remember(key, embedding)
+            disk = self._disk_tier(model)
+            if disk and len(embedding) == disk.dim:
+                disk.put(key, embedding)
+
+    def _discover_dim(self, model: str):
+        # Pick up vectors persisted by a previous run before the first miss
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(rf"{re.escape(safe_model)}\.(\d+)\.idx", name)
+            if match:
+                self.model_dims[model] = int(match.group(1))
+                return
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (
+                    (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+                ),
+                "memory_items": len(self.memory),
+                "memory_evictions": self.memory_evictions,
+                "disk_items": sum(len(d.index) for d in self.disk.values()),
+                "disk_evictions": sum(d.evictions for d in self.disk.values()),
+            }
+
+    def close(self):
+        with self.lock:
+            for disk in self.disk.values():
+                disk.close()
+            self.disk.clear()
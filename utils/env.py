@@ -0,0 +1,11 @@
+from typing import Dict
+
+
+def parse_counts(value: str) -> Dict[str, int]:
+    # "name=count,name=count" settings such as LLM_AGENT_CAPS and PIPELINE_WORKERS
+    counts = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, count = item.split("=", 1)
+            counts[name.strip()] = int(count)
+    return counts
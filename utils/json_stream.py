@@ -0,0 +1,137 @@
+import ast
+import json
+import logging
+import re
+from typing import Any, List
+
+logger = logging.getLogger(__name__)
+
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def strip_code_fence(text: str) -> str:
+    match = re.search(r"```(?:json)?\s*(.*?)(?:```|$)", text, re.DOTALL)
+    return match.group(1) if match else text
+
+
+def repair(text: str) -> str:
+    """
+    Best-effort fix for output that was cut off or written loosely: drops
+    trailing commas and closes any open string, object or array.
+    """
+    stack, quote, escape = [], None, False
+    for char in text:
+        if quote:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+        elif char in "]}" and stack:
+            stack.pop()
+    if quote:
+        text += quote
+    text = text.rstrip().rstrip(",")
+    if text.endswith(":"):
+        text += " null"
+    text += "".join(reversed(stack))
+    return re.sub(r",\s*([\]}])", r"\1", text)
+
+
+def tolerant_loads(text: str) -> Any:
+    text = strip_code_fence(text).strip()
+    for candidate in (text, repair(text)):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+        # Python-style literals, e.g. single quotes, from models that ignore
+        # the JSON instruction
+        try:
+            return ast.literal_eval(candidate)
+        except (ValueError, SyntaxError):
+            pass
+    raise ValueError(f"Could not parse JSON: {text[:200]}")
+
+
+class JsonItemParser:
+    """
+    Incrementally scans a JSON response and returns each element of the
+    first array in it as soon as the element is complete, so work on early
+    elements can start while the rest is still being generated. Elements
+    that fail to parse are skipped rather than failing the whole response.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.quote = None
+        self.escape = False
+        self.array_depth = None
+        self.item_start = None
+        self.closed = False
+        self.items: List[Any] = []
+
+    def feed(self, text: str) -> List[Any]:
+        self.text += text
+        new_items = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            in_array = self.array_depth == self.depth and not self.closed
+            if self.quote:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == self.quote:
+                    self.quote = None
+            elif char in "\"'":
+                self.quote = char
+            elif char in "[{":
+                self.depth += 1
+                if char == "[" and self.array_depth is None:
+                    self.array_depth = self.depth
+                    self.item_start = self.pos + 1
+            elif char in "]}":
+                if in_array:
+                    self._emit(self.pos, new_items)
+                    self.closed = True
+                self.depth -= 1
+            elif char == "," and in_array:
+                self._emit(self.pos, new_items)
+                self.item_start = self.pos + 1
+            self.pos += 1
+        return new_items
+
+    def finish(self) -> List[Any]:
+        # Salvage the last element of a response that was cut off
+        new_items = []
+        if self.array_depth is not None and not self.closed:
+            self._emit(len(self.text), new_items)
+            self.closed = True
+        return new_items
+
+    def _emit(self, end: int, new_items: List[Any]):
+        chunk = self.text[self.item_start : end].strip()
+        if not chunk:
+            return
+        try:
+            item = tolerant_loads(chunk)
+        except ValueError as e:
+            logger.warning(f"Skipping unparseable item: {e}")
+            return
+        self.items.append(item)
+        new_items.append(item)
+
+
+def parse_items(text: str) -> List[Any]:
+    parser = JsonItemParser()
+    parser.feed(text)
+    parser.finish()
+    return parser.items
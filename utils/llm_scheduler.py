@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict
+
+from .env import parse_counts
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, NORMAL, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    NORMAL: "normal",
+    BACKGROUND: "background",
+}
+
+# Task execution drives what the dashboard shows, so it goes first; entity
+# extraction only enriches the graph and can wait
+AGENT_PRIORITIES = {
+    "execution": INTERACTIVE,
+    "task_creation": INTERACTIVE,
+    "embedding": INTERACTIVE,
+    "objective": NORMAL,
+    "entity_extraction": BACKGROUND,
+    "entity_dedup": BACKGROUND,
+}
+
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", os.getenv("MAX_THREADS", 4)))
+# Requests admitted to each priority class's fair queue; callers beyond this
+# wait in arrival order until there is room
+LLM_QUEUE_DEPTH = int(os.getenv("LLM_QUEUE_DEPTH", 100))
+
+
+# Most requests each agent may have running at once
+LLM_AGENT_CAPS = parse_counts(
+    os.getenv("LLM_AGENT_CAPS", "entity_extraction=1,entity_dedup=1")
+)
+
+# The email a request is made on behalf of, used to share capacity fairly.
+# Set by the processors at the start of each email's work.
+current_email = contextvars.ContextVar("current_email", default=None)
+
+
+class Waiter:
+    def __init__(self, agent: str, email: str, priority: int, loop=None):
+        self.agent = agent
+        self.email = email
+        self.priority = priority
+        self.loop = loop
+        self.enqueued = time.perf_counter()
+        if loop is None:
+            self.granted = threading.Event()
+        else:
+            self.granted = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.granted.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.granted.done():
+            self.granted.set_result(True)
+
+
+class LLMScheduler:
+    """
+    Admits LLM requests by priority class, then round-robin across emails
+    within a class, so one email's burst of work cannot crowd out the others.
+    At most `concurrency` requests run at once and no agent exceeds its cap.
+    Works for both threads and coroutines.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = OLLAMA_CONCURRENCY,
+        agent_caps: Dict[str, int] = LLM_AGENT_CAPS,
+        queue_depth: int = LLM_QUEUE_DEPTH,
+    ):
+        self.concurrency = concurrency
+        self.agent_caps = agent_caps
+        self.queue_depth = queue_depth
+        self.lock = threading.Lock()
+        # priority -> email -> waiters, in round-robin order of emails
+        self.queues = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self.queued = defaultdict(int)
+        self.overflow = {p: deque() for p in PRIORITY_NAMES}
+        self.running = 0
+        self.running_by_agent = defaultdict(int)
+
+        self.granted = defaultdict(int)
+        self.throttled = defaultdict(int)
+        self.wait_time = defaultdict(float)
+
+    def _enqueue(self, waiter: Waiter):
+        if self.queued[waiter.priority] >= self.queue_depth:
+            self.overflow[waiter.priority].append(waiter)
+            self.throttled[waiter.priority] += 1
+            return
+        self.queues[waiter.priority].setdefault(waiter.email, deque()).append(waiter)
+        self.queued[waiter.priority] += 1
+
+    def _next(self):
+        for priority, emails in self.queues.items():
+            for email, waiters in emails.items():
+                for waiter in waiters:
+                    cap = self.agent_caps.get(waiter.agent)
+                    if cap is None or self.running_by_agent[waiter.agent] < cap:
+                        waiters.remove(waiter)
+                        if waiters:
+                            emails.move_to_end(email)
+                        else:
+                            del emails[email]
+                        self.queued[priority] -= 1
+                        if self.overflow[priority]:
+                            self._enqueue(self.overflow[priority].popleft())
+                        return waiter
+        return None
+
+    def _dispatch(self):
+        while self.running < self.concurrency:
+            waiter = self._next()
+            if waiter is None:
+                return
+            self.running += 1
+            self.running_by_agent[waiter.agent] += 1
+            self.granted[waiter.priority] += 1
+            self.wait_time[waiter.priority] += time.perf_counter() - waiter.enqueued
+            waiter.wake()
+
+    def _submit(self, agent: str | None, loop=None) -> Waiter:
+        agent = agent or "default"
+        waiter = Waiter(
+            agent,
+            current_email.get(),
+            AGENT_PRIORITIES.get(agent, NORMAL),
+            loop,
+        )
+        with self.lock:
+            self._enqueue(waiter)
+            self._dispatch()
+        return waiter
+
+    def _release(self, waiter: Waiter):
+        with self.lock:
+            self.running -= 1
+            self.running_by_agent[waiter.agent] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, agent: str | None):
+        waiter = self._submit(agent)
+        waiter.granted.wait()
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    @asynccontextmanager
+    async def async_slot(self, agent: str | None):
+        waiter = self._submit(agent, asyncio.get_running_loop())
+        try:
+            await waiter.granted
+        except asyncio.CancelledError:
+            # Withdraw the request, or give the slot back if it was granted
+            with self.lock:
+                self._withdraw(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def _withdraw(self, waiter: Waiter):
+        emails = self.queues[waiter.priority]
+        if waiter in emails.get(waiter.email, ()):
+            emails[waiter.email].remove(waiter)
+            if not emails[waiter.email]:
+                del emails[waiter.email]
+            self.queued[waiter.priority] -= 1
+            if self.overflow[waiter.priority]:
+                self._enqueue(self.overflow[waiter.priority].popleft())
+        elif waiter in self.overflow[waiter.priority]:
+            self.overflow[waiter.priority].remove(waiter)
+        else:
+            self.running -= 1
+            self.running_by_agent[waiter.agent] -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            classes = {}
+            for priority, name in PRIORITY_NAMES.items():
+                granted = self.granted[priority]
+                classes[name] = {
+                    "queued": self.queued[priority],
+                    "overflow": len(self.overflow[priority]),
+                    "granted": granted,
+                    "throttled": self.throttled[priority],
+                    "mean_wait": (
+                        self.wait_time[priority] / granted if granted else 0.0
+                    ),
+                }
+            return {
+                "concurrency": self.concurrency,
+                "running": self.running,
+                "running_by_agent": dict(self.running_by_agent),
+                "classes": classes,
+            }
+
+
+scheduler = LLMScheduler()
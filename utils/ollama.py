@@ -1,65 +1,558 @@
+import asyncio
 import logging
+import math
+import os
+import sys
 import threading
-from typing import Any, Dict, Iterator, List, Mapping, Union
+from typing import Any, AsyncIterator, Dict, Iterator, List, Mapping, Sequence, Union
 
 import ollama
+import requests
 from ollama import Message
 
+from .embedding_cache import EmbeddingCache
+from .json_stream import JsonItemParser
+from .env import parse_counts
+from .llm_scheduler import scheduler
+from .prompt_prefix import OLLAMA_KEEP_ALIVE, prefix_stats
+from .response_cache import LLM_CACHE_AGENTS, ResponseCache, request_key
+
 logger = logging.getLogger(__name__)
 
-# Initialize a lock
-print_lock = threading.Lock()
+# Echo each completed LLM response to stdout, for debugging
+OLLAMA_ECHO = os.getenv("OLLAMA_ECHO", "false").lower() == "true"
+
+EMBEDDING_MODEL = "mxbai-embed-large"
+
+embedding_cache = EmbeddingCache()
+
+# Ollama server URL, e.g. http://127.0.0.1:11435 for tests/mock_ollama.py
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+
+client = ollama.Client(host=OLLAMA_HOST)
+# For /api/embed, which the pinned client has no method for
+embed_session = requests.Session()
+# Most texts sent in one /api/embed request, and seconds to wait for its reply
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", 120))
+async_client = ollama.AsyncClient(host=OLLAMA_HOST)
+
+# Per-agent generation settings, added with register_agent
+agent_profiles: Dict[str, Dict[str, Any]] = {}
+# e.g. "objective=256,entity_dedup=512"; overrides the caps set in code
+LLM_NUM_PREDICT = parse_counts(os.getenv("LLM_NUM_PREDICT", ""))
+
+
+def register_agent(
+    agent: str,
+    sentinels: Sequence[str] = (),
+    num_predict: int | None = None,
+    stop: Sequence[str] = (),
+    format: str = "",
+):
+    """
+    `sentinels` are complete answers: a response that starts with one ends
+    there. `num_predict` caps the tokens generated and `stop` sequences end
+    generation on the server. `format="json"` makes Ollama return only
+    valid JSON.
+    """
+    agent_profiles[agent] = {
+        "sentinels": list(sentinels),
+        "num_predict": LLM_NUM_PREDICT.get(agent, num_predict),
+        "stop": list(stop),
+        "format": format,
+    }
+
+
+def agent_options(agent: str | None) -> Dict[str, Any] | None:
+    profile = agent_profiles.get(agent, {})
+    options = {}
+    if profile.get("num_predict"):
+        options["num_predict"] = profile["num_predict"]
+    if profile.get("stop"):
+        options["stop"] = profile["stop"]
+    return options or None
+
+
+def agent_format(agent: str | None, format: str = "") -> str:
+    return format or agent_profiles.get(agent, {}).get("format", "")
+
+
+def new_sink(agent: str | None) -> "ResponseSink":
+    return ResponseSink(sentinels=agent_profiles.get(agent, {}).get("sentinels", ()))
+
+
+# Created on first use so importing this module doesn't touch the disk
+response_cache = None
+response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global response_cache
+    with response_cache_lock:
+        if response_cache is None:
+            response_cache = ResponseCache()
+        return response_cache
 
 
 def get_ollama_embedding(text):
     text = text.replace("\n", " ")
-    response = ollama.embeddings(model="mxbai-embed-large", prompt=text)
-    return response["embedding"]
+    embedding = embedding_cache.get(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
+
+    response = client.embeddings(model=EMBEDDING_MODEL, prompt=text)
+    embedding = unit_vector(response["embedding"])
+    embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+
+async def get_ollama_embedding_async(text):
+    text = text.replace("\n", " ")
+    embedding = embedding_cache.get(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
+
+    async with scheduler.async_slot("embedding"):
+        response = await async_client.embeddings(model=EMBEDDING_MODEL, prompt=text)
+    embedding = unit_vector(response["embedding"])
+    embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+
+def get_ollama_embeddings(texts: List[str]) -> List[List[float]]:
+    texts = [text.replace("\n", " ") for text in texts]
+    embeddings = {}
+    for text in texts:
+        embedding = embedding_cache.get(EMBEDDING_MODEL, text)
+        if embedding is not None:
+            embeddings[text] = embedding
+
+    missing = list(dict.fromkeys(text for text in texts if text not in embeddings))
+    if missing:
+        for text, embedding in zip(missing, embed_batch(missing)):
+            embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+            embeddings[text] = embedding
+
+    return [embeddings[text] for text in texts]
+
+
+def unit_vector(embedding: List[float]) -> List[float]:
+    # /api/embed returns unit vectors and /api/embeddings doesn't; scale both
+    # the same way so cached vectors are interchangeable. NexusDB results
+    # stored before this are raw until `python -m tasks.reembed` rewrites them
+    norm = math.sqrt(sum(x * x for x in embedding))
+    return [x / norm for x in embedding] if norm else embedding
+
+
+def embed_batch(texts: List[str]) -> List[List[float]]:
+    embeddings = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        embeddings.extend(embed_chunk(texts[start : start + EMBEDDING_BATCH_SIZE]))
+    return embeddings
+
+
+def embed_chunk(texts: List[str]) -> List[List[float]]:
+    # The pinned client predates Client.embed(), so post to /api/embed directly
+    # and fall back to one request per text on servers that don't have it
+    try:
+        response = embed_session.post(
+            f"{OLLAMA_HOST}/api/embed",
+            json={"model": EMBEDDING_MODEL, "input": texts},
+            timeout=EMBEDDING_TIMEOUT,
+        )
+        response.raise_for_status()
+        embeddings = response.json()["embeddings"]
+    except (requests.HTTPError, KeyError, ValueError) as e:
+        logger.debug(f"Batch embedding unavailable, embedding one at a time: {e}")
+        embeddings = [
+            client.embeddings(model=EMBEDDING_MODEL, prompt=text)["embedding"]
+            for text in texts
+        ]
+    return [unit_vector(embedding) for embedding in embeddings]
+
+
+class ResponseSink:
+    """
+    Collects the chunks of a single streamed response. Each request gets its
+    own sink, so concurrent streams never wait on each other; with `echo` the
+    finished response is written to stdout in one piece.
+
+    If the response starts with one of `sentinels`, `add` reports it as
+    finished and the text is cut to the sentinel, so the caller can stop
+    reading the stream.
+    """
+
+    def __init__(self, echo: bool = OLLAMA_ECHO, sentinels: Sequence[str] = ()):
+        self.echo = echo
+        self.parts: List[str] = []
+        self.metrics: Dict[str, int] = {}
+        self.sentinels = list(sentinels)
+        self.matched: str | None = None
+
+    def write(self, text: str):
+        self.parts.append(text)
+
+    def add(self, chunk: Mapping[str, Any]) -> bool:
+        self.write(chunk_text(chunk))
+        if chunk.get("done"):
+            # The final chunk carries token counts and timings
+            self.metrics = {
+                key: value
+                for key, value in chunk.items()
+                if key.endswith(("_count", "_duration"))
+            }
+        if self.sentinels:
+            self.check_sentinels()
+        return self.matched is not None
+
+    def check_sentinels(self):
+        text = self.getvalue().lstrip()
+        remaining = []
+        for sentinel in self.sentinels:
+            if text.startswith(sentinel):
+                self.matched = sentinel
+                self.parts = [sentinel]
+                self.sentinels = []
+                return
+            if sentinel.startswith(text):
+                remaining.append(sentinel)
+        # Stop checking once the text can no longer become a sentinel
+        self.sentinels = remaining
+
+    def getvalue(self) -> str:
+        return "".join(self.parts)
+
+    def close(self) -> str:
+        text = self.getvalue()
+        if self.echo:
+            # A single write keeps concurrent responses from interleaving
+            sys.stdout.write(f"{text}\n")
+            sys.stdout.flush()
+        return text
+
+
+class JsonItemSink(ResponseSink):
+    """
+    Parses a JSON response while it streams and calls `on_item` with each
+    element of its first array as soon as the element is complete.
+    """
+
+    def __init__(self, on_item=None, **kwargs):
+        super().__init__(**kwargs)
+        self.on_item = on_item
+        self.parser = JsonItemParser()
+
+    def write(self, text: str):
+        super().write(text)
+        for item in self.parser.feed(text):
+            if self.on_item:
+                self.on_item(item)
+
+    def items(self) -> List[Any]:
+        for item in self.parser.finish():
+            if self.on_item:
+                self.on_item(item)
+        return self.parser.items
+
+
+def chunk_text(chunk: Mapping[str, Any]) -> str:
+    if isinstance(chunk, Mapping) and "message" in chunk:
+        message = chunk["message"]
+        if isinstance(message, Mapping) and "content" in message:
+            return message["content"]
+        elif isinstance(message, str):
+            return message
+    elif isinstance(chunk, Mapping) and "response" in chunk:
+        return chunk["response"]
+    raise Exception("Invalid chunk structure")
 
 
 def handle_response(
-    response: Union[Dict[str, Any], Iterator[Mapping[str, Any]]], stream: bool = False
+    response: Union[Dict[str, Any], Iterator[Mapping[str, Any]]],
+    stream: bool = False,
+    sink: ResponseSink | None = None,
 ) -> str:
-    if isinstance(response, dict) and "response" in response:
-        return response["response"].strip()
+    sink = sink or ResponseSink()
+    if isinstance(response, dict) and ("response" in response or "message" in response):
+        sink.add(response)
+        sink.parts = [sink.getvalue().strip()]
+        return sink.close()
     elif stream:
-        ai_response = ""
         try:
-            with print_lock:  # Acquire the lock
-                for chunk in response:
-                    if isinstance(chunk, Mapping) and "message" in chunk:
-                        message = chunk["message"]
-                        if isinstance(message, Mapping) and "content" in message:
-                            print(message["content"], end="", flush=True)
-                            ai_response += message["content"]
-                        elif isinstance(message, str):
-                            print(message, end="", flush=True)
-                            ai_response += message
-                        else:
-                            raise Exception("Invalid chunk structure")
-                    elif isinstance(chunk, Mapping) and "response" in chunk:
-                        print(chunk["response"], end="", flush=True)
-                        ai_response += chunk["response"]
-                    else:
-                        raise Exception("Invalid chunk structure")
-            return ai_response
+            for chunk in response:
+                if sink.add(chunk):
+                    # Closing the generator drops the connection, which
+                    # makes Ollama stop generating
+                    response.close()
+                    logger.debug(f"Stopped stream at sentinel '{sink.matched}'")
+                    break
+            return sink.close()
         except Exception as e:
             raise Exception(f"No 'response' found in the API response: {e}")
     else:
         raise Exception(f"Unexpected response structure: {response}")
 
 
-def ollama_generate(model: str, prompt: str, stream: bool = False) -> str:
-    response = ollama.generate(model=model, prompt=prompt, stream=stream)
-    if isinstance(response, (dict, Iterator)):
-        return handle_response(response, stream=stream)
+async def handle_async_response(
+    response: Union[Dict[str, Any], AsyncIterator[Mapping[str, Any]]],
+    stream: bool = False,
+    sink: ResponseSink | None = None,
+) -> str:
+    sink = sink or ResponseSink()
+    if isinstance(response, dict) and ("response" in response or "message" in response):
+        sink.add(response)
+        sink.parts = [sink.getvalue().strip()]
+        return sink.close()
+    elif stream:
+        try:
+            async for chunk in response:
+                if sink.add(chunk):
+                    await response.aclose()
+                    logger.debug(f"Stopped stream at sentinel '{sink.matched}'")
+                    break
+            return sink.close()
+        except Exception as e:
+            raise Exception(f"No 'response' found in the API response: {e}")
     else:
-        raise TypeError("Invalid response type")
+        raise Exception(f"Unexpected response structure: {response}")
 
 
-def ollama_chat(model: str, messages: List[Message], stream: bool = False) -> str:
-    response = ollama.chat(model=model, messages=messages, stream=stream)
-    if isinstance(response, (dict, Iterator)):
-        return handle_response(response, stream=stream)
-    else:
-        raise TypeError("Invalid response type")
+def cacheable(response_text: str, validate) -> bool:
+    # Only responses the caller can use are stored, so a malformed answer is
+    # asked for again instead of replayed
+    if not response_text:
+        return False
+    try:
+        return validate is None or bool(validate(response_text))
+    except Exception:
+        return False
+
+
+def cached(
+    agent: str | None,
+    model: str,
+    request: Dict[str, Any],
+    call,
+    sink: ResponseSink,
+    validate=None,
+) -> str:
+    # Agents listed in LLM_CACHE_AGENTS reuse the response to an identical request
+    if agent not in LLM_CACHE_AGENTS:
+        return call()
+
+    cache = get_response_cache()
+    key = request_key(model, request)
+    response_text = cache.get(agent, key)
+    if response_text is not None:
+        logger.debug(f"Using cached {agent} response")
+        # The sink sees a cached response as one chunk
+        sink.write(response_text)
+        return response_text
+
+    response_text = call()
+    if cacheable(response_text, validate):
+        cache.put(agent, model, key, response_text)
+    return response_text
+
+
+def chat_prefix(model: str, messages: List[Message]):
+    # Everything before the final message is the part shared between requests
+    return [model, list(messages[:-1])]
+
+
+def prompt_chars(messages: List[Message]) -> int:
+    return sum(len(message.get("content") or "") for message in messages)
+
+
+def ollama_generate(
+    model: str,
+    prompt: str,
+    stream: bool = False,
+    agent: str | None = None,
+    sink: ResponseSink | None = None,
+    system: str = "",
+    format: str = "",
+    validate=None,
+) -> str:
+    # Static instructions go in `system`, ahead of the per-request prompt, so
+    # Ollama can reuse its evaluation of them from the previous request
+    options = agent_options(agent)
+    format = agent_format(agent, format)
+    response_sink = sink or new_sink(agent)
+
+    def call():
+        with scheduler.slot(agent):
+            response = client.generate(
+                model=model,
+                prompt=prompt,
+                system=system,
+                stream=stream,
+                format=format,
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+            )
+            if isinstance(response, (dict, Iterator)):
+                response_text = handle_response(
+                    response, stream=stream, sink=response_sink
+                )
+            else:
+                raise TypeError("Invalid response type")
+        prefix_stats.record(
+            agent, [model, system], len(system) + len(prompt), response_sink.metrics
+        )
+        return response_text
+
+    request = {"system": system, "prompt": prompt, "format": format, "options": options}
+    return cached(agent, model, request, call, response_sink, validate)
+
+
+def ollama_chat(
+    model: str,
+    messages: List[Message],
+    stream: bool = False,
+    agent: str | None = None,
+    sink: ResponseSink | None = None,
+    format: str = "",
+    validate=None,
+) -> str:
+    options = agent_options(agent)
+    format = agent_format(agent, format)
+    response_sink = sink or new_sink(agent)
+
+    def call():
+        with scheduler.slot(agent):
+            response = client.chat(
+                model=model,
+                messages=messages,
+                stream=stream,
+                format=format,
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+            )
+            if isinstance(response, (dict, Iterator)):
+                response_text = handle_response(
+                    response, stream=stream, sink=response_sink
+                )
+            else:
+                raise TypeError("Invalid response type")
+        prefix_stats.record(
+            agent,
+            chat_prefix(model, messages),
+            prompt_chars(messages),
+            response_sink.metrics,
+        )
+        return response_text
+
+    request = {"messages": messages, "format": format, "options": options}
+    return cached(agent, model, request, call, response_sink, validate)
+
+
+def warm_model(model: str):
+    # A request with no prompt just loads the model and keeps it resident
+    try:
+        client.generate(model=model, keep_alive=OLLAMA_KEEP_ALIVE)
+        logger.info(f"Loaded {model}, keeping it warm for {OLLAMA_KEEP_ALIVE}")
+    except Exception as e:
+        logger.warning(f"Could not preload {model}: {e}")
+
+
+async def cached_async(
+    agent: str | None,
+    model: str,
+    request: Dict[str, Any],
+    call,
+    sink: ResponseSink,
+    validate=None,
+) -> str:
+    if agent not in LLM_CACHE_AGENTS:
+        return await call()
+
+    # SQLite commits can block on fsync, so keep them off the event loop
+    cache = get_response_cache()
+    key = request_key(model, request)
+    response_text = await asyncio.to_thread(cache.get, agent, key)
+    if response_text is not None:
+        logger.debug(f"Using cached {agent} response")
+        sink.write(response_text)
+        return response_text
+
+    response_text = await call()
+    if cacheable(response_text, validate):
+        await asyncio.to_thread(cache.put, agent, model, key, response_text)
+    return response_text
+
+
+async def ollama_generate_async(
+    model: str,
+    prompt: str,
+    stream: bool = False,
+    agent: str | None = None,
+    sink: ResponseSink | None = None,
+    system: str = "",
+    format: str = "",
+    validate=None,
+) -> str:
+    options = agent_options(agent)
+    format = agent_format(agent, format)
+    response_sink = sink or new_sink(agent)
+
+    async def call():
+        async with scheduler.async_slot(agent):
+            response = await async_client.generate(
+                model=model,
+                prompt=prompt,
+                system=system,
+                stream=stream,
+                format=format,
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+            )
+            response_text = await handle_async_response(
+                response, stream=stream, sink=response_sink
+            )
+        prefix_stats.record(
+            agent, [model, system], len(system) + len(prompt), response_sink.metrics
+        )
+        return response_text
+
+    request = {"system": system, "prompt": prompt, "format": format, "options": options}
+    return await cached_async(agent, model, request, call, response_sink, validate)
+
+
+async def ollama_chat_async(
+    model: str,
+    messages: List[Message],
+    stream: bool = False,
+    agent: str | None = None,
+    sink: ResponseSink | None = None,
+    format: str = "",
+    validate=None,
+) -> str:
+    options = agent_options(agent)
+    format = agent_format(agent, format)
+    response_sink = sink or new_sink(agent)
+
+    async def call():
+        async with scheduler.async_slot(agent):
+            response = await async_client.chat(
+                model=model,
+                messages=messages,
+                stream=stream,
+                format=format,
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+            )
+            response_text = await handle_async_response(
+                response, stream=stream, sink=response_sink
+            )
+        prefix_stats.record(
+            agent,
+            chat_prefix(model, messages),
+            prompt_chars(messages),
+            response_sink.metrics,
+        )
+        return response_text
+
+    request = {"messages": messages, "format": format, "options": options}
+    return await cached_async(agent, model, request, call, response_sink, validate)
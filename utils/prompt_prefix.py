@@ -0,0 +1,72 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Mapping
+
+logger = logging.getLogger(__name__)
+
+# How long Ollama keeps a model, and its cached prompt prefix, loaded after a
+# request. Passed on every call so the model isn't unloaded between emails.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+
+def prefix_key(prefix: Any) -> str:
+    payload = json.dumps(prefix, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PrefixStats:
+    """
+    Estimates the prompt evaluation time saved when Ollama reuses the cached
+    evaluation of a static prompt prefix. For each prefix, the slowest prompt
+    evaluation seen per prompt character is taken as the cold cost; any
+    request evaluated faster than that counts the difference as saved.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cold_rate: Dict[str, float] = {}
+        self.requests = defaultdict(int)
+        self.evaluated_tokens = defaultdict(int)
+        self.eval_ns = defaultdict(int)
+        self.saved_ns = defaultdict(float)
+
+    def record(
+        self, agent: str | None, prefix: Any, prompt_chars: int, metrics: Mapping
+    ):
+        duration = metrics.get("prompt_eval_duration")
+        if not duration or not prompt_chars:
+            return
+        agent = agent or "default"
+        key = prefix_key(prefix)
+        rate = duration / prompt_chars
+        with self.lock:
+            cold_rate = max(self.cold_rate.get(key, 0.0), rate)
+            self.cold_rate[key] = cold_rate
+            saved = cold_rate * prompt_chars - duration
+            self.requests[agent] += 1
+            self.evaluated_tokens[agent] += metrics.get("prompt_eval_count") or 0
+            self.eval_ns[agent] += duration
+            self.saved_ns[agent] += saved
+        logger.debug(
+            f"{agent} prompt evaluated in {duration / 1e6:.0f}ms, "
+            f"about {saved / 1e6:.0f}ms saved by prefix reuse"
+        )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {
+                agent: {
+                    "requests": self.requests[agent],
+                    "evaluated_tokens": self.evaluated_tokens[agent],
+                    "prompt_eval_seconds": self.eval_ns[agent] / 1e9,
+                    "saved_seconds": self.saved_ns[agent] / 1e9,
+                }
+                for agent in self.requests
+            }
+
+
+prefix_stats = PrefixStats()
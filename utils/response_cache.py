@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", 168))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+# Agents whose responses may be served from the cache. execution_agent is left
+# out by default because its output is the work product for each task.
+LLM_CACHE_AGENTS = {
+    agent.strip()
+    for agent in os.getenv(
+        "LLM_CACHE_AGENTS", "objective,task_creation,entity_extraction,entity_dedup"
+    ).split(",")
+    if agent.strip()
+}
+
+
+def request_key(model: str, request: Dict[str, Any]) -> str:
+    payload = json.dumps({"model": model, **request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl_hours: float = LLM_CACHE_TTL_HOURS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.evictions = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Worker processes share the database; SQLite serializes their writes
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                agent TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self.db.commit()
+
+    def get(self, agent: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.db.commit()
+                self.misses[agent] += 1
+                return None
+            self.db.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.db.commit()
+            self.hits[agent] += 1
+            return row[0]
+
+    def put(self, agent: str, model: str, key: str, response: str):
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, agent, response, now, now),
+            )
+            if self.ttl:
+                self.db.execute(
+                    "DELETE FROM responses WHERE created < ?", (now - self.ttl,)
+                )
+            (count,) = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                # Drop the least recently used entries
+                self.db.execute(
+                    """DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY accessed LIMIT ?
+                    )""",
+                    (count - self.max_entries,),
+                )
+                self.evictions += count - self.max_entries
+            self.db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            (entries,) = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            agents = {}
+            for agent in set(self.hits) | set(self.misses):
+                lookups = self.hits[agent] + self.misses[agent]
+                agents[agent] = {
+                    "hits": self.hits[agent],
+                    "misses": self.misses[agent],
+                    "hit_rate": self.hits[agent] / lookups if lookups else 0.0,
+                }
+            return {"entries": entries, "evictions": self.evictions, "agents": agents}
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from queue import Empty
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EMAIL_QUEUE_PATH = os.getenv("EMAIL_QUEUE_PATH", ".cache/email_queue.sqlite3")
+# How long a consumer that stops heartbeating keeps an item before it is
+# handed to another consumer
+EMAIL_QUEUE_VISIBILITY_SECONDS = float(os.getenv("EMAIL_QUEUE_VISIBILITY_SECONDS", 300))
+# How often an empty queue is checked for items put by other processes
+EMAIL_QUEUE_POLL_SECONDS = float(os.getenv("EMAIL_QUEUE_POLL_SECONDS", 0.5))
+# Deliveries before an item is set aside as dead instead of retried
+EMAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv("EMAIL_QUEUE_MAX_ATTEMPTS", 5))
+# Seconds a dead item is kept before it is deleted
+EMAIL_QUEUE_DEAD_RETENTION = float(os.getenv("EMAIL_QUEUE_DEAD_RETENTION", 7 * 86400))
+# Delete expired dead items after this many puts
+PURGE_EVERY = 500
+
+
+class WorkQueue:
+    """
+    Durable queue of dicts in a SQLite database in WAL mode, shared by every
+    process on the host that opens the same path. get() leases the oldest
+    visible item; task_done(item) acknowledges and deletes it. Leases held by
+    a live process are extended in the background, so an item is only handed
+    out again once the process holding it has stopped for `visibility_timeout`
+    seconds, giving at-least-once delivery. Items are identified by `key`, and
+    putting an item whose key is already queued does nothing, unless the item
+    is dead: then it is queued again with its attempts reset. Dead items are
+    deleted after `dead_retention` seconds.
+    """
+
+    def __init__(
+        self,
+        path: str = EMAIL_QUEUE_PATH,
+        key: str = "Message-ID",
+        visibility_timeout: float = EMAIL_QUEUE_VISIBILITY_SECONDS,
+        poll_interval: float = EMAIL_QUEUE_POLL_SECONDS,
+        max_attempts: int = EMAIL_QUEUE_MAX_ATTEMPTS,
+        dead_retention: float = EMAIL_QUEUE_DEAD_RETENTION,
+    ):
+        self.key = key
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.dead_retention = dead_retention
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        # Lease token for every item this process holds, by key
+        self.leases: Dict[str, str] = {}
+        self.heartbeat = None
+
+        self.puts = 0
+        self.revived = 0
+        self.purged = 0
+        self.duplicates = 0
+        self.delivered = 0
+        self.redelivered = 0
+        self.acked = 0
+        self.lost_leases = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease TEXT,
+                visible_at REAL NOT NULL
+            )""")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS items_visible_at ON items (visible_at)"
+        )
+        self.db.commit()
+
+    def put(self, item: Dict[str, Any]) -> bool:
+        key = item[self.key]
+        now = time.time()
+        with self.lock:
+            dead = self.db.execute(
+                "SELECT 1 FROM items WHERE key = ? AND visible_at <= ? AND attempts >= ?",
+                (key, now, self.max_attempts),
+            ).fetchone()
+            cursor = self.db.execute(
+                """INSERT INTO items (key, payload, visible_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    payload = excluded.payload,
+                    attempts = 0,
+                    lease = NULL,
+                    visible_at = excluded.visible_at
+                WHERE items.visible_at <= ? AND items.attempts >= ?""",
+                (key, json.dumps(item), now, now, self.max_attempts),
+            )
+            added = cursor.rowcount > 0
+            self.puts += added
+            self.duplicates += not added
+            if added and dead:
+                self.revived += 1
+                logger.info(f"Queueing dead item {key} again")
+            if self.puts % PURGE_EVERY == 0:
+                self._purge_dead(now)
+            self.db.commit()
+        if added:
+            with self.condition:
+                self.condition.notify()
+        return added
+
+    def get(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            item = self._claim()
+            if item is not None:
+                return item
+            wait = self.poll_interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Empty
+                wait = min(wait, remaining)
+            with self.condition:
+                self.condition.wait(wait)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        lease = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                """UPDATE items SET lease = ?, visible_at = ?, attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM items WHERE visible_at <= ? AND attempts < ?
+                    ORDER BY id LIMIT 1
+                )
+                RETURNING key, payload, attempts""",
+                (lease, now + self.visibility_timeout, now, self.max_attempts),
+            ).fetchone()
+            self.db.commit()
+            if row is None:
+                return None
+            key, payload, attempts = row
+            self.leases[key] = lease
+            self.delivered += 1
+            if attempts > 1:
+                self.redelivered += 1
+                logger.warning(f"Redelivering {key}, attempt {attempts}")
+            if self.heartbeat is None:
+                self.heartbeat = threading.Thread(
+                    target=self._heartbeat, daemon=True, name="WorkQueueHeartbeat"
+                )
+                self.heartbeat.start()
+        return json.loads(payload)
+
+    def _purge_dead(self, now: float):
+        cursor = self.db.execute(
+            "DELETE FROM items WHERE visible_at <= ? AND attempts >= ?",
+            (now - self.dead_retention, self.max_attempts),
+        )
+        self.purged += cursor.rowcount
+
+    def task_done(self, item: Dict[str, Any]):
+        key = item[self.key]
+        with self.lock:
+            lease = self.leases.pop(key, None)
+            cursor = self.db.execute(
+                "DELETE FROM items WHERE key = ? AND lease = ?", (key, lease)
+            )
+            self.db.commit()
+            if cursor.rowcount:
+                self.acked += 1
+            else:
+                self.lost_leases += 1
+                logger.warning(
+                    f"Lease on {key} expired before it was acknowledged,"
+                    " it may be processed again"
+                )
+        with self.condition:
+            self.condition.notify_all()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.visibility_timeout / 3)
+            with self.lock:
+                visible_at = time.time() + self.visibility_timeout
+                for key, lease in list(self.leases.items()):
+                    cursor = self.db.execute(
+                        "UPDATE items SET visible_at = ? WHERE key = ? AND lease = ?",
+                        (visible_at, key, lease),
+                    )
+                    if not cursor.rowcount:
+                        del self.leases[key]
+                        self.lost_leases += 1
+                        logger.warning(f"Lost the lease on {key}")
+                self.db.commit()
+
+    def counts(self) -> Dict[str, int]:
+        now = time.time()
+        with self.lock:
+            ready, leased, dead = self.db.execute(
+                """SELECT
+                    COUNT(*) FILTER (WHERE visible_at <= ? AND attempts < ?),
+                    COUNT(*) FILTER (WHERE visible_at > ?),
+                    COUNT(*) FILTER (WHERE visible_at <= ? AND attempts >= ?)
+                FROM items""",
+                (now, self.max_attempts, now, now, self.max_attempts),
+            ).fetchone()
+        return {"ready": ready, "leased": leased, "dead": dead}
+
+    def qsize(self) -> int:
+        return self.counts()["ready"]
+
+    def join(self):
+        # Wait until every item has been acknowledged or set aside as dead
+        while True:
+            counts = self.counts()
+            if not counts["ready"] and not counts["leased"]:
+                return
+            with self.condition:
+                self.condition.wait(self.poll_interval)
+
+    def stats(self) -> Dict[str, int]:
+        counts = self.counts()
+        with self.lock:
+            return {
+                **counts,
+                "held": len(self.leases),
+                "puts": self.puts,
+                "revived": self.revived,
+                "purged": self.purged,
+                "duplicates": self.duplicates,
+                "delivered": self.delivered,
+                "redelivered": self.redelivered,
+                "acked": self.acked,
+                "lost_leases": self.lost_leases,
+            }